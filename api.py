@@ -0,0 +1,321 @@
+"""Headless HTTP API for the scheduler (FastAPI).
+
+    python api.py --workers 4 --port 8000        # or: uvicorn api:app --workers 4
+
+Endpoints:
+
+- ``GET  /slots``            earliest free slots (paged, same filters as the app)
+- ``POST /bookings``         book a slot for a patient (409 if it was just taken)
+- ``GET  /patients/lookup``  find a patient by name + DOB
+- ``GET  /appointments``     list appointments (doctor, date and status filters, paged)
+- ``POST /appointments/{id}/cancel``      cancel; the freed time is offered to the waitlist
+- ``POST /appointments/{id}/reschedule``  move to another slot (409 if it is taken)
+- ``POST /waitlist``         wait for a slot to free up within a time window
+- ``POST /reminders/run``    send the reminders that are due
+- ``GET  /calendars/doctors/{doctor_id}.ics``  subscribable feed of a doctor's appointments (ETag, 304)
+- ``GET  /calendars/clinics/{clinic}.ics``     the same for a clinic (``clinic`` as in ``calendar_utils.slug``)
+- ``GET  /health``
+
+Handlers are async; the storage work runs in the thread pool so slow
+file I/O never blocks the event loop. Worker processes share the data the
+same way several app sessions do: every write takes the schedule's file
+lock and a storage transaction (see `booking.book_appointment`), and
+readers notice other processes' writes through file stamps / table
+versions, so any number of workers can serve one store.
+"""
+import argparse
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List, Optional
+
+import pandas as pd
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+import data_loader
+from booking import SLOT_TAKEN, book_appointment, cancel_appointment, notify_booking, reschedule_appointment
+from calendar_utils import clinic_feed, doctor_feed, slug
+from data_loader import load_appointments, lookup_patient
+from messaging import TEMPLATES, run_due_reminders
+from scheduling import duration_for_patient_type, recommend_slots
+from slot_store import open_store
+from waitlist import ANY, join_waitlist
+
+@asynccontextmanager
+async def lifespan(app):
+    TEMPLATES.load_all()   # parse the email templates once per worker, not on the first booking
+    yield
+
+
+app = FastAPI(title="AI Scheduling Agent API", lifespan=lifespan)
+
+MAX_PAGE = 500
+
+
+class BookingRequest(BaseModel):
+    first_name: str = Field(min_length=1)
+    last_name: str = Field(min_length=1)
+    dob: date
+    email: Optional[str] = None
+    doctor_id: str
+    slot_start: datetime
+    clinic_location: str = "Main Clinic - Bengaluru"
+    insurance_carrier: str = ""
+    member_id: str = ""
+    group_number: str = ""
+    notify: bool = True
+
+
+class RescheduleRequest(BaseModel):
+    slot_start: datetime
+    doctor_id: Optional[str] = None
+
+
+class WaitlistRequest(BaseModel):
+    first_name: str = Field(min_length=1)
+    last_name: str = Field(min_length=1)
+    dob: date
+    email: Optional[str] = None
+    doctor_id: str = ANY
+    window_start: datetime
+    window_end: datetime
+    clinic_location: str = "Main Clinic - Bengaluru"
+
+
+def _slot(row) -> dict:
+    return {
+        "doctor_id": row["doctor_id"],
+        "doctor_name": row["doctor_name"],
+        "slot_start": row["slot_start"].isoformat(),
+        "slot_end": row["slot_end"].isoformat(),
+    }
+
+
+def _records(df: pd.DataFrame) -> list:
+    """Frame rows as JSON-safe dicts (NaN -> None)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "storage": data_loader.STORAGE_BACKEND}
+
+
+@app.get("/slots")
+async def slots(
+    doctor: str = "Any",
+    patient_type: str = Query("returning", pattern="^(new|returning)$"),
+    limit: int = Query(10, ge=1, le=MAX_PAGE),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    time_from: Optional[str] = Query(None, pattern=r"^\d{2}:\d{2}$"),
+    time_to: Optional[str] = Query(None, pattern=r"^\d{2}:\d{2}$"),
+    weekdays: Optional[List[int]] = Query(None),
+    location: Optional[str] = None,
+    include_past: bool = False,
+):
+    """The earliest free slots long enough for the patient type, `limit` per page."""
+    duration = duration_for_patient_type(patient_type)
+
+    def find():
+        return recommend_slots(
+            open_store(data_loader.SCHEDULE_CSV), doctor, duration, k=limit, cursor=cursor,
+            date_from=date_from, date_to=date_to, time_from=time_from, time_to=time_to, weekdays=weekdays,
+            location=location, not_before=None if include_past else datetime.now(),
+        )
+
+    page, next_cursor = await run_in_threadpool(find)
+    return {"duration": duration, "slots": [_slot(row) for row in page.to_dict("records")],
+            "next_cursor": next_cursor}
+
+
+@app.post("/bookings", status_code=201)
+async def create_booking(request: BookingRequest):
+    """Book `slot_start` with `doctor_id`; new patients get a 60-minute visit and a patient record."""
+    return await run_in_threadpool(_book, request)
+
+
+def _book(request: BookingRequest) -> dict:
+    dob = request.dob.isoformat()
+    found = lookup_patient(request.first_name, request.last_name, dob)
+    patient_type = "returning" if found is not None else "new"
+    duration = duration_for_patient_type(patient_type)
+    store = open_store(data_loader.SCHEDULE_CSV)
+    if request.doctor_id not in store.doctor_names:
+        raise HTTPException(404, f"Unknown doctor {request.doctor_id!r}")
+    email = request.email or (found or {}).get("email") or "new.patient@example.com"
+
+    new_patient = None
+    if found is None:
+        new_patient = {"patient_id": "P" + uuid.uuid4().hex[:8].upper(), "first_name": request.first_name,
+                       "last_name": request.last_name, "dob": dob, "email": email}
+    slot_start = pd.Timestamp(request.slot_start).tz_localize(None)
+    slot = {"doctor_id": request.doctor_id, "doctor_name": store.doctor_names[request.doctor_id],
+            "slot_start": slot_start, "slot_end": slot_start + pd.Timedelta(minutes=duration)}
+    appointment = {
+        "appointment_id": uuid.uuid4().hex[:12],
+        "patient_id": (found or new_patient)["patient_id"],
+        "patient_name": f"{request.first_name} {request.last_name}",
+        "dob": dob,
+        "patient_type": patient_type,
+        **slot,
+        "clinic_location": request.clinic_location,
+        "insurance_carrier": request.insurance_carrier,
+        "member_id": request.member_id,
+        "group_number": request.group_number,
+        "intake_form_sent": request.notify,
+        "confirmation_sent": request.notify,
+        "status": "Booked",
+    }
+    result = book_appointment(slot, duration, appointment, request.first_name, email=email,
+                              new_patient=new_patient, schedule_path=data_loader.SCHEDULE_CSV)
+    if result["status"] == SLOT_TAKEN:
+        raise HTTPException(409, result["message"])
+    if request.notify:
+        notify_booking(appointment, request.first_name, email, duration)
+    return {**appointment, "slot_start": slot_start.isoformat(), "slot_end": slot["slot_end"].isoformat()}
+
+
+@app.get("/patients/lookup")
+async def patient_lookup(first_name: str, last_name: str, dob: date, fuzzy: bool = False):
+    found = await run_in_threadpool(lookup_patient, first_name, last_name, dob.isoformat(), fuzzy)
+    if found is None:
+        raise HTTPException(404, "No matching patient")
+    return {k: (None if pd.isna(v) else v) for k, v in found.items()}
+
+
+@app.get("/appointments")
+async def appointments(
+    doctor_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    offset: int = Query(0, ge=0),
+):
+    """Appointments ordered by slot start, filtered and paged."""
+    def query():
+        df = load_appointments()
+        if doctor_id is not None:
+            df = df[df["doctor_id"] == doctor_id]
+        if status is not None:
+            df = df[df["status"] == status]
+        start = df["slot_start"].astype(str)
+        if date_from is not None:
+            df = df[start >= date_from.isoformat()]
+            start = start[df.index]
+        if date_to is not None:
+            df = df[start < (date_to + pd.Timedelta(days=1)).isoformat()]
+        df = df.iloc[df["slot_start"].astype(str).argsort(kind="stable")]
+        return len(df), _records(df.iloc[offset:offset + limit])
+
+    total, rows = await run_in_threadpool(query)
+    return {"total": total, "appointments": rows}
+
+
+def _offers(offers: list) -> list:
+    return [{"waitlist_id": o["waitlist_id"], "appointment_id": o["appointment"]["appointment_id"]} for o in offers]
+
+
+@app.post("/appointments/{appointment_id}/cancel")
+async def cancel(appointment_id: str):
+    result = await run_in_threadpool(cancel_appointment, appointment_id, data_loader.SCHEDULE_CSV)
+    if not result["cancelled"]:
+        raise HTTPException(404, f"No active appointment {appointment_id!r}")
+    return {"cancelled": appointment_id, "offers": _offers(result["offers"])}
+
+
+@app.post("/appointments/{appointment_id}/reschedule")
+async def reschedule(appointment_id: str, request: RescheduleRequest):
+    slot_start = pd.Timestamp(request.slot_start).tz_localize(None)
+    try:
+        result = await run_in_threadpool(reschedule_appointment, appointment_id, slot_start, request.doctor_id,
+                                         data_loader.SCHEDULE_CSV)
+    except KeyError as e:
+        raise HTTPException(404, str(e.args[0]))
+    if result["status"] == SLOT_TAKEN:
+        raise HTTPException(409, result["message"])
+    appointment = result["appointment"]
+    return {"appointment_id": appointment_id, "doctor_id": appointment["doctor_id"],
+            "slot_start": appointment["slot_start"].isoformat(), "slot_end": appointment["slot_end"].isoformat(),
+            "offers": _offers(result["offers"])}
+
+
+@app.post("/waitlist", status_code=201)
+async def waitlist(request: WaitlistRequest):
+    """Join the waitlist; returning patients wait for a 30-minute visit, new ones for 60 minutes."""
+    def join():
+        dob = request.dob.isoformat()
+        found = lookup_patient(request.first_name, request.last_name, dob)
+        patient_type = "returning" if found is not None else "new"
+        return join_waitlist(
+            request.first_name, request.last_name, dob, duration_for_patient_type(patient_type),
+            request.window_start.replace(tzinfo=None), request.window_end.replace(tzinfo=None),
+            doctor_id=request.doctor_id, patient_id=(found or {}).get("patient_id"),
+            email=request.email or (found or {}).get("email"), patient_type=patient_type,
+            clinic_location=request.clinic_location,
+        )
+
+    try:
+        return await run_in_threadpool(join)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+
+
+def _calendar(feed, rows: pd.DataFrame, if_none_match: Optional[str]) -> Response:
+    feed.refresh(rows)
+    etag = f'"{feed.etag}"'
+    if if_none_match is not None and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(feed.read(), media_type="text/calendar; charset=utf-8", headers={"ETag": etag})
+
+
+@app.get("/calendars/doctors/{doctor_id}.ics")
+async def doctor_calendar(doctor_id: str, if_none_match: Optional[str] = Header(None)):
+    """A doctor's appointments as an iCalendar feed; re-rendered only where it changed."""
+    def build():
+        df = load_appointments()
+        rows = df[df["doctor_id"].astype(str) == doctor_id]
+        if rows.empty and doctor_id not in open_store(data_loader.SCHEDULE_CSV).doctor_names:
+            raise HTTPException(404, f"Unknown doctor {doctor_id!r}")
+        return _calendar(doctor_feed(doctor_id), rows, if_none_match)
+
+    return await run_in_threadpool(build)
+
+
+@app.get("/calendars/clinics/{clinic}.ics")
+async def clinic_calendar(clinic: str, if_none_match: Optional[str] = Header(None)):
+    """A clinic's appointments as an iCalendar feed, for the front desk."""
+    def build():
+        df = load_appointments()
+        locations = df["clinic_location"].astype(object).fillna("").astype(str)
+        rows = df[locations.map(slug) == slug(clinic)]
+        if rows.empty:
+            raise HTTPException(404, f"No appointments at clinic {clinic!r}")
+        return _calendar(clinic_feed(str(rows["clinic_location"].iloc[0])), rows, if_none_match)
+
+    return await run_in_threadpool(build)
+
+
+@app.post("/reminders/run")
+async def reminders_run():
+    sent = await run_in_threadpool(run_due_reminders)
+    return {"sent": sent}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the scheduler HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the data store")
+    args = parser.parse_args()
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
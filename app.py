@@ -1,22 +1,38 @@
 import os
 import uuid
-import pandas as pd
 import streamlit as st
 from datetime import datetime, date, timedelta
-from scheduling import get_available_slots, book_slot, duration_for_patient_type
-from data_loader import load_patients, find_patient_by_name_dob, load_schedule, save_appointments, load_appointments
-from messaging import simulate_email, schedule_reminders_for_appointment, run_due_reminders
-from calendar_utils import create_ics_for_appointment
+from scheduling import duration_for_patient_type, recommend_slots
+from slot_store import open_store
+from booking import book_appointment, cancel_appointment, notify_booking, SLOT_TAKEN
+from data_loader import SCHEDULE_CSV, lookup_patient, read_cache_stats
+from messaging import TEMPLATES, run_due_reminders
+from schedule_generator import extend_schedule
+from waitlist import join_waitlist
+import calendar_utils
+import inbox
+import metrics
+import report_export
 
 st.set_page_config(page_title="AI Scheduling Agent", page_icon="🩺", layout="wide")
 
+
+@st.cache_resource
+def load_templates():
+    """Parse every email template once per server process (not on each rerun or first send)."""
+    TEMPLATES.load_all()
+
+
+load_templates()
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 FORMS_DIR = os.path.join(os.path.dirname(__file__), "forms")
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
 EXPORTS_DIR = os.path.join(os.path.dirname(__file__), "exports")
 
-SCHEDULE_PATH = os.path.join(DATA_DIR, "doctor_schedule.csv")
-PATIENTS_PATH = os.path.join(DATA_DIR, "patients.csv")
+SCHEDULE_PATH = SCHEDULE_CSV
+SLOTS_PER_PAGE = 10
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 
 st.title("🩺 AI Scheduling Agent - Clinic Booking")
 
@@ -24,17 +40,50 @@ st.title("🩺 AI Scheduling Agent - Clinic Booking")
 with st.sidebar:
     st.header("Admin")
 
-    # Export admin report
-    if st.button("Export Admin Report (Excel)"):
-        appts = load_appointments()
-        export_path = os.path.join(EXPORTS_DIR, f"admin_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-        try:
-            appts.to_excel(export_path, index=False)
-            st.success(f"Exported to {export_path}")
-        except Exception as e:
-            csv_path = export_path.replace(".xlsx", ".csv")
-            appts.to_csv(csv_path, index=False)
-            st.warning(f"openpyxl/xlsxwriter not found. Exported CSV instead: {csv_path}")
+    # Export admin report (streamed to a file by a background worker)
+    with st.expander("Export Admin Report"):
+        export_format = st.radio("Format", report_export.FORMATS, horizontal=True)
+        export_dates = st.date_input("Appointment dates", value=(), format="YYYY-MM-DD", key="export_dates")
+        schedule_store = open_store(SCHEDULE_PATH)
+        export_doctors = st.multiselect("Doctors", schedule_store.doctor_ids(),
+                                        format_func=lambda d: schedule_store.doctor_names[d])
+        export_statuses = st.multiselect("Status", ["Booked", "Confirmed", "Offered", "Cancelled"])
+        if st.button("Start Export"):
+            job = report_export.start_export(
+                export_format, EXPORTS_DIR,
+                date_from=export_dates[0] if export_dates else None,
+                date_to=export_dates[-1] if export_dates else None,
+                doctor_ids=export_doctors, statuses=export_statuses,
+            )
+            st.session_state["export_job"] = job.job_id
+
+    job = report_export.get_export(st.session_state.get("export_job", ""))
+    if job is not None:
+        if job.state == report_export.DONE:
+            st.success(f"Exported {job.rows} appointments to {job.path}")
+        elif job.state == report_export.FAILED:
+            st.error(f"Export failed: {job.error}")
+        else:
+            st.progress(job.progress, text=f"Exporting… {job.rows} rows written")
+            st.button("Refresh export progress")
+
+    # Cancel an appointment; its slot is offered to the waitlist
+    st.divider()
+    cancel_id = st.text_input("Appointment ID to cancel")
+    if st.button("Cancel Appointment", disabled=not cancel_id):
+        result = cancel_appointment(cancel_id.strip(), schedule_path=SCHEDULE_PATH)
+        if result["cancelled"]:
+            st.success(f"Cancelled {cancel_id}. Offered the freed time to {len(result['offers'])} waitlisted patient(s).")
+        else:
+            st.warning(f"No active appointment {cancel_id}.")
+
+    # Per-doctor and per-clinic calendar feeds (only changed days are re-rendered)
+    st.divider()
+    if st.button("Update Calendar Feeds"):
+        written = calendar_utils.refresh_feeds()
+        pruned = calendar_utils.prune_appointment_ics()
+        st.success(f"Updated {sum(written.values())} of {len(written)} feeds in "
+                   f"{calendar_utils.feeds_dir()}; removed {pruned} old booking .ics files.")
 
     # Run due reminders
     st.divider()
@@ -42,36 +91,42 @@ with st.sidebar:
         n = run_due_reminders()
         st.info(f"Sent {n} due reminders. Check 'outbox/' and 'data/reminders.csv'.")
 
-    # Regenerate doctor schedule
+    # Apply patients' replies (YES/NO, CONFIRM/CANCEL) waiting in the inbox
+    if st.button("Process Patient Replies"):
+        summary = inbox.ingest_replies(schedule_path=SCHEDULE_PATH)
+        st.info(f"Read {summary['messages']} replies: {summary['confirmed']} confirmed, "
+                f"{summary['cancelled']} cancelled, {summary['duplicates']} duplicates, "
+                f"{summary['unparsed']} need a human (see '{inbox.UNPARSED_DIR}/').")
+
+    # Extend doctor schedule (keeps bookings, drops past days)
     st.divider()
-    if st.button("Regenerate Doctor Schedule"):
-        doctors = [
-            ("D1", "Dr. Maya Rao"),
-            ("D2", "Dr. Arvind Nair"),
-            ("D3", "Dr. Leena Kapoor"),
-        ]
-        start_date = datetime.today().replace(hour=9, minute=0, second=0, microsecond=0)
-        days = 7  # generate for next 7 days
-        slot_length = 30
-
-        rows = []
-        for d_id, d_name in doctors:
-            for day in range(days):
-                day_start = start_date + timedelta(days=day)
-                for i in range(16):  # 9:00 to 17:00
-                    slot_start = day_start + timedelta(minutes=i * slot_length)
-                    slot_end = slot_start + timedelta(minutes=slot_length)
-                    rows.append({
-                        "doctor_id": d_id,
-                        "doctor_name": d_name,
-                        "slot_start": slot_start.strftime("%Y-%m-%d %H:%M"),
-                        "slot_end": slot_end.strftime("%Y-%m-%d %H:%M"),
-                        "available": True
-                    })
-
-        df = pd.DataFrame(rows)
-        df.to_csv(SCHEDULE_PATH, index=False)
-        st.success(f"✅ Regenerated schedule with {len(df)} slots for next {days} days.")
+    if st.button("Extend Doctor Schedule (next 7 days)"):
+        result = extend_schedule(SCHEDULE_PATH, days=7)
+        st.success(f"✅ Added {result['added']} slots, removed {result['removed']} past slots; "
+                   f"{result['slots']} slots in the schedule. Existing bookings were kept.")
+
+    st.divider()
+    stats = read_cache_stats()
+    st.caption(f"Read cache: {stats['hits']} hits / {stats['misses']} misses, "
+               f"{stats['entries']} entries ({stats['bytes'] / 2**20:.1f} MB)")
+
+    # Per-stage latency of the booking pipeline (off unless enabled)
+    st.divider()
+    recording = st.checkbox("Record stage timings", value=metrics.enabled())
+    metrics.enable(recording)
+    if recording:
+        timings = metrics.summary()
+        if timings:
+            st.dataframe(
+                [{"Stage": t["stage"], "Calls": t["count"], "p50 ms": round(t["p50_ms"], 2),
+                  "p95 ms": round(t["p95_ms"], 2), "p99 ms": round(t["p99_ms"], 2),
+                  "Rows": t["rows"], "KB written": round(t["bytes"] / 1024, 1)} for t in timings],
+                hide_index=True,
+            )
+        else:
+            st.caption("No timings yet. Book an appointment to see where the time goes.")
+        if st.button("Write Prometheus Metrics"):
+            st.success(f"Wrote {metrics.write_prometheus()}")
 
 st.subheader("Patient Greeting")
 with st.form("greeting_form"):
@@ -89,8 +144,9 @@ with st.form("greeting_form"):
     submitted = st.form_submit_button("Continue")
 
 if submitted:
-    patients = load_patients()
-    found = find_patient_by_name_dob(patients, first, last, dob.strftime("%Y-%m-%d"))
+    # Only an exact match is taken as the patient's record; a similar name is
+    # offered for confirmation instead, so a typo cannot book into someone else's record.
+    found = lookup_patient(first, last, dob.strftime("%Y-%m-%d"))
     if found is not None:
         patient_type = "returning"
         st.success(f"Welcome back, {first}! We've found your record. (Returning patient)")
@@ -98,7 +154,6 @@ if submitted:
         email = found["email"]
     else:
         patient_type = "new"
-        st.info("You're a new patient. We'll create a record after booking.")
         patient_id = None
         email = None
 
@@ -112,18 +167,59 @@ if submitted:
         "patient_id": patient_id,
         "email": email
     }
+    st.session_state["suggested_patient"] = (
+        None if found is not None else lookup_patient(first, last, dob.strftime("%Y-%m-%d"), fuzzy=True))
 
-if "greeting" in st.session_state:
+suggested = st.session_state.get("suggested_patient")
+if suggested is not None:
+    st.warning(f"Did you mean **{suggested['first_name']} {suggested['last_name']}** "
+               f"(born {st.session_state['greeting']['dob']})?")
+    yes, no = st.columns(2)
+    if yes.button("Yes, that's me"):
+        st.session_state["greeting"].update(
+            first_name=suggested["first_name"], last_name=suggested["last_name"], patient_type="returning",
+            patient_id=suggested["patient_id"], email=suggested["email"])
+        st.session_state["suggested_patient"] = None
+        st.rerun()
+    if no.button("No, I'm a new patient"):
+        st.session_state["suggested_patient"] = None
+        st.rerun()
+elif submitted and st.session_state["greeting"]["patient_type"] == "new":
+    st.info("You're a new patient. We'll create a record after booking.")
+
+if "greeting" in st.session_state and suggested is None:
     g = st.session_state["greeting"]
     st.subheader("Smart Scheduling")
     duration = duration_for_patient_type(g["patient_type"])
     st.write(f"Recommended duration: **{duration} minutes** for a **{g['patient_type']}** patient.")
 
-    schedule = load_schedule()
-    slots = get_available_slots(schedule, g["preferred_doctor"], duration)
+    with st.expander("Filter slots"):
+        dates = st.date_input("Dates", value=(), min_value=date.today(), format="YYYY-MM-DD")
+        hours = st.slider("Time of day (hours)", 0, 24, (0, 24))
+        days = st.multiselect("Weekdays", WEEKDAYS, default=WEEKDAYS)
+    filters = {
+        "date_from": dates[0] if dates else None,
+        "date_to": dates[-1] if dates else None,
+        "time_from": f"{hours[0]:02d}:00",
+        "time_to": f"{hours[1]:02d}:00",
+        "weekdays": [WEEKDAYS.index(d) for d in days],
+        "location": g["clinic_location"],
+    }
+
+    # Earliest slots first, one page at a time; the cursors of the pages seen
+    # so far are kept so the user can go back.
+    query = (g["preferred_doctor"], duration, repr(filters))
+    if st.session_state.get("slot_query") != query:
+        st.session_state["slot_query"] = query
+        st.session_state["slot_pages"] = [None]
+    pages = st.session_state["slot_pages"]
+    slots, next_cursor = recommend_slots(
+        open_store(SCHEDULE_PATH), g["preferred_doctor"], duration, k=SLOTS_PER_PAGE, cursor=pages[-1],
+        not_before=datetime.now(), **filters,
+    )
 
     if not slots.empty:
-        st.write("Available slots:")
+        st.write(f"Earliest available slots (page {len(pages)}):")
 
         # Reset index so we can display "Column"
         display_slots = slots.reset_index(drop=True).copy()
@@ -140,6 +236,9 @@ if "greeting" in st.session_state:
         })[["Doctor ID", "Doctor Name", "Slot Start", "Slot End", "Availability"]]
 
         st.dataframe(display_slots)
+        earlier, later = st.columns(2)
+        earlier.button("◀ Earlier", disabled=len(pages) == 1, on_click=pages.pop)
+        later.button("Later ▶", disabled=next_cursor is None, on_click=pages.append, args=(next_cursor,))
 
         with st.form("slot_select"):
             slot_idx = st.number_input(
@@ -158,19 +257,30 @@ if "greeting" in st.session_state:
             chosen = slots.iloc[int(slot_idx) - 1]
             appointment_id = str(uuid.uuid4())[:8]
 
-            # Book slot & write appointment (updates doctor_schedule.csv)
-            booked = book_slot(chosen, duration, schedule_path=SCHEDULE_PATH)
+            # Reminders and confirmations go to the address on the patient record
+            email = g.get("email") or "new.patient@example.com"
+
+            # New patients get a record as part of the booking
+            new_patient = None
+            if g["patient_type"] == "new":
+                new_patient = {
+                    "patient_id": "P" + str(uuid.uuid4())[:4].upper(),
+                    "first_name": g["first_name"],
+                    "last_name": g["last_name"],
+                    "dob": g["dob"],
+                    "email": email
+                }
 
             appt_record = {
                 "appointment_id": appointment_id,
-                "patient_id": g["patient_id"] or "",
+                "patient_id": g["patient_id"] or (new_patient or {}).get("patient_id", ""),
                 "patient_name": f"{g['first_name']} {g['last_name']}",
                 "dob": g["dob"],
                 "patient_type": g["patient_type"],
-                "doctor_id": booked["doctor_id"],
-                "doctor_name": booked["doctor_name"],
-                "slot_start": booked["slot_start"],
-                "slot_end": booked["slot_end"],
+                "doctor_id": chosen["doctor_id"],
+                "doctor_name": chosen["doctor_name"],
+                "slot_start": chosen["slot_start"],
+                "slot_end": chosen["slot_end"],
                 "clinic_location": g["clinic_location"],
                 "insurance_carrier": insurance_carrier,
                 "member_id": member_id,
@@ -179,61 +289,19 @@ if "greeting" in st.session_state:
                 "confirmation_sent": False,
                 "status": "Booked"
             }
-            save_appointments([appt_record])
 
-            # Save new patient if not in patients.csv
-            if g["patient_type"] == "new":
-                new_id = "P" + str(uuid.uuid4())[:4].upper()
-                new_row = pd.DataFrame([{
-                    "patient_id": new_id,
-                    "first_name": g["first_name"],
-                    "last_name": g["last_name"],
-                    "dob": g["dob"],
-                    "email": g.get("email") or "new.patient@example.com"
-                }])
-                if os.path.exists(PATIENTS_PATH):
-                    old = pd.read_csv(PATIENTS_PATH)
-                    out = pd.concat([old, new_row], ignore_index=True)
-                else:
-                    out = new_row
-                out.to_csv(PATIENTS_PATH, index=False)
-
-            # Send confirmation & intake (simulated email)
-            slot_dt = datetime.strptime(str(booked["slot_start"]), "%Y-%m-%d %H:%M:%S")
-            slot_date = slot_dt.strftime("%b %d, %Y")
-            slot_time = slot_dt.strftime("%I:%M %p")
-            simulate_email(
-                to_email=g.get("email") or "new.patient@example.com",
-                template="email_confirm.txt",
-                context={
-                    "first_name": g["first_name"],
-                    "doctor_name": booked["doctor_name"],
-                    "slot_date": slot_date,
-                    "slot_time": slot_time,
-                    "clinic_location": g["clinic_location"],
-                },
-                attach_form=True
-            )
-            simulate_email(
-                to_email=g.get("email") or "new.patient@example.com",
-                template="email_intake_form.txt",
-                context={
-                    "first_name": g["first_name"],
-                    "doctor_name": booked["doctor_name"],
-                    "slot_date": slot_date,
-                    "slot_time": slot_time,
-                },
-                attach_form=True
-            )
-
-            # Create ICS calendar file
-            ics_path = create_ics_for_appointment(
-                appointment_id, booked["doctor_name"], slot_dt, duration, g["clinic_location"]
+            # Book slot, appointment, patient and reminders as one locked unit
+            result = book_appointment(
+                chosen, duration, appt_record, g["first_name"], email=email,
+                new_patient=new_patient, schedule_path=SCHEDULE_PATH
             )
+            if result["status"] == SLOT_TAKEN:
+                st.error(f"{result['message']} Please pick another slot.")
+                st.stop()
 
-            # Schedule reminders
-            schedule_reminders_for_appointment(
-                appointment_id, g["first_name"], booked["doctor_name"], slot_dt, g.get("email")
+            # Send confirmation & intake (simulated email) and create the ICS calendar file
+            ics_path = notify_booking(
+                appt_record, g["first_name"], email, duration
             )
 
             st.success(f"Appointment confirmed! (ID: {appointment_id})")
@@ -242,3 +310,18 @@ if "greeting" in st.session_state:
             st.balloons()
     else:
         st.warning("⚠️ No available slots for the selected doctor/duration. Please try another doctor or location.")
+        window_from = filters["date_from"] or date.today()
+        window_to = filters["date_to"] or window_from + timedelta(days=14)
+        st.write(f"Or join the waitlist: we'll hold the first slot that frees up between "
+                 f"{window_from:%b %d} and {window_to:%b %d} and email you.")
+        if st.button("Join Waitlist"):
+            doctor_ids = open_store(SCHEDULE_PATH).doctor_ids(g["preferred_doctor"])
+            entry = join_waitlist(
+                g["first_name"], g["last_name"], g["dob"], duration,
+                datetime.combine(window_from, datetime.min.time()),
+                datetime.combine(window_to + timedelta(days=1), datetime.min.time()),
+                doctor_id="Any" if g["preferred_doctor"] == "Any" or not doctor_ids else doctor_ids[0],
+                patient_id=g["patient_id"],
+                email=g.get("email"), patient_type=g["patient_type"], clinic_location=g["clinic_location"],
+            )
+            st.success(f"You're on the waitlist (ID: {entry['waitlist_id']}).")
@@ -0,0 +1,297 @@
+"""Headless batch booking from a JSONL file of booking requests.
+
+    python batch_booking.py referrals.jsonl --report booking_report.csv
+
+One request per line, e.g.
+
+    {"request_id": "R1", "first_name": "Amit", "last_name": "Sharma", "dob": "1990-01-01",
+     "email": "amit@example.com", "preferred_doctor": "Any", "clinic_location": "Main Clinic - Bengaluru",
+     "insurance_carrier": "Acme", "member_id": "M1", "group_number": "G1"}
+
+Requests are streamed, the schedule and the patient index are loaded once,
+and each patient gets the earliest free visit of the length their type
+needs (`duration_for_patient_type`: known patients are "returning", anyone
+else "new" and registered). Appointments, patients, reminders, emails and
+ICS files are written in bulk at the end of each chunk, under the same
+locks as `booking.book_appointment`. Every request gets a report row:
+booked, no_slot or invalid (with the reason).
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import re
+import time
+import uuid
+from datetime import date, datetime
+
+import pandas as pd
+
+import data_loader
+from calendar_utils import create_ics_for_appointment
+from data_loader import get_backend, patient_index, save_appointments, save_patients, save_reminders
+from messaging import reminder_rows, send_emails
+from metrics import span
+from patient_index import normalize_dob, patient_key
+from scheduling import duration_for_patient_type, slots_needed
+from slot_store import forget_store, open_store, save_store, schedule_lock
+
+BOOKED = "booked"
+NO_SLOT = "no_slot"
+INVALID = "invalid"
+
+DEFAULT_LOCATION = "Main Clinic - Bengaluru"
+REPORT_COLUMNS = [
+    "line", "request_id", "status", "reason", "appointment_id", "patient_id", "patient_type",
+    "doctor_id", "doctor_name", "slot_start", "slot_end",
+]
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _minutes(ts) -> int:
+    return pd.Timestamp(ts).value // 60_000_000_000
+
+
+def _datetime(minutes: int) -> datetime:
+    return pd.Timestamp(minutes, unit="m").to_pydatetime()
+
+
+def read_requests(path: str):
+    """Yield (line number, request dict or None, error) for each non-blank line of a JSONL file."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"bad JSON: {e.msg}"
+                continue
+            if not isinstance(request, dict):
+                yield line_no, None, "bad JSON: expected an object"
+                continue
+            yield line_no, request, None
+
+
+def validate(request: dict, doctor_names) -> str:
+    """Why `request` cannot be booked, or "" if it is well-formed."""
+    for field in ("first_name", "last_name", "dob"):
+        if not isinstance(request.get(field), str) or not request[field].strip():
+            return f"missing {field}"
+    dob = normalize_dob(request["dob"])
+    try:
+        if not _ISO_DATE.fullmatch(dob) or date.fromisoformat(dob) > date.today():
+            return f"invalid dob {request['dob']!r}"
+    except ValueError:
+        return f"invalid dob {request['dob']!r}"
+    email = request.get("email")
+    if email not in (None, "") and (not isinstance(email, str) or "@" not in email):
+        return f"invalid email {email!r}"
+    doctor = request.get("preferred_doctor") or "Any"
+    if doctor != "Any" and doctor not in doctor_names:
+        return f"unknown doctor {doctor!r}"
+    return ""
+
+
+class BatchBooker:
+    """Assigns slots for a stream of requests against one in-memory schedule.
+
+    The earliest free visit per (preferred doctor, slots needed) comes from
+    a heap of each doctor's next free start. Bookings only ever remove free
+    slots, so entries are checked when popped and, if stale, replaced by the
+    doctor's next free visit after them.
+    """
+
+    def __init__(self, schedule_path: str = None, not_before=None, chunk_size: int = 1000,
+                 emails: bool = True, ics: bool = True):
+        self.schedule_path = schedule_path or data_loader.SCHEDULE_CSV
+        self.not_before = _minutes(not_before or datetime.now())
+        self.chunk_size = chunk_size
+        self.emails = emails
+        self.ics = ics
+        self.store = None
+        self._ids = (f"{uuid.uuid4().hex[:6]}{i:06x}" for i in itertools.count())
+        self._doctor_names = set()
+        self._heaps = {}
+
+    def run(self, requests, report=None) -> dict:
+        """Book every (line, request, error) from `requests`; `report` gets one dict per request."""
+        counts = {BOOKED: 0, NO_SLOT: 0, INVALID: 0}
+        t0 = time.perf_counter()
+        chunk = []
+        for item in requests:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self._run_chunk(chunk, counts, report)
+                chunk = []
+        if chunk:
+            self._run_chunk(chunk, counts, report)
+        elapsed = time.perf_counter() - t0
+        return {**counts, "requests": sum(counts.values()), "seconds": elapsed,
+                "bookings_per_second": counts[BOOKED] / elapsed if elapsed else 0.0}
+
+    def _run_chunk(self, chunk, counts, report):
+        for result in self.book_chunk(chunk):
+            counts[result["status"]] += 1
+            if report is not None:
+                report(result)
+
+    def book_chunk(self, chunk: list) -> list:
+        """Assign slots for a chunk of (line, request, error) and write its bookings; returns report rows."""
+        with span("batch.chunk") as s, schedule_lock(self.schedule_path), get_backend().transaction():
+            s.rows = len(chunk)
+            store = open_store(self.schedule_path)   # reloaded only if someone else changed it
+            if store is not self.store:
+                self.store, self._heaps = store, {}
+                self._doctor_names = set(store.doctor_names.values())
+            index = patient_index()
+            staged = {"appointments": [], "patients": {}, "bookings": []}
+            try:
+                results = [self._book_one(line, request, error, index, staged) for line, request, error in chunk]
+                self._write(staged)
+            except Exception:
+                # The in-memory schedule holds bookings that were never saved.
+                forget_store(self.schedule_path)
+                self.store = None
+                raise
+        self._notify(staged["bookings"])
+        return results
+
+    def _book_one(self, line, request, error, index, staged) -> dict:
+        result = dict.fromkeys(REPORT_COLUMNS, "")
+        result.update(line=line, request_id=(request or {}).get("request_id", ""))
+        error = error or validate(request, self._doctor_names)
+        if error:
+            return {**result, "status": INVALID, "reason": error}
+
+        first, last = request["first_name"].strip(), request["last_name"].strip()
+        dob = normalize_dob(request["dob"])
+        key = patient_key(first, last, dob)
+        patient = index.get(first, last, dob) or staged["patients"].get(key)
+        patient_type = "returning" if patient is not None else "new"
+        duration = duration_for_patient_type(patient_type)
+        result["patient_type"] = patient_type
+
+        doctor_name = request.get("preferred_doctor") or "Any"
+        visit = self._take_earliest(doctor_name, slots_needed(duration))
+        if visit is None:
+            return {**result, "status": NO_SLOT, "reason": f"no free {duration}-minute slot with {doctor_name}"}
+        doctor_id, start, end = visit
+
+        email = request.get("email") or (patient or {}).get("email") or "new.patient@example.com"
+        if patient is None:
+            patient = {"patient_id": "P" + next(self._ids).upper(), "first_name": first,
+                       "last_name": last, "dob": dob, "email": email}
+            staged["patients"][key] = patient
+        slot_start, slot_end = _datetime(start), _datetime(end)
+        appointment = {
+            "appointment_id": next(self._ids),
+            "patient_id": patient["patient_id"],
+            "patient_name": f"{first} {last}",
+            "dob": dob,
+            "patient_type": patient_type,
+            "doctor_id": doctor_id,
+            "doctor_name": self.store.doctor_names[doctor_id],
+            "slot_start": slot_start,
+            "slot_end": slot_end,
+            "clinic_location": request.get("clinic_location") or DEFAULT_LOCATION,
+            "insurance_carrier": request.get("insurance_carrier", ""),
+            "member_id": request.get("member_id", ""),
+            "group_number": request.get("group_number", ""),
+            "intake_form_sent": self.emails,
+            "confirmation_sent": self.emails,
+            "status": "Booked",
+        }
+        staged["appointments"].append(appointment)
+        staged["bookings"].append((appointment, first, email, duration))
+        return {**result, "status": BOOKED, "appointment_id": appointment["appointment_id"],
+                "patient_id": patient["patient_id"], "doctor_id": doctor_id,
+                "doctor_name": appointment["doctor_name"],
+                "slot_start": slot_start.strftime("%Y-%m-%d %H:%M"), "slot_end": slot_end.strftime("%Y-%m-%d %H:%M")}
+
+    def _take_earliest(self, doctor_name: str, n: int):
+        """Book and return (doctor_id, start, end) of the earliest free visit, or None."""
+        heap = self._heaps.get((doctor_name, n))
+        if heap is None:
+            heap = self._heaps[(doctor_name, n)] = []
+            for doctor_id in self.store.doctor_ids(doctor_name):
+                self._push_next(heap, doctor_id, n, self.not_before)
+        while heap:
+            start, doctor_id, end = heapq.heappop(heap)
+            if self.store.book(doctor_id, _datetime(start), n):
+                self._push_next(heap, doctor_id, n, start)
+                return doctor_id, start, end
+            self._push_next(heap, doctor_id, n, start)   # taken by another request meanwhile
+        return None
+
+    def _push_next(self, heap, doctor_id, n, not_before):
+        visit = self.store.next_free(doctor_id, n, not_before)
+        if visit is not None:
+            heapq.heappush(heap, (visit[0], doctor_id, visit[1]))
+
+    def _write(self, staged):
+        if not staged["appointments"]:
+            return
+        save_appointments(staged["appointments"])
+        if staged["patients"]:
+            save_patients(list(staged["patients"].values()))
+        save_reminders([row for appointment, first, email, _ in staged["bookings"]
+                        for row in reminder_rows(appointment["appointment_id"], first,
+                                                 appointment["doctor_name"], appointment["slot_start"], email)])
+        save_store(self.store, self.schedule_path)
+        data_loader.READ_CACHE.invalidate("schedule")
+
+    def _notify(self, bookings):
+        """Queue confirmation and intake emails and write ICS files for the chunk's bookings."""
+        if not bookings:
+            return
+        if self.emails:
+            recipients = [email for _, _, email, _ in bookings]
+            contexts = [{
+                "first_name": first,
+                "doctor_name": appointment["doctor_name"],
+                "slot_date": appointment["slot_start"].strftime("%b %d, %Y"),
+                "slot_time": appointment["slot_start"].strftime("%I:%M %p"),
+                "clinic_location": appointment["clinic_location"],
+            } for appointment, first, _, _ in bookings]
+            send_emails("email_confirm.txt", recipients, contexts, attach_form=True)
+            send_emails("email_intake_form.txt", recipients, contexts, attach_form=True)
+        if self.ics:
+            with span("batch.ics") as s:
+                s.rows = len(bookings)
+                for appointment, _, _, duration in bookings:
+                    create_ics_for_appointment(appointment["appointment_id"], appointment["doctor_name"],
+                                               appointment["slot_start"], duration, appointment["clinic_location"])
+
+
+def book_batch(requests_path: str, report_path: str, **kwargs) -> dict:
+    """Book every request in a JSONL file, writing the per-request report as CSV; returns the summary."""
+    with open(report_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        return BatchBooker(**kwargs).run(read_requests(requests_path), writer.writerow)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("requests", help="JSONL file with one booking request per line")
+    parser.add_argument("--report", default="booking_report.csv", help="per-request result CSV")
+    parser.add_argument("--schedule", default=None, help="schedule file (default: SCHEDULER_SCHEDULE)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="requests written per bulk write")
+    parser.add_argument("--not-before", default=None, help="earliest slot start to hand out (default: now)")
+    parser.add_argument("--no-emails", action="store_true", help="do not queue confirmation/intake emails")
+    parser.add_argument("--no-ics", action="store_true", help="do not write ICS files")
+    args = parser.parse_args()
+
+    summary = book_batch(args.requests, args.report, schedule_path=args.schedule, chunk_size=args.chunk_size,
+                         not_before=args.not_before and pd.Timestamp(args.not_before),
+                         emails=not args.no_emails, ics=not args.no_ics)
+    print(f"{summary['requests']} requests: {summary[BOOKED]} booked, {summary[NO_SLOT]} no slot, "
+          f"{summary[INVALID]} invalid in {summary['seconds']:.2f}s "
+          f"({summary['bookings_per_second']:.0f} bookings/s). Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
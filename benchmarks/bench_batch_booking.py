@@ -0,0 +1,127 @@
+"""Throughput of batch booking from JSONL vs booking the same requests one at a time.
+
+    python benchmarks/bench_batch_booking.py --requests 20000 --doctors 50
+
+Requests mix returning patients (30 min) and new ones (60 min) with a few
+invalid lines; both runs start from the same synthetic schedule and patient
+table in a temp directory, on the backend chosen by SCHEDULER_STORAGE. The one-at-a-time run uses `book_appointment` on
+the earliest free slot, as the app does, and is capped with --single.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import calendar_utils
+import data_loader
+import messaging
+import synthetic
+from batch_booking import BOOKED, book_batch
+from booking import book_appointment
+from scheduling import duration_for_patient_type, get_available_slots
+from slot_store import open_store
+from storage import migrate_csv_to_sqlite
+
+
+def write_requests(path, n, patients, seed=0):
+    rng = np.random.default_rng(seed)
+    known = patients.to_dict("records")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            if i % 50 == 49:
+                f.write(json.dumps({"request_id": f"R{i}", "first_name": "", "dob": "1990-01-01"}) + "\n")
+                continue
+            if rng.random() < 0.5:
+                p = known[int(rng.integers(len(known)))]
+                request = {"first_name": p["first_name"], "last_name": p["last_name"], "dob": p["dob"],
+                           "email": p["email"]}
+            else:
+                request = {"first_name": "New", "last_name": f"Patient{i}", "dob": "1985-05-05",
+                           "email": f"new{i}@example.com"}
+            f.write(json.dumps({"request_id": f"R{i}", "preferred_doctor": "Any", **request}) + "\n")
+
+
+def _point_at(directory):
+    data_loader.PATIENTS_CSV = os.path.join(directory, "patients.csv")
+    data_loader.APPTS_CSV = os.path.join(directory, "appointments.csv")
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.SCHEDULE_CSV = os.path.join(directory, "doctor_schedule.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.READ_CACHE.clear()
+    messaging.OUTBOX_DIR = os.path.join(directory, "outbox")
+    calendar_utils.EXPORTS_DIR = os.path.join(directory, "exports")
+
+
+def _setup(directory, args):
+    _point_at(directory)
+    synthetic.schedule(args.doctors * synthetic.SLOTS_PER_DAY * synthetic.DAYS, booked=0.2).to_csv(
+        data_loader.SCHEDULE_CSV, index=False)
+    patients = synthetic.patients(args.patients)
+    patients.to_csv(data_loader.PATIENTS_CSV, index=False)
+    if data_loader.STORAGE_BACKEND == "sqlite":
+        migrate_csv_to_sqlite(data_loader.csv_paths(), data_loader.DB_PATH)
+    return patients
+
+
+def one_at_a_time(requests_path, limit):
+    booked = 0
+    t0 = time.perf_counter()
+    with open(requests_path, encoding="utf-8") as f:
+        for line in list(f)[:limit]:
+            r = json.loads(line)
+            if not r.get("first_name"):
+                continue
+            found = data_loader.lookup_patient(r["first_name"], r["last_name"], r["dob"])
+            duration = duration_for_patient_type("returning" if found is not None else "new")
+            slots = get_available_slots(open_store(data_loader.SCHEDULE_CSV), "Any", duration)
+            chosen = slots.sort_values("slot_start").iloc[0]
+            appointment = {"appointment_id": f"S{booked}", "doctor_id": chosen["doctor_id"],
+                           "slot_start": chosen["slot_start"], "slot_end": chosen["slot_end"], "status": "Booked"}
+            patient = None if found is not None else {"patient_id": f"PS{booked}", "first_name": r["first_name"],
+                                                      "last_name": r["last_name"], "dob": r["dob"]}
+            result = book_appointment(chosen, duration, appointment, r["first_name"], email=r["email"],
+                                      new_patient=patient, schedule_path=data_loader.SCHEDULE_CSV)
+            booked += result["status"] == "booked"
+    return booked, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--single", type=int, default=200, help="requests to book one at a time for comparison (0 to skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        patients = _setup(directory, args)
+        requests_path = os.path.join(directory, "requests.jsonl")
+        write_requests(requests_path, args.requests, patients)
+        summary = book_batch(requests_path, os.path.join(directory, "report.csv"), chunk_size=args.chunk_size,
+                             not_before=synthetic.START)
+        messaging.get_delivery_queue().flush()
+        print(f"batch: {summary['requests']} requests -> {summary[BOOKED]} booked, {summary['no_slot']} no slot, "
+              f"{summary['invalid']} invalid in {summary['seconds']:.2f}s "
+              f"({summary['bookings_per_second']:.0f} bookings/s)")
+
+    if not args.single:
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        patients = _setup(directory, args)
+        requests_path = os.path.join(directory, "requests.jsonl")
+        write_requests(requests_path, args.single, patients)
+        booked, seconds = one_at_a_time(requests_path, args.single)
+        messaging.get_delivery_queue().flush()
+        print(f"one at a time: {booked} booked in {seconds:.2f}s ({booked / seconds:.0f} bookings/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Email delivery throughput against a local SMTP server (aiosmtpd).
+
+    python benchmarks/bench_email_delivery.py --messages 2000 --latency-ms 5
+
+Compares one-connection-per-message sends with the pooled `SmtpTransport`
+behind a `DeliveryQueue`, and the file outbox for reference. The server can
+add a per-message delay to mimic a remote relay.
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller
+
+from delivery import DeliveryQueue, FileOutboxTransport, SmtpTransport, new_message, to_email_message
+
+
+class _Relay:
+    def __init__(self, latency):
+        self.latency = latency
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.received += 1
+        return "250 OK"
+
+
+def _messages(n):
+    return [new_message(f"patient{i}@example.com", f"Subject: Reminder #{i}\n\nSee you soon.") for i in range(n)]
+
+
+def unpooled(port, messages):
+    for m in messages:
+        with smtplib.SMTP("127.0.0.1", port) as conn:
+            conn.send_message(to_email_message(m, "clinic@example.com"))
+
+
+def queued(transport, messages, workers):
+    q = DeliveryQueue(transport, workers=workers)
+    for m in messages:
+        q.enqueue(m)
+    q.close()
+    if q.failed:
+        raise SystemExit(f"{len(q.failed)} messages failed: {q.failed[0][1]}")
+
+
+def _timed(label, n, fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} {n / elapsed:8.0f} msgs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated relay delay per message")
+    parser.add_argument("--workers", type=int, default=8, help="sender threads / pooled connections")
+    args = parser.parse_args()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    relay = _Relay(args.latency_ms / 1000)
+    controller = Controller(relay, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        print(f"{args.messages} messages, relay latency={args.latency_ms} ms, workers={args.workers}")
+        _timed("smtp, connection per msg", args.messages, unpooled, port, _messages(args.messages))
+        _timed("smtp, pooled + queue", args.messages, queued,
+               SmtpTransport("127.0.0.1", port, pool_size=args.workers), _messages(args.messages), args.workers)
+        with tempfile.TemporaryDirectory() as directory:
+            _timed("outbox files + queue", args.messages, queued,
+                   FileOutboxTransport(directory), _messages(args.messages), args.workers)
+    finally:
+        controller.stop()
+    if relay.received != 2 * args.messages:
+        raise SystemExit(f"relay received {relay.received}, expected {2 * args.messages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""ICS feeds: full rebuild vs. incremental refresh after one booking or one cancellation.
+
+    python benchmarks/bench_ics_feeds.py --events 10000 --repeat 20
+
+Builds one doctor feed of --events synthetic appointments from scratch (a
+new `IcsFeed`, so nothing is cached), then times `refresh` after appending
+one booking and after cancelling one appointment, against a full rebuild
+of the same feed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+import calendar_utils
+import synthetic
+from calendar_utils import IcsFeed
+
+
+def _feed(directory):
+    return IcsFeed(os.path.join(directory, "doctor.ics"), "Bench", lambda row: row["patient_name"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    appts = synthetic.appointments(args.events + args.repeat)
+    base, extra = appts.iloc[:args.events].copy(), appts.iloc[args.events:]
+    full, booking, cancel = [], [], []
+    with tempfile.TemporaryDirectory() as directory:
+        calendar_utils.EXPORTS_DIR = directory
+        for _ in range(3):
+            t0 = time.perf_counter()
+            _feed(directory).refresh(base)
+            full.append(time.perf_counter() - t0)
+
+        feed = _feed(directory)
+        feed.refresh(base)
+        current = base
+        for i in range(args.repeat):
+            current = pd.concat([current, extra.iloc[i:i + 1]], ignore_index=True)
+            t0 = time.perf_counter()
+            feed.refresh(current)
+            booking.append(time.perf_counter() - t0)
+
+            current.loc[i * 97 % args.events, "status"] = "Cancelled"
+            t0 = time.perf_counter()
+            feed.refresh(current)
+            cancel.append(time.perf_counter() - t0)
+        size = os.path.getsize(feed.path)
+
+    full_ms = statistics.median(full) * 1e3
+    print(f"{args.events} events, {size / 2**20:.1f} MB feed")
+    print(f"full rebuild:           {full_ms:8.1f} ms")
+    for name, times in (("after one booking", booking), ("after one cancellation", cancel)):
+        ms = statistics.median(times) * 1e3
+        print(f"{name + ':':23s} {ms:8.1f} ms  ({full_ms / ms:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Reminder throughput with 1..8 worker processes sharing one local store.
+
+    python benchmarks/bench_reminder_workers.py --reminders 4000 --send-ms 2
+
+Each worker claims batches with leases and "sends" by writing to a temp
+outbox (plus an optional simulated per-message latency). The run fails if
+any reminder is sent twice or left unsent.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+
+NOW = datetime(2030, 1, 7, 12, 0)
+
+
+def _configure(directory, backend, send_ms):
+    data_loader.STORAGE_BACKEND = backend
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    messaging.OUTBOX_DIR = os.path.join(directory, "outbox")
+    if send_ms:
+        write = messaging.deliver_now
+
+        def slow_write(*args, **kwargs):
+            time.sleep(send_ms / 1000)
+            return write(*args, **kwargs)
+
+        messaging.deliver_now = slow_write
+
+
+def _seed(directory, backend, n):
+    _configure(directory, backend, 0)
+    data_loader.save_reminders([
+        {"appointment_id": f"A{i}", "reminder_number": 1, "channel": "email",
+         "scheduled_for": (NOW - timedelta(minutes=i % 600)).strftime("%Y-%m-%d %H:%M")}
+        for i in range(n)
+    ])
+
+
+def _worker(directory, backend, send_ms, batch_size, start, queue):
+    _configure(directory, backend, send_ms)
+    start.wait()
+    queue.put(messaging.dispatch_due(f"w{os.getpid()}", NOW, batch_size))
+
+
+def run(workers, reminders, backend, send_ms, batch_size):
+    with tempfile.TemporaryDirectory() as directory:
+        _seed(directory, backend, reminders)
+        ctx = multiprocessing.get_context()
+        start, queue = ctx.Event(), ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(directory, backend, send_ms, batch_size, start, queue))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        t0 = time.perf_counter()
+        start.set()
+        sent = sum(queue.get(timeout=600) for _ in procs)
+        elapsed = time.perf_counter() - t0
+        for p in procs:
+            p.join()
+
+        _configure(directory, backend, 0)
+        df = data_loader.load_reminders()
+        delivered = df["sent_at"].notna().sum()
+        if sent != reminders or delivered != reminders:
+            raise SystemExit(f"{workers} workers: sent {sent}, marked {delivered}, expected {reminders}")
+        return sent / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=4000)
+    parser.add_argument("--backend", choices=["sqlite", "csv"], default="sqlite")
+    parser.add_argument("--send-ms", type=float, default=2.0, help="simulated latency per message")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    base = None
+    print(f"{args.reminders} reminders, backend={args.backend}, send latency={args.send_ms} ms")
+    for n in args.workers:
+        rate = run(n, args.reminders, args.backend, args.send_ms, args.batch_size)
+        base = base or rate
+        print(f"{n:>2} workers: {rate:8.0f} reminders/s  ({rate / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
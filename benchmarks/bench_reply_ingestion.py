@@ -0,0 +1,117 @@
+"""Ingesting patients' replies to reminders: bulk batches vs. one update per reply.
+
+    python benchmarks/bench_reply_ingestion.py --replies 100000 --backend csv sqlite
+
+Seeds --replies appointments (three reminders each, to the patient's own
+address) and an inbox with one reply per appointment to its second
+reminder, sent from that address: 70% "YES, CONFIRM", 20% "FORMS NO" and
+10% cancellations with a reason (which free the slot through
+`booking.cancel_appointments`). `ingest_replies` is timed over the whole
+inbox, then again after --redeliver of the replies are delivered a second
+time (they are all skipped). The baseline applies --baseline replies one at
+a time, i.e. one table update (a full rewrite for CSV) per reply, and is
+extrapolated to the whole inbox.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_loader
+import metrics
+import synthetic
+from data_loader import get_backend
+from inbox import PROCESSED_DIR, apply_replies, ingest_replies, parse_reply
+from slot_store import SlotStore
+
+REPLIES = [("YES, CONFIRM", 7), ("FORMS NO", 2), ("No, cancel - travelling that week", 1)]
+STAGES = ("inbox.parse", "cancel_appointments", "csv.write[", "sqlite.update[")
+
+
+def _seed(directory, backend, n):
+    data_loader.STORAGE_BACKEND = backend
+    for name in ("APPTS", "PATIENTS", "REMINDERS", "WAITLIST"):
+        setattr(data_loader, f"{name}_CSV", os.path.join(directory, f"{name.lower()}.csv"))
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.READ_CACHE.clear()
+    appts = synthetic.appointments(n)
+    reminders = synthetic.reminders(3 * n)
+    reminders["email"] = [f"patient{i // 3}@example.com" for i in range(3 * n)]
+    get_backend().append("appointments", appts.to_dict("records"))
+    get_backend().append("reminders", reminders.to_dict("records"))
+    schedule = appts[["doctor_id", "doctor_name", "slot_start", "slot_end"]].assign(available=False)
+    path = os.path.join(directory, "doctor_schedule.csv")
+    SlotStore.from_frame(schedule).save(path)
+    return appts["appointment_id"].tolist(), path
+
+
+def _write_inbox(inbox, appointment_ids, suffix=""):
+    os.makedirs(inbox, exist_ok=True)
+    texts = [text for text, weight in REPLIES for _ in range(weight)]
+    for i, appointment_id in enumerate(appointment_ids):
+        with open(os.path.join(inbox, f"{appointment_id}{suffix}.eml"), "w", encoding="utf-8") as f:
+            f.write(f"Message-ID: <{appointment_id}@mail.example.com>\nFrom: patient{i}@example.com\n"
+                    f"Subject: Re: Action Needed: Forms & Confirmation\nDate: Sun, 06 Jan 2030 10:00:00 +0000\n\n"
+                    f"{texts[i % len(texts)]}\n\nOn Sat, 5 Jan 2030, Clinic wrote:\n"
+                    f"> Is your visit confirmed? (Reply CONFIRM/CANCEL)\n> Reference: {appointment_id}/2\n")
+
+
+def run(backend, n, redeliver, baseline):
+    with tempfile.TemporaryDirectory() as directory:
+        appointment_ids, schedule_path = _seed(directory, backend, n)
+        inbox = os.path.join(directory, "inbox")
+        _write_inbox(inbox, appointment_ids)
+
+        metrics.METRICS.reset()
+        t0 = time.perf_counter()
+        summary = ingest_replies(inbox, schedule_path, notify=False)
+        bulk = time.perf_counter() - t0
+        stages = {s["stage"]: (s["count"], metrics.METRICS.stage(s["stage"]).total)
+                  for s in metrics.summary() if s["stage"].startswith(STAGES)}
+
+        _write_inbox(inbox, appointment_ids[:redeliver], suffix="-again")
+        t0 = time.perf_counter()
+        again = ingest_replies(inbox, schedule_path, notify=False)
+        skipped = time.perf_counter() - t0
+
+        # One update (one full CSV rewrite) per reply, on replies that were already applied.
+        processed = os.path.join(inbox, PROCESSED_DIR)
+        replies = []
+        for appointment_id in appointment_ids[:baseline]:
+            with open(os.path.join(processed, f"{appointment_id}.eml"), "rb") as f:
+                replies.append(parse_reply(f.read()))
+        t0 = time.perf_counter()
+        for reply in replies:
+            apply_replies([reply], schedule_path, notify=False)
+        per_reply = (time.perf_counter() - t0) / max(len(replies), 1)
+
+    print(f"[{backend}] {n} replies, {3 * n} reminder rows")
+    print(f"  bulk ingest:      {bulk:7.2f} s  ({n / bulk:8.0f} replies/s): {summary['confirmed']} confirmed, "
+          f"{summary['cancelled']} cancelled, {summary['reminders']} reminders updated")
+    for stage, (count, total) in stages.items():
+        print(f"    {stage:28s} {count:4d} calls  {total:7.2f} s")
+    print(f"  re-delivered:     {skipped:7.2f} s  ({again['duplicates']} duplicates skipped, "
+          f"{again['reminders']} reminders updated)")
+    print(f"  one per reply:    {per_reply * 1e3:7.1f} ms/reply -> ~{per_reply * n:8.0f} s for {n} "
+          f"({per_reply * n / bulk:.0f}x slower)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=100_000)
+    parser.add_argument("--backend", nargs="+", default=["csv", "sqlite"], choices=["csv", "sqlite"])
+    parser.add_argument("--redeliver", type=int, default=10_000, help="replies delivered a second time")
+    parser.add_argument("--baseline", type=int, default=50, help="replies applied one at a time")
+    args = parser.parse_args()
+
+    metrics.enable(True)
+    for backend in args.backend:
+        run(backend, args.replies, min(args.redeliver, args.replies), min(args.baseline, args.replies))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""File size and load time of doctor_schedule.csv vs the binary .slots format.
+
+    python benchmarks/bench_schedule_format.py --doctors 100 --days 365
+
+Compares a full load into a DataFrame, a single-doctor read, a one-week
+read across all doctors, and building the booking `SlotStore`.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from schedule_format import ScheduleFile, write_frame
+from schedule_generator import DEFAULT_CONFIG, generate_slots
+from slot_store import SlotStore
+
+
+def _timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _csv_frame(path):
+    df = pd.read_csv(path)
+    df["slot_start"] = pd.to_datetime(df["slot_start"])
+    df["slot_end"] = pd.to_datetime(df["slot_end"])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    doctors = [{**DEFAULT_CONFIG["defaults"], "doctor_id": f"D{i:04d}", "doctor_name": f"Dr. Doctor {i}"}
+               for i in range(args.doctors)]
+    schedule = generate_slots(doctors, "2030-01-01", args.days)
+    schedule["available"] = schedule.index % 5 != 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "doctor_schedule.csv")
+        bin_path = os.path.join(directory, "doctor_schedule.slots")
+        schedule.to_csv(csv_path, index=False, date_format="%Y-%m-%d %H:%M")
+        write_frame(bin_path, schedule)
+
+        print(f"{len(schedule):,} slots ({args.doctors} doctors x {args.days} days)")
+        print(f"{'':<28}{'csv':>12}{'.slots':>12}")
+        sizes = os.path.getsize(csv_path) / 2**20, os.path.getsize(bin_path) / 2**20
+        print(f"{'file size (MB)':<28}{sizes[0]:>12.1f}{sizes[1]:>12.1f}")
+
+        week = ("2030-03-01", "2030-03-08")
+        rows = [
+            ("full load (s)", lambda: _csv_frame(csv_path), lambda: ScheduleFile(bin_path).read()),
+            ("one doctor (s)", lambda: _csv_frame(csv_path).query("doctor_id == 'D0007'"),
+             lambda: ScheduleFile(bin_path).read("D0007")),
+            ("one week, all doctors (s)",
+             lambda: (lambda df: df[(df["slot_start"] >= week[0]) & (df["slot_start"] < week[1])])(_csv_frame(csv_path)),
+             lambda: ScheduleFile(bin_path).read(start=week[0], end=week[1])),
+            ("SlotStore.load (s)", lambda: SlotStore.load(csv_path), lambda: SlotStore.load(bin_path)),
+        ]
+        for label, from_csv, from_bin in rows:
+            t_csv, a = _timed(from_csv)
+            t_bin, b = _timed(from_bin)
+            assert len(a) == len(b), (label, len(a), len(b))
+            print(f"{label:<28}{t_csv:>12.4f}{t_bin:>12.4f}   ({t_csv / t_bin:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Schedule generation speed for many doctors over a long horizon.
+
+    python benchmarks/bench_schedule_generator.py --doctors 1000 --days 365
+
+Doctors get weekday hours with a lunch break, short Saturdays and a
+holiday, so every branch of the generator is exercised.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_generator import DEFAULT_CONFIG, generate_slots
+
+
+def doctors(n):
+    return [
+        {**DEFAULT_CONFIG["defaults"], "doctor_id": f"D{i}", "doctor_name": f"Dr. Doctor {i}", "breaks": [["13:00", "14:00"]],
+         "weekdays": [0, 1, 2, 3, 4, 5], "hours_by_weekday": {"5": ["09:00", "13:00"]},
+         "holidays": ["2030-12-25"]}
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config = doctors(args.doctors)
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        slots = generate_slots(config, "2030-01-01", args.days)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{args.doctors} doctors x {args.days} days: {len(slots):,} slots in {best:.3f}s "
+          f"({len(slots) / best / 1e6:.1f}M slots/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""One schedule file vs. a schedule sharded by (doctor, month): booking throughput and "Any doctor" queries.
+
+    python benchmarks/bench_sharded_schedule.py --doctors 200 --days 60 --workers 1 4 --bookings 200
+
+The same synthetic schedule (--doctors x --days x 16 slots) is stored once
+as doctor_schedule.csv and once as a shard directory. Each worker process
+books --bookings slots with its own doctors through `book_slot` (lock,
+check, write the schedule), so the only shared resource is the schedule:
+with one file every booking rewrites all of it under one lock, with shards
+only its doctor-month. Then the first page of "Any doctor" visits is
+timed on a freshly opened store (each doctor's first shard is loaded, in
+parallel) and on a cached one.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import slot_store
+import synthetic
+from scheduling import book_slot, recommend_slots
+from slot_store import SlotStore, open_store, split_schedule
+
+
+def _worker(path, slots, start, queue):
+    start.wait()
+    t0 = time.perf_counter()
+    for doctor_id, slot_start in slots:
+        book_slot({"doctor_id": doctor_id, "slot_start": slot_start}, 30, schedule_path=path)
+    queue.put(time.perf_counter() - t0)
+
+
+def bookings_per_second(path, schedule, workers, bookings) -> float:
+    doctors = schedule["doctor_id"].unique()
+    rng = np.random.default_rng(workers)
+    ctx = multiprocessing.get_context()
+    start, queue = ctx.Event(), ctx.Queue()
+    procs = []
+    for w in range(workers):
+        own = schedule[schedule["doctor_id"].isin(doctors[w::workers]) & schedule["available"]]
+        picks = own.iloc[rng.choice(len(own), bookings, replace=False)]
+        slots = list(zip(picks["doctor_id"], picks["slot_start"].astype(str)))
+        procs.append(ctx.Process(target=_worker, args=(path, slots, start, queue)))
+    for p in procs:
+        p.start()
+    t0 = time.perf_counter()
+    start.set()
+    for _ in procs:
+        queue.get()
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    return workers * bookings / elapsed
+
+
+def any_doctor_query_ms(path, cold: bool, repeat=5) -> float:
+    times = []
+    for _ in range(repeat):
+        if cold:
+            slot_store._OPEN_STORES.clear()
+        t0 = time.perf_counter()
+        recommend_slots(open_store(path), "Any", 30, k=10)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--bookings", type=int, default=200, help="bookings per worker")
+    args = parser.parse_args()
+
+    synthetic.DAYS = args.days
+    schedule = synthetic.schedule(args.doctors * synthetic.SLOTS_PER_DAY * args.days)
+    print(f"{len(schedule)} slots, {args.doctors} doctors, {args.days} days, {os.cpu_count()} CPUs")
+    for workers in args.workers:
+        for layout in ("single file", "sharded"):
+            with tempfile.TemporaryDirectory() as directory:
+                csv_path = os.path.join(directory, "doctor_schedule.csv")
+                SlotStore.from_frame(schedule).save(csv_path)
+                path = csv_path
+                if layout == "sharded":
+                    path = os.path.join(directory, "schedule")
+                    split_schedule(csv_path, path)
+                rate = bookings_per_second(path, schedule, workers, args.bookings)
+                cold, warm = any_doctor_query_ms(path, cold=True), any_doctor_query_ms(path, cold=False)
+            print(f"{layout:11s} workers={workers}: {rate:8.0f} bookings/s; first 'Any doctor' page "
+                  f"{cold:6.1f} ms cold, {warm:6.2f} ms cached")
+
+
+if __name__ == "__main__":
+    main()
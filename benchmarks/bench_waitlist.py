@@ -0,0 +1,124 @@
+"""Waitlist backfill: latency of matching one freed slot, and a cancellation storm end to end.
+
+    python benchmarks/bench_waitlist.py --doctors 50 --waitlist 5000 --cancel 5000
+
+A fully booked synthetic schedule (--doctors x 30 days x 16 slots) gets a
+waitlist of 30- and 60-minute requests for random doctors (a fifth for
+"Any") with windows of 2-8 hours. First, random booked visits are freed one
+at a time in memory and matched (`WaitlistIndex.match`) to time a single
+match. Then --cancel appointments are cancelled in one
+`booking.cancel_appointments` call on the backend chosen by SCHEDULER_STORAGE.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+import messaging
+import synthetic
+from booking import cancel_appointments
+from slot_store import SlotStore
+from storage import migrate_csv_to_sqlite
+from waitlist import WAITING, WaitlistIndex
+
+_MINUTE = 60 * 10**9
+
+
+def waitlist_frame(schedule, n, seed=0):
+    rng = np.random.default_rng(seed)
+    doctors = schedule["doctor_id"].unique()
+    picks = schedule.sample(n, replace=True, random_state=seed)
+    start = pd.to_datetime(picks["slot_start"]).dt.floor("h") - pd.to_timedelta(rng.integers(0, 3, n), unit="h")
+    return pd.DataFrame({
+        "waitlist_id": [f"W{i:07d}" for i in range(n)],
+        "patient_id": "",
+        "first_name": "Wait",
+        "last_name": [f"Listed{i}" for i in range(n)],
+        "dob": "1985-05-05",
+        "email": [f"wait{i}@example.com" for i in range(n)],
+        "patient_type": "new",
+        "doctor_id": np.where(rng.random(n) < 0.2, "Any", rng.choice(doctors, n)),
+        "duration": rng.choice([30, 60], n),
+        "window_start": start.dt.strftime("%Y-%m-%d %H:%M").to_numpy(),
+        "window_end": (start + pd.to_timedelta(rng.integers(2, 9, n), unit="h")).dt.strftime("%Y-%m-%d %H:%M")
+        .to_numpy(),
+        "clinic_location": "",
+        "created_at": "2030-01-01 00:00",
+        "status": WAITING,
+    })
+
+
+def time_matches(schedule, waitlist, n, seed=1):
+    """Free n random booked slots one at a time and time each match (in memory)."""
+    store = SlotStore.from_frame(schedule)
+    index = WaitlistIndex.from_frame(waitlist)
+    picks = schedule.sample(n, random_state=seed)
+    starts = pd.to_datetime(picks["slot_start"])
+    minutes = (starts.astype("int64") // _MINUTE).to_numpy()
+    times, offered = [], 0
+    for doctor_id, ts, start in zip(picks["doctor_id"], starts, minutes):
+        if not store.release(doctor_id, ts, 1):
+            continue
+        t0 = time.perf_counter()
+        offered += len(index.match(store, [(doctor_id, int(start), int(start) + 30)]))
+        times.append(time.perf_counter() - t0)
+    return np.array(times), offered
+
+
+def storm(directory, schedule, waitlist, n):
+    data_loader.SCHEDULE_CSV = os.path.join(directory, "doctor_schedule.csv")
+    for table, path in data_loader.csv_paths().items():
+        setattr(data_loader, {"appointments": "APPTS_CSV"}.get(table, f"{table.upper()}_CSV"),
+                os.path.join(directory, os.path.basename(path)))
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.READ_CACHE.clear()
+    messaging.OUTBOX_DIR = os.path.join(directory, "outbox")
+
+    schedule.to_csv(data_loader.SCHEDULE_CSV, index=False)
+    appts = schedule.assign(
+        appointment_id=[f"A{i:08d}" for i in range(len(schedule))], patient_id="P1", patient_name="Synthetic Patient",
+        status="Booked", clinic_location="Main Clinic - Bengaluru").drop(columns="available")
+    appts.to_csv(data_loader.APPTS_CSV, index=False)
+    waitlist.to_csv(data_loader.WAITLIST_CSV, index=False)
+    if data_loader.STORAGE_BACKEND == "sqlite":
+        migrate_csv_to_sqlite(data_loader.csv_paths(), data_loader.DB_PATH)
+
+    ids = appts["appointment_id"].sample(n, random_state=2).tolist()
+    t0 = time.perf_counter()
+    result = cancel_appointments(ids, data_loader.SCHEDULE_CSV, notify=False)
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--waitlist", type=int, default=5000)
+    parser.add_argument("--matches", type=int, default=5000, help="single freed slots to time")
+    parser.add_argument("--cancel", type=int, default=5000, help="appointments cancelled in the storm")
+    args = parser.parse_args()
+
+    schedule = synthetic.schedule(args.doctors * synthetic.SLOTS_PER_DAY * synthetic.DAYS, booked=1.0)
+    waitlist = waitlist_frame(schedule, args.waitlist)
+    print(f"{len(schedule)} booked slots, {len(waitlist)} waitlist entries, backend={data_loader.STORAGE_BACKEND}")
+
+    times, offered = time_matches(schedule, waitlist, args.matches)
+    p50, p99 = np.percentile(times * 1e6, [50, 99])
+    print(f"match one freed slot: p50 {p50:.1f} us, p99 {p99:.1f} us, max {times.max() * 1e6:.1f} us "
+          f"({offered} offers from {len(times)} freed slots)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed, result = storm(directory, schedule, waitlist, args.cancel)
+    print(f"cancellation storm: {len(result['cancelled'])} cancelled, {len(result['offers'])} offers in "
+          f"{elapsed:.2f}s ({len(result['cancelled']) / elapsed:.0f} cancellations/s)")
+
+
+if __name__ == "__main__":
+    main()
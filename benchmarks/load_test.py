@@ -0,0 +1,145 @@
+"""Concurrent load test for the HTTP API (api.py).
+
+    python benchmarks/load_test.py --workers 1 4 --clients 64 --seconds 20
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --seconds 30   # an already running server
+
+Without --url, a server is started for each --workers count on a temp
+data directory seeded with a synthetic schedule. Each client loops:
+search availability, then (with probability --book-ratio) try to book
+one of the slots it was shown, so clients race for the same early slots
+and some bookings get 409 (counted as conflicts, not errors). Reports
+requests/s and p50/p95/p99 latency per endpoint.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+import synthetic
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(directory, workers, backend, slots):
+    """Seed `directory` and serve it with `workers` uvicorn processes; returns (process, base url)."""
+    synthetic.schedule(slots).to_csv(os.path.join(directory, "doctor_schedule.csv"), index=False)
+    port = _free_port()
+    env = {
+        **os.environ,
+        "SCHEDULER_DATA_DIR": directory,
+        "SCHEDULER_STORAGE": backend,
+        "SCHEDULER_OUTBOX": os.path.join(directory, "outbox"),
+        "SCHEDULER_EXPORTS": os.path.join(directory, "exports"),
+    }
+    env.pop("SCHEDULER_SCHEDULE", None)
+    env.pop("SCHEDULER_DB", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return proc, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("server did not start")
+
+
+async def _client(http, i, stop_at, book_ratio, stats):
+    rng = random.Random(i)
+    n = 0
+    while time.perf_counter() < stop_at:
+        doctor = "Any" if rng.random() < 0.5 else f"Dr. Doctor {rng.randrange(2)}"
+        t0 = time.perf_counter()
+        resp = await http.get("/slots", params={"doctor": doctor, "patient_type": "new", "limit": 10})
+        stats["slots"].append(time.perf_counter() - t0)
+        if resp.status_code != 200:
+            stats["errors"] += 1
+            continue
+        shown = resp.json()["slots"]
+        if not shown or rng.random() >= book_ratio:
+            continue
+        slot = rng.choice(shown)
+        n += 1
+        body = {"first_name": f"Load{i}", "last_name": f"Client{n}", "dob": "1990-01-01",
+                "email": f"load{i}.{n}@example.com", "doctor_id": slot["doctor_id"],
+                "slot_start": slot["slot_start"]}
+        t0 = time.perf_counter()
+        resp = await http.post("/bookings", json=body)
+        stats["bookings"].append(time.perf_counter() - t0)
+        if resp.status_code == 409:
+            stats["conflicts"] += 1
+        elif resp.status_code != 201:
+            stats["errors"] += 1
+
+
+async def run_load(url, clients, seconds, book_ratio) -> dict:
+    stats = {"slots": [], "bookings": [], "conflicts": 0, "errors": 0}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as http:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_client(http, i, t0 + seconds, book_ratio, stats) for i in range(clients)))
+        stats["elapsed"] = time.perf_counter() - t0
+    return stats
+
+
+def report(label, stats):
+    elapsed = stats["elapsed"]
+    total = len(stats["slots"]) + len(stats["bookings"])
+    print(f"{label}: {total / elapsed:.0f} req/s, {stats['conflicts']} conflicts (409), {stats['errors']} errors")
+    for name in ("slots", "bookings"):
+        lat = np.array(stats[name]) * 1e3
+        if len(lat):
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+            print(f"  {name:<9} {len(lat) / elapsed:8.0f} req/s   p50 {p50:7.1f} ms   p95 {p95:7.1f} ms   "
+                  f"p99 {p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="sqlite")
+    parser.add_argument("--slots", type=int, default=20_000, help="synthetic schedule size")
+    parser.add_argument("--clients", type=int, default=64, help="concurrent clients")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--book-ratio", type=float, default=0.2, help="share of searches followed by a booking")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.seconds:g}s, book ratio {args.book_ratio}")
+    if args.url:
+        report(args.url, asyncio.run(run_load(args.url, args.clients, args.seconds, args.book_ratio)))
+        return
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            proc, url = start_server(directory, workers, args.backend, args.slots)
+            try:
+                stats = asyncio.run(run_load(url, args.clients, args.seconds, args.book_ratio))
+            finally:
+                proc.terminate()
+                proc.wait()
+            report(f"{workers} worker(s), backend={args.backend}, {args.slots} slots", stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Benchmark suite for the scheduling, persistence and reminder hot paths.
+
+    python benchmarks/suite.py run --sizes 1k 100k --output before.json
+    python benchmarks/suite.py run --sizes 1k 100k --output after.json
+    python benchmarks/suite.py compare before.json after.json --threshold 0.2
+
+`run` times every case at each data size (slots, patients, appointments
+and reminders all get that many rows) in a fresh temp data directory and
+writes the timings as JSON. `compare` prints old vs new medians and exits
+with status 1 if any case got slower by more than the threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+import calendar_utils
+import data_loader
+import messaging
+import synthetic
+from scheduling import book_slot, get_available_slots, recommend_slots
+from slot_store import SlotStore, open_store
+from storage import TABLE_COLUMNS, migrate_csv_to_sqlite
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+# name -> (setup(size, directory) -> (run, before_each), uses data size)
+CASES = {}
+
+
+def case(name, sized=True):
+    def register(setup):
+        CASES[name] = (setup, sized)
+        return setup
+    return register
+
+
+def _configure(directory, backend):
+    data_loader.STORAGE_BACKEND = backend
+    data_loader.PATIENTS_CSV = os.path.join(directory, "patients.csv")
+    data_loader.APPTS_CSV = os.path.join(directory, "appointments.csv")
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.SCHEDULE_CSV = os.path.join(directory, "doctor_schedule.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.READ_CACHE.clear()
+    messaging.OUTBOX_DIR = os.path.join(directory, "outbox")
+    calendar_utils.EXPORTS_DIR = os.path.join(directory, "exports")
+
+
+def _seed(table, df):
+    """Write `df` as the table's initial contents in the configured backend."""
+    path = data_loader.csv_paths()[table]
+    columns = TABLE_COLUMNS[table]
+    df.reindex(columns=columns + [c for c in df.columns if c not in columns]).to_csv(path, index=False)
+    if data_loader.STORAGE_BACKEND == "sqlite":
+        migrate_csv_to_sqlite(data_loader.csv_paths(), data_loader.DB_PATH)
+        os.remove(path)
+
+
+@case("get_available_slots_30")
+def _slots_30(size, directory):
+    store = SlotStore.from_frame(synthetic.schedule(size))
+    return (lambda: get_available_slots(store, "Any", 30)), None
+
+
+@case("get_available_slots_60")
+def _slots_60(size, directory):
+    store = SlotStore.from_frame(synthetic.schedule(size))
+    return (lambda: get_available_slots(store, "Any", 60)), None
+
+
+@case("recommend_slots_k10")
+def _recommend(size, directory):
+    store = SlotStore.from_frame(synthetic.schedule(size))
+    return (lambda: recommend_slots(store, "Any", 60, k=10, not_before=synthetic.START,
+                                    time_from="10:00", time_to="16:00")), None
+
+
+@case("book_slot")
+def _book_slot(size, directory):
+    synthetic.schedule(size).to_csv(data_loader.SCHEDULE_CSV, index=False)
+    free = iter(get_available_slots(open_store(data_loader.SCHEDULE_CSV), "Any", 30).to_dict("records"))
+    return (lambda: book_slot(next(free), 30, schedule_path=data_loader.SCHEDULE_CSV)), None
+
+
+@case("find_patient_by_name_dob")
+def _find_patient(size, directory):
+    patients = synthetic.patients(size)
+    target = patients.iloc[size // 2]
+    return (lambda: data_loader.find_patient_by_name_dob(
+        patients, target["first_name"], target["last_name"], target["dob"])), None
+
+
+@case("lookup_patient")
+def _lookup_patient(size, directory):
+    _seed("patients", synthetic.patients(size))
+    target = data_loader.load_patients().iloc[size // 2]
+    data_loader.lookup_patient("warm", "up", "2000-01-01")
+    return (lambda: data_loader.lookup_patient(target["first_name"], target["last_name"], target["dob"])), None
+
+
+@case("save_appointments")
+def _save_appointments(size, directory):
+    _seed("appointments", synthetic.appointments(size))
+    record = synthetic.appointments(1).iloc[0].to_dict()
+    ids = (f"A-bench-{i}" for i in itertools.count())
+    return (lambda: data_loader.save_appointments([{**record, "appointment_id": next(ids)}])), None
+
+
+@case("schedule_reminders_for_appointment")
+def _schedule_reminders(size, directory):
+    _seed("reminders", synthetic.reminders(size))
+    slot = synthetic.START + timedelta(days=5)
+    return (lambda: messaging.schedule_reminders_for_appointment(
+        "A-bench", "Amit", "Dr. Doctor 0", slot, "amit@example.com")), None
+
+
+@case("run_due_reminders")
+def _run_due_reminders(size, directory):
+    _seed("reminders", synthetic.reminders(size))
+    now = synthetic.START
+    due = synthetic.reminders(100, now - timedelta(days=1)).to_dict("records")
+
+    def before_each():
+        data_loader.save_reminders(due)
+
+    return (lambda: messaging.dispatch_due("bench", now)), before_each
+
+
+@case("create_ics_for_appointment", sized=False)
+def _create_ics(size, directory):
+    start = datetime(2030, 1, 7, 9, 0)
+    return (lambda: calendar_utils.create_ics_for_appointment(
+        "A-bench", "Dr. Doctor 0", start, 60, "Main Clinic - Bengaluru")), None
+
+
+def run_case(name, size, backend, repeat, max_seconds, min_sample=0.002):
+    """Median/min/mean seconds per call after one warm-up run.
+
+    Calls faster than `min_sample` are looped inside each sample (like
+    timeit's autorange) so microsecond cases are not dominated by timer noise.
+    """
+    setup, _ = CASES[name]
+    with tempfile.TemporaryDirectory() as directory:
+        _configure(directory, backend)
+        run, before_each = setup(size, directory)
+        if before_each:
+            before_each()
+        t0 = time.perf_counter()
+        run()
+        warmup = time.perf_counter() - t0
+        number = 1 if before_each else max(1, min(1000, int(min_sample / max(warmup, 1e-9))))
+        times = []
+        deadline = time.perf_counter() + max_seconds
+        while len(times) < repeat and (not times or time.perf_counter() < deadline):
+            if before_each:
+                before_each()
+            t0 = time.perf_counter()
+            for _ in range(number):
+                run()
+            times.append((time.perf_counter() - t0) / number)
+    return {"runs": len(times), "number": number, "min": min(times), "median": statistics.median(times),
+            "mean": statistics.fmean(times)}
+
+
+def run_suite(sizes, backend="csv", only=None, repeat=5, max_seconds=10.0, log=print) -> dict:
+    results = {}
+    for name, (_, sized) in CASES.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        for label, size in (sizes if sized else sizes[:1]):
+            key = f"{name}[{label}]" if sized else name
+            results[key] = run_case(name, size, backend, repeat, max_seconds)
+            log(f"{key:<48} median {results[key]['median'] * 1e3:10.3f} ms  ({results[key]['runs']} runs)")
+    return {"meta": _meta(backend), "results": results}
+
+
+def _meta(backend):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"created": datetime.now().isoformat(timespec="seconds"), "commit": commit, "backend": backend,
+            "python": platform.python_version(), "pandas": pd.__version__, "machine": platform.platform()}
+
+
+def compare(old: dict, new: dict, threshold: float = 0.2, log=print) -> list:
+    """Print median changes; return the cases slower by more than `threshold` (0.2 = 20%)."""
+    regressions = []
+    log(f"{'case':<48}{'old ms':>12}{'new ms':>12}{'change':>10}")
+    for key, result in new["results"].items():
+        before = old["results"].get(key)
+        if before is None:
+            log(f"{key:<48}{'-':>12}{result['median'] * 1e3:>12.3f}{'new':>10}")
+            continue
+        change = result["median"] / before["median"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        log(f"{key:<48}{before['median'] * 1e3:>12.3f}{result['median'] * 1e3:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def _size(text):
+    if text.lower() in SIZES:
+        return text.lower(), SIZES[text.lower()]
+    return text, int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="time every case and write JSON results")
+    run.add_argument("--sizes", nargs="+", type=_size, default=[_size("1k"), _size("100k")],
+                     help="1k, 100k, 1m or a row count")
+    run.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    run.add_argument("--only", nargs="+", help="run cases whose name contains one of these")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--max-seconds", type=float, default=10.0, help="stop repeating a case after this long")
+    run.add_argument("--output", default="benchmark_results.json")
+    cmp = commands.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown of the median (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_suite(args.sizes, args.backend, args.only, args.repeat, args.max_seconds)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+        return 0
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Synthetic, seeded data for benchmarks: schedules, patients, appointments and reminders."""
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from schedule_generator import DEFAULT_CONFIG, generate_slots
+
+START = datetime(2030, 1, 7)
+SLOTS_PER_DAY = 16
+DAYS = 30
+
+FIRST_NAMES = ["Amit", "Neha", "Ravi", "Priya", "Arjun", "Kavya", "Rohan", "Isha", "Vikram", "Ananya"]
+LAST_NAMES = ["Sharma", "Iyer", "Nair", "Rao", "Kapoor", "Menon", "Reddy", "Gupta", "Das", "Pillai"]
+
+
+def doctors(n: int) -> list:
+    return [{**DEFAULT_CONFIG["defaults"], "doctor_id": f"D{i:05d}", "doctor_name": f"Dr. Doctor {i}"}
+            for i in range(n)]
+
+
+def schedule(n_slots: int, booked: float = 0.2, seed: int = 0) -> pd.DataFrame:
+    """About `n_slots` slots over DAYS days (enough doctors to fill them), `booked` of them taken."""
+    n_doctors = max(1, math.ceil(n_slots / (SLOTS_PER_DAY * DAYS)))
+    days = min(DAYS, math.ceil(n_slots / (SLOTS_PER_DAY * n_doctors)))
+    df = generate_slots(doctors(n_doctors), START.date(), days).head(n_slots)
+    df["available"] = np.random.default_rng(seed).random(len(df)) >= booked
+    for col in ("doctor_id", "doctor_name"):
+        df[col] = df[col].astype(str)
+    return df
+
+
+def patients(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dob = pd.Timestamp("1950-01-01") + pd.to_timedelta(rng.integers(0, 60 * 365, n), unit="D")
+    return pd.DataFrame({
+        "patient_id": [f"P{i:07d}" for i in range(n)],
+        "first_name": np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), n)],
+        "last_name": [f"{LAST_NAMES[i % len(LAST_NAMES)]}{i}" for i in range(n)],
+        "dob": dob.strftime("%Y-%m-%d"),
+        "email": [f"patient{i}@example.com" for i in range(n)],
+    })
+
+
+def appointments(n: int) -> pd.DataFrame:
+    slot = pd.Timestamp(START) + pd.to_timedelta(np.arange(n) * 30, unit="min")
+    return pd.DataFrame({
+        "appointment_id": [f"A{i:08d}" for i in range(n)],
+        "patient_id": [f"P{i:07d}" for i in range(n)],
+        "patient_name": "Synthetic Patient",
+        "dob": "1990-01-01",
+        "patient_type": np.where(np.arange(n) % 3 == 0, "new", "returning"),
+        "doctor_id": "D00000",
+        "doctor_name": "Dr. Doctor 0",
+        "slot_start": slot.strftime("%Y-%m-%d %H:%M:%S"),
+        "slot_end": (slot + pd.Timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S"),
+        "clinic_location": "Main Clinic - Bengaluru",
+        "status": "Booked",
+    })
+
+
+def reminders(n: int, now: datetime = START) -> pd.DataFrame:
+    """n unsent reminders, all scheduled after `now` (so none are due)."""
+    when = pd.Timestamp(now) + pd.to_timedelta(1 + np.arange(n) % 10_000, unit="min")
+    return pd.DataFrame({
+        "appointment_id": [f"A{i // 3:08d}" for i in range(n)],
+        "patient_name": "Amit",
+        "doctor_name": "Dr. Doctor 0",
+        "email": "amit@example.com",
+        "slot_start": (pd.Timestamp(now) + timedelta(days=5)).strftime("%Y-%m-%d %H:%M"),
+        "reminder_number": 1 + np.arange(n) % 3,
+        "scheduled_for": when.strftime("%Y-%m-%d %H:%M"),
+        "channel": "email",
+    })
@@ -0,0 +1,239 @@
+from contextlib import contextmanager
+
+import pandas as pd
+
+import data_loader
+from data_loader import (cancel_reminders, find_appointments, get_backend, save_appointments, save_patient,
+                         update_appointments, update_reminders)
+from calendar_utils import create_ics_for_appointment
+from messaging import reminder_rows, schedule_reminders_for_appointment, send_emails, simulate_email
+from metrics import timed
+from scheduling import book_slot, slots_needed
+from slot_store import forget_store, open_store, save_store, schedule_lock
+from waitlist import OFFERED_STATUS, backfill
+
+BOOKED = "booked"
+SLOT_TAKEN = "slot_taken"
+
+CANCELLED_STATUS = "Cancelled"
+# Set when the patient replies CONFIRM to a reminder (see inbox.py).
+CONFIRMED_STATUS = "Confirmed"
+# Appointments that hold their slots.
+ACTIVE_STATUSES = ("Booked", OFFERED_STATUS, CONFIRMED_STATUS)
+
+_NS_PER_MINUTE = 60 * 10**9
+
+
+@timed("book_appointment")
+def book_appointment(slot_row, duration, appointment: dict, first_name: str, email=None,
+                     new_patient=None, schedule_path=data_loader.SCHEDULE_CSV) -> dict:
+    """Book a slot and record everything that belongs to the booking as one unit.
+
+    The schedule file is locked and a storage transaction is opened (file
+    locks on every table for CSV, one write transaction for SQLite) for the
+    whole booking (for a sharded schedule, only the slot's doctor-month is
+    locked). The slot is checked first; only if every base slot is
+    still free are the appointment, the new patient (if any) and the
+    reminders written, and the schedule is updated last.
+
+    Returns {"status": BOOKED, "appointment": ...} on success or
+    {"status": SLOT_TAKEN, "message": ...} if someone else got there first.
+    """
+    n = slots_needed(duration)
+    with schedule_lock(schedule_path, [(slot_row["doctor_id"], slot_row["slot_start"])]), \
+            get_backend().transaction():
+        if not open_store(schedule_path).is_free(slot_row["doctor_id"], slot_row["slot_start"], n):
+            return {
+                "status": SLOT_TAKEN,
+                "message": f"Slot {slot_row['slot_start']} with {slot_row['doctor_name']} was just taken.",
+            }
+
+        save_appointments([appointment])
+        if new_patient is not None:
+            save_patient(new_patient)
+        slot_dt = pd.Timestamp(slot_row["slot_start"]).to_pydatetime()
+        schedule_reminders_for_appointment(
+            appointment["appointment_id"], first_name, slot_row["doctor_name"], slot_dt, email
+        )
+        book_slot(slot_row, duration, schedule_path=schedule_path)
+
+    return {"status": BOOKED, "appointment": appointment}
+
+
+def notify_booking(appointment: dict, first_name: str, email: str, duration) -> str:
+    """Queue the confirmation and intake emails for a booking and write its ICS file; returns the ICS path."""
+    slot_dt = pd.Timestamp(appointment["slot_start"]).to_pydatetime()
+    context = {
+        "first_name": first_name,
+        "doctor_name": appointment["doctor_name"],
+        "slot_date": slot_dt.strftime("%b %d, %Y"),
+        "slot_time": slot_dt.strftime("%I:%M %p"),
+        "clinic_location": appointment["clinic_location"],
+    }
+    simulate_email(to_email=email, template="email_confirm.txt", context=context, attach_form=True)
+    simulate_email(to_email=email, template="email_intake_form.txt", context=context, attach_form=True)
+    return create_ics_for_appointment(
+        appointment["appointment_id"], appointment["doctor_name"], slot_dt, duration, appointment["clinic_location"]
+    )
+
+
+def _minutes(ts) -> int:
+    return pd.Timestamp(ts).value // _NS_PER_MINUTE
+
+
+@contextmanager
+def _schedule_changes(schedule_path):
+    """Change the cached schedule: if anything in the block fails, its unsaved changes are dropped."""
+    try:
+        yield
+    except Exception:
+        forget_store(schedule_path)
+        raise
+    finally:
+        data_loader.READ_CACHE.invalidate("schedule")
+
+
+def _active(appointment_ids) -> pd.DataFrame:
+    appts = find_appointments(appointment_ids)
+    return appts[appts["status"].isin(ACTIVE_STATUSES)]
+
+
+@contextmanager
+def _locked_active(appointment_ids, schedule_path, extra_slots=None):
+    """Lock the schedule where the active appointments sit and open a transaction; yields their rows.
+
+    `extra_slots(rows)` adds (doctor_id, slot_start) pairs to lock too. The
+    rows are read once first to find the shards to lock and again under the
+    locks; if an appointment moved to another shard in between, the locks
+    are taken again to cover it.
+    """
+    def needed(rows):
+        slots = {(d, pd.Timestamp(start)) for d, start in zip(rows["doctor_id"], rows["slot_start"])}
+        return slots | set(extra_slots(rows) if extra_slots else ())
+
+    slots = needed(_active(appointment_ids))
+    while True:
+        with schedule_lock(schedule_path, sorted(slots)), get_backend().transaction():
+            rows = _active(appointment_ids)
+            missing = needed(rows) - slots
+            if not missing:
+                yield rows
+                return
+        slots |= missing
+
+
+@timed("cancel_appointments")
+def cancel_appointments(appointment_ids, schedule_path=data_loader.SCHEDULE_CSV, backfill_waitlist=True,
+                        notify=True) -> dict:
+    """Cancel appointments, free their slots and offer the freed time to the waitlist.
+
+    Works for one cancellation or a storm of them: the appointments table is
+    read once, each slot release and each waitlist match only touches the
+    day involved, and every table (and the schedule) is written once.
+    Unknown or already cancelled appointments are skipped.
+
+    Returns {"cancelled": [appointment ids], "offers": [...]} (offers as
+    returned by `waitlist.backfill`; emailed unless `notify` is False).
+    """
+    ids = {str(a) for a in appointment_ids}
+    with _locked_active(ids, schedule_path) as active:
+        rows = active.to_dict("records")
+        if not rows:
+            return {"cancelled": [], "offers": []}
+        with _schedule_changes(schedule_path):
+            store = open_store(schedule_path)
+            freed = []
+            for row in rows:
+                start, end = _minutes(row["slot_start"]), _minutes(row["slot_end"])
+                if store.release(row["doctor_id"], row["slot_start"], slots_needed(end - start)):
+                    freed.append((row["doctor_id"], start, end))
+            cancelled = [str(row["appointment_id"]) for row in rows]
+            update_appointments([{"appointment_id": a, "status": CANCELLED_STATUS} for a in cancelled])
+            cancel_reminders(cancelled)
+            offers = backfill(store, freed) if backfill_waitlist and freed else []
+            if freed:
+                save_store(store, schedule_path)
+
+    if notify:
+        notify_offers(offers)
+    return {"cancelled": cancelled, "offers": offers}
+
+
+def cancel_appointment(appointment_id, schedule_path=data_loader.SCHEDULE_CSV, **kwargs) -> dict:
+    """Cancel one appointment (see `cancel_appointments`)."""
+    return cancel_appointments([appointment_id], schedule_path, **kwargs)
+
+
+@timed("reschedule_appointment")
+def reschedule_appointment(appointment_id, slot_start, doctor_id=None, schedule_path=data_loader.SCHEDULE_CSV,
+                           backfill_waitlist=True, notify=True) -> dict:
+    """Move an appointment to `slot_start` (optionally with another doctor), keeping its length.
+
+    The new slots are taken and the old ones released under the schedule
+    lock, the appointment and its reminders are updated in place (reminders
+    will be sent again for the new time), and the old time is offered to
+    the waitlist. Returns {"status": BOOKED, "appointment": ..., "offers": [...]}
+    or {"status": SLOT_TAKEN, "message": ...}; raises KeyError for an
+    unknown or cancelled appointment.
+    """
+    new_start = pd.Timestamp(slot_start)
+
+    def target(rows):
+        return [(doctor_id or d, new_start) for d in rows["doctor_id"]]
+
+    with _locked_active({str(appointment_id)}, schedule_path, target) as rows:
+        if rows.empty:
+            raise KeyError(f"No active appointment {appointment_id!r}")
+        old = rows.iloc[0].to_dict()
+        start, end = _minutes(old["slot_start"]), _minutes(old["slot_end"])
+        n = slots_needed(end - start)
+        doctor_id = doctor_id or old["doctor_id"]
+        store = open_store(schedule_path)
+        if doctor_id not in store.doctor_names:
+            raise KeyError(f"Unknown doctor {doctor_id!r}")
+
+        with _schedule_changes(schedule_path):
+            released = store.release(old["doctor_id"], old["slot_start"], n)
+            if not store.book(doctor_id, new_start, n):
+                if released:
+                    forget_store(schedule_path)   # undo the release: reload from disk on next use
+                return {"status": SLOT_TAKEN,
+                        "message": f"Slot {new_start} with {store.doctor_names[doctor_id]} is not available."}
+
+            changes = {"appointment_id": old["appointment_id"], "doctor_id": doctor_id,
+                       "doctor_name": store.doctor_names[doctor_id], "slot_start": new_start,
+                       "slot_end": new_start + pd.Timedelta(minutes=end - start)}
+            update_appointments([changes])
+            first_name = str(old["patient_name"]).split(" ")[0]
+            update_reminders([
+                {**{k: r[k] for k in ("appointment_id", "reminder_number", "doctor_name", "slot_start",
+                                      "scheduled_for")},
+                 "sent_at": "", "claimed_by": "", "lease_expires": ""}
+                for r in reminder_rows(old["appointment_id"], first_name, changes["doctor_name"],
+                                       new_start.to_pydatetime(), None)
+            ])
+            offers = backfill(store, [(old["doctor_id"], start, end)]) if backfill_waitlist else []
+            save_store(store, schedule_path)
+
+    if notify:
+        notify_offers(offers)
+    return {"status": BOOKED, "appointment": {**old, **changes}, "offers": offers}
+
+
+def notify_offers(offers: list) -> list:
+    """Email every waitlist offer in one template batch; returns the message ids."""
+    if not offers:
+        return []
+    contexts = []
+    for offer in offers:
+        appointment = offer["appointment"]
+        slot_dt = pd.Timestamp(appointment["slot_start"]).to_pydatetime()
+        contexts.append({
+            "first_name": offer["first_name"],
+            "doctor_name": appointment["doctor_name"],
+            "slot_date": slot_dt.strftime("%b %d, %Y"),
+            "slot_time": slot_dt.strftime("%I:%M %p"),
+            "clinic_location": appointment["clinic_location"],
+        })
+    recipients = [offer["email"] or "patient@example.com" for offer in offers]
+    return send_emails("email_waitlist_offer.txt", recipients, contexts)
@@ -1,7 +1,31 @@
+"""Calendar files: one `.ics` per booking, and subscribable per-doctor / per-clinic feeds.
+
+A feed holds every appointment of one doctor or one clinic as VEVENTs
+(cancelled ones as `STATUS:CANCELLED`, so subscribers drop them). Feeds are
+regenerated incrementally: appointments are hashed per row and per day, and
+only days whose hash changed are re-rendered; unchanged events reuse their
+cached fragment. An event's SEQUENCE goes up each time its row changes (kept
+in a `.seq.json` file next to the feed), and the feed's ETag is derived from
+the day hashes, so it only changes when the feed does.
+
+    refresh_feeds()                 # every doctor and clinic feed under exports/feeds/
+    feed = doctor_feed("D1"); feed.refresh(load_appointments()); feed.etag
+"""
+import glob
+import hashlib
+import json
 import os
-from datetime import datetime, timedelta
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
 
-EXPORTS_DIR = os.path.join(os.path.dirname(__file__), "exports")
+EXPORTS_DIR = os.environ.get("SCHEDULER_EXPORTS", os.path.join(os.path.dirname(__file__), "exports"))
 
 def create_ics_for_appointment(appointment_id: str, doctor_name: str, start_dt: datetime, duration_minutes: int, location: str):
     end_dt = start_dt + timedelta(minutes=duration_minutes)
@@ -20,6 +44,218 @@ END:VCALENDAR
 """
     os.makedirs(EXPORTS_DIR, exist_ok=True)
     path = os.path.join(EXPORTS_DIR, f"appointment_{appointment_id}.ics")
-    with open(path, "w", encoding="utf-8") as f:
+    with span("ics.write") as s, open(path, "w", encoding="utf-8") as f:
         f.write(ics)
+        s.nbytes = f.tell()
     return path
+
+
+def prune_appointment_ics(max_age_days: float = 30) -> int:
+    """Delete per-booking `.ics` files older than `max_age_days`; returns how many were removed."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in glob.glob(os.path.join(EXPORTS_DIR, "appointment_*.ics")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# Columns that end up in a feed event; a change to any of them re-renders the event.
+FEED_COLUMNS = ["appointment_id", "patient_name", "doctor_id", "doctor_name", "slot_start", "slot_end",
+                "clinic_location", "status"]
+EVENT_STATUS = {"Cancelled": "CANCELLED", "Offered": "TENTATIVE"}
+
+
+def feeds_dir() -> str:
+    return os.path.join(EXPORTS_DIR, "feeds")
+
+
+def slug(name: str) -> str:
+    """File-name-safe form of a doctor id or clinic name ("Main Clinic - Bengaluru" -> "main-clinic-bengaluru")."""
+    return re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-")
+
+
+def _escape(text: str) -> str:
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets (RFC 5545 3.1)."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_time(value: str) -> str:
+    return pd.Timestamp(value).strftime("%Y%m%dT%H%M%S")
+
+
+class IcsFeed:
+    """One subscribable calendar file, regenerated a day at a time.
+
+    `summary(row)` gives an event's title. Call `refresh(appointments)` with
+    the appointments that belong to the feed; it re-renders only the days
+    that changed since the last call and rewrites the file if anything did.
+    """
+
+    def __init__(self, path: str, name: str, summary):
+        self.path = path
+        self.name = name
+        self.summary = summary
+        self.etag = None
+        self.days = {}          # day -> (hash, rendered VEVENTs, appointment ids)
+        self.events = {}        # appointment id -> (row hash, rendered VEVENT)
+        self.sequences = None   # appointment id -> [row hash, SEQUENCE]
+        self.sequences_changed = False
+        self.lock = threading.Lock()
+
+    def _load_sequences(self):
+        try:
+            with open(self.path + ".seq.json", encoding="utf-8") as f:
+                self.sequences = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.sequences = {}
+
+    def _render(self, row: dict, row_hash: int, stamp: str) -> str:
+        uid = row["appointment_id"]
+        cached = self.events.get(uid)
+        if cached is not None and cached[0] == row_hash:
+            return cached[1]
+        known = self.sequences.get(uid)
+        sequence = known[1] if known and known[0] == row_hash else (known[1] + 1 if known else 0)
+        if known != [row_hash, sequence]:
+            self.sequences[uid] = [row_hash, sequence]
+            self.sequences_changed = True
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_time(row['slot_start'])}",
+            f"DTEND:{_ics_time(row['slot_end'])}",
+            f"SEQUENCE:{sequence}",
+            f"STATUS:{EVENT_STATUS.get(row['status'], 'CONFIRMED')}",
+            f"SUMMARY:{_escape(self.summary(row))}",
+            f"LOCATION:{_escape(row['clinic_location'])}",
+            "END:VEVENT",
+        ]
+        text = "".join(_fold(line) for line in lines)
+        self.events[uid] = (row_hash, text)
+        return text
+
+    def refresh(self, appointments: pd.DataFrame) -> bool:
+        """Bring the feed file up to date with `appointments`; returns True if it was rewritten."""
+        with self.lock, span("ics.feed") as s:
+            if self.sequences is None:
+                self._load_sequences()
+            df = appointments.reindex(columns=FEED_COLUMNS).astype(object).fillna("").astype(str)
+            df = df[df["slot_start"] != ""]
+            day = df["slot_start"].str.slice(0, 10).to_numpy()
+            order = np.lexsort((df["appointment_id"].to_numpy(), df["slot_start"].to_numpy()))
+            df, day = df.iloc[order], day[order]
+            hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]]) if len(day) else np.array([], dtype=int)
+            bounds = np.r_[starts, len(day)]
+
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            days, rendered = {}, 0
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                key = day[lo]
+                day_hash = hashlib.blake2b(hashes[lo:hi].tobytes(), digest_size=16).hexdigest()
+                old = self.days.get(key)
+                if old is not None and old[0] == day_hash:
+                    days[key] = old
+                    continue
+                records = df.iloc[lo:hi].to_dict("records")
+                block = "".join(self._render(row, int(h), stamp) for row, h in zip(records, hashes[lo:hi]))
+                days[key] = (day_hash, block, [row["appointment_id"] for row in records])
+                rendered += hi - lo
+
+            etag = hashlib.blake2b((self.name + "".join(f"{k}{v[0]}" for k, v in days.items())).encode(),
+                                   digest_size=16).hexdigest()
+            stale = [old for key, old in self.days.items() if days.get(key) is not old]
+            present = set(df["appointment_id"]) if stale else ()
+            for old in stale:
+                for uid in old[2]:
+                    if uid not in present:
+                        self.events.pop(uid, None)
+            self.days = days
+            s.rows = rendered
+            if etag == self.etag and os.path.exists(self.path):
+                return False
+            self._write("".join(block for _, block, _ in days.values()))
+            if s:
+                s.nbytes = os.path.getsize(self.path)
+            self.etag = etag
+            return True
+
+    def _write(self, events: str):
+        header = "".join(_fold(line) for line in (
+            "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Clinic//AI Scheduler//EN", "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH", f"X-WR-CALNAME:{_escape(self.name)}"))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write(header + events + "END:VCALENDAR\r\n")
+        os.replace(tmp, self.path)
+        if self.sequences_changed:
+            tmp = f"{self.path}.seq.json.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps(self.sequences))
+            os.replace(tmp, self.path + ".seq.json")
+            self.sequences_changed = False
+
+    def read(self) -> str:
+        with open(self.path, encoding="utf-8", newline="") as f:
+            return f.read()
+
+
+_FEEDS = {}
+_feeds_lock = threading.Lock()
+
+
+def _feed(path: str, name: str, summary) -> IcsFeed:
+    with _feeds_lock:
+        feed = _FEEDS.get(path)
+        if feed is None:
+            feed = _FEEDS[path] = IcsFeed(path, name, summary)
+        return feed
+
+
+def doctor_feed(doctor_id: str) -> IcsFeed:
+    """The feed of one doctor's appointments (titled with the patient's name)."""
+    return _feed(os.path.join(feeds_dir(), f"doctor_{slug(doctor_id)}.ics"), f"Appointments - {doctor_id}",
+                 lambda row: row["patient_name"])
+
+
+def clinic_feed(clinic_location: str) -> IcsFeed:
+    """The feed of one clinic's appointments, for the front desk."""
+    return _feed(os.path.join(feeds_dir(), f"clinic_{slug(clinic_location)}.ics"), clinic_location,
+                 lambda row: f"{row['patient_name']} with {row['doctor_name']}")
+
+
+def refresh_feeds(appointments: pd.DataFrame = None) -> dict:
+    """Regenerate every doctor and clinic feed that changed; returns {feed path: rewritten?}."""
+    if appointments is None:
+        from data_loader import load_appointments
+        appointments = load_appointments()
+    result = {}
+    for column, feed_for in (("doctor_id", doctor_feed), ("clinic_location", clinic_feed)):
+        keys = appointments[column].astype(object).fillna("").astype(str)
+        for key, rows in appointments.groupby(keys.to_numpy(), sort=False):
+            if key:
+                feed = feed_for(key)
+                result[feed.path] = feed.refresh(rows)
+    return result
@@ -1,19 +1,147 @@
 import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 import pandas as pd
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+from metrics import span, timed
+from patient_index import PatientIndex
+from schedule_format import ScheduleFile, is_binary_schedule
+from slot_store import is_sharded_schedule, open_store, schedule_stamp
+from storage import CsvBackend, SqliteBackend, REMINDER_CANCELLED, TABLE_COLUMNS
+
+DATA_DIR = os.environ.get("SCHEDULER_DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
 PATIENTS_CSV = os.path.join(DATA_DIR, "patients.csv")
 APPTS_CSV = os.path.join(DATA_DIR, "appointments.csv")
-SCHEDULE_CSV = os.path.join(DATA_DIR, "doctor_schedule.csv")
+# doctor_schedule.csv, a binary .slots file (see schedule_format.py) or a directory of
+# per-doctor, per-month shards (see slot_store.ShardedStore)
+SCHEDULE_CSV = os.environ.get("SCHEDULER_SCHEDULE", os.path.join(DATA_DIR, "doctor_schedule.csv"))
+REMINDERS_CSV = os.path.join(DATA_DIR, "reminders.csv")
+WAITLIST_CSV = os.path.join(DATA_DIR, "waitlist.csv")
+
+# Storage backend for patients/appointments/reminders: "csv" (default) or "sqlite".
+STORAGE_BACKEND = os.environ.get("SCHEDULER_STORAGE", "csv")
+DB_PATH = os.environ.get("SCHEDULER_DB", os.path.join(DATA_DIR, "scheduler.db"))
+
+PATIENT_COLUMNS = TABLE_COLUMNS["patients"]
+
+
+def csv_paths() -> dict:
+    """Current CSV path of every table."""
+    return {"patients": PATIENTS_CSV, "appointments": APPTS_CSV, "reminders": REMINDERS_CSV,
+            "waitlist": WAITLIST_CSV}
+
+
+@lru_cache(maxsize=None)
+def _sqlite_backend(db_path):
+    return SqliteBackend(db_path)
+
+
+def get_backend():
+    """Return the configured storage backend."""
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_backend(DB_PATH)
+    if STORAGE_BACKEND != "csv":
+        raise ValueError(f"Unknown storage backend {STORAGE_BACKEND!r} (expected 'csv' or 'sqlite')")
+    return CsvBackend(csv_paths())
+
+class ReadCache:
+    """Process-wide LRU of loaded tables and derived results.
+
+    Entries are stored under (name, key) together with the data version they
+    were computed from; a lookup with a different version is a miss and
+    replaces the entry. Versions combine the store's own stamp (file stamp
+    or SQLite change counter) with an in-process generation that every write
+    path bumps through `invalidate`. Memory is bounded by entry count and by
+    an estimate of the cached bytes. Streamlit runs all sessions in one
+    process, so reruns and sessions share it.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def generation(self, name: str) -> int:
+        return self._generations.get(name, 0)
+
+    def invalidate(self, name: str):
+        """Drop everything cached for `name` (call after writing it)."""
+        with self._lock:
+            self._generations[name] = self.generation(name) + 1
+            for entry_key in [k for k in self._entries if k[0] == name]:
+                self._bytes -= self._entries.pop(entry_key)[2]
+
+    def get(self, name: str, key, version, loader):
+        """Return the cached value for (name, key) at `version`, calling `loader()` on a miss."""
+        version = (self.generation(name), version)
+        with self._lock:
+            entry = self._entries.get((name, key))
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end((name, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        size = _size_of(value)
+        with self._lock:
+            if version[0] != self.generation(name):
+                return value   # written while loading; don't cache a stale value
+            old = self._entries.pop((name, key), None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size <= self.max_bytes:
+                self._entries[(name, key)] = (version, value, size)
+                self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self._entries), "bytes": self._bytes}
+
+
+def _size_of(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(value)
+
+
+READ_CACHE = ReadCache()
+
+def _cached_table(table: str) -> pd.DataFrame:
+    backend = get_backend()
+    df = READ_CACHE.get(table, _store_key(table), backend.version(table), lambda: backend.load(table))
+    # Shallow copy: callers may add or drop columns without touching the cached frame.
+    return df.copy(deep=False)
+
+def read_cache_stats() -> dict:
+    """Hit/miss/eviction counters and size of the shared read cache."""
+    return READ_CACHE.stats()
 
 def load_patients() -> pd.DataFrame:
-    """Load patients.csv as DataFrame (empty if missing)."""
-    if os.path.exists(PATIENTS_CSV):
-        return pd.read_csv(PATIENTS_CSV)
-    return pd.DataFrame(columns=["patient_id", "first_name", "last_name", "dob", "email"])
+    """Load patients as DataFrame (empty if missing); cached until the table changes."""
+    return _cached_table("patients")
 
 def find_patient_by_name_dob(patients: pd.DataFrame, first: str, last: str, dob: str):
-    """Find patient record by first_name, last_name, and DOB (YYYY-MM-DD)."""
+    """Find patient record by first_name, last_name, and DOB (YYYY-MM-DD) in a loaded frame.
+
+    Scans the whole frame; `lookup_patient` answers the same question from the
+    patient index.
+    """
     if patients.empty:
         return None
     df = patients.copy()
@@ -26,29 +154,155 @@ def find_patient_by_name_dob(patients: pd.DataFrame, first: str, last: str, dob:
         return m.iloc[0].to_dict()
     return None
 
-def load_schedule() -> pd.DataFrame:
-    """Load doctor_schedule.csv as DataFrame (empty if missing)."""
-    if os.path.exists(SCHEDULE_CSV):
-        return pd.read_csv(SCHEDULE_CSV)
+# Patient indexes per store, rebuilt when another process changes the table.
+_PATIENT_INDEXES = {}
+_patient_index_lock = threading.Lock()
+
+def _store_key(table: str = "patients"):
+    return (STORAGE_BACKEND, DB_PATH) if STORAGE_BACKEND == "sqlite" else (STORAGE_BACKEND, csv_paths()[table])
+
+def patient_index() -> PatientIndex:
+    """The `PatientIndex` for the configured store, built once and kept up to date."""
+    backend = get_backend()
+    key = _store_key()
+    version = backend.version("patients")
+    with _patient_index_lock:
+        index = _PATIENT_INDEXES.get(key)
+        if index is None or index.version != version:
+            index = PatientIndex.from_frame(backend.load("patients"), version)
+            _PATIENT_INDEXES[key] = index
+        return index
+
+def lookup_patient(first: str, last: str, dob: str, fuzzy: bool = False):
+    """Find a patient by name and DOB, optionally tolerating name typos.
+
+    For SQLite the exact lookup is an indexed query on the same normalized
+    key the patient index uses (no case, accents or punctuation), so a
+    write by another process does not make it reload every patient; the
+    patient index (the only one that can match typos) is used for CSV and
+    for the `fuzzy` fallback.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        record = get_backend().find_patient(first, last, dob)
+        if record is not None or not fuzzy:
+            return record
+    return patient_index().match(first, last, dob, fuzzy=fuzzy)
+
+def _read_schedule(path: str) -> pd.DataFrame:
+    if is_sharded_schedule(path):
+        return open_store(path).read()
+    if os.path.exists(path) and is_binary_schedule(path):
+        return ScheduleFile(path).read()
+    if os.path.exists(path):
+        return pd.read_csv(path)
     return pd.DataFrame(columns=["doctor_id", "doctor_name", "slot_start", "slot_end", "available"])
 
+def load_schedule() -> pd.DataFrame:
+    """Load the doctor schedule as DataFrame (empty if missing); cached until the file changes."""
+    path = os.path.abspath(SCHEDULE_CSV)
+    return READ_CACHE.get("schedule", path, schedule_stamp(path), lambda: _read_schedule(path)).copy(deep=False)
+
+@timed("save_patient")
+def save_patient(record: dict):
+    """Append a new patient and add it to the patient index."""
+    save_patients([record])
+
+def save_patients(records: list):
+    """Append new patients in one write and add them to the patient index."""
+    backend = get_backend()
+    with span("save_patients") as s, backend.transaction():
+        s.rows = len(records)
+        before = backend.version("patients")
+        backend.append("patients", records)
+        after = backend.version("patients")
+    READ_CACHE.invalidate("patients")
+    with _patient_index_lock:
+        index = _PATIENT_INDEXES.get(_store_key())
+        # Only extend the index if nobody else wrote since it was built.
+        if index is not None and index.version == before:
+            for record in records:
+                index.add({**dict.fromkeys(PATIENT_COLUMNS), **record})
+            index.version = after
+
 def save_appointments(records: list):
-    """Append new appointment(s) to appointments.csv."""
-    df = pd.DataFrame(records)
-    if os.path.exists(APPTS_CSV):
-        old = pd.read_csv(APPTS_CSV)
-        out = pd.concat([old, df], ignore_index=True)
-    else:
-        out = df
-    out.to_csv(APPTS_CSV, index=False)
+    """Append new appointment(s)."""
+    with span("save_appointments") as s:
+        s.rows = len(records)
+        get_backend().append("appointments", records)
+    READ_CACHE.invalidate("appointments")
 
 def load_appointments() -> pd.DataFrame:
-    """Load appointments.csv as DataFrame (empty if missing)."""
-    if os.path.exists(APPTS_CSV):
-        return pd.read_csv(APPTS_CSV)
-    return pd.DataFrame(columns=[
-        "appointment_id", "patient_id", "patient_name", "dob", "patient_type",
-        "doctor_id", "doctor_name", "slot_start", "slot_end", "clinic_location",
-        "insurance_carrier", "member_id", "group_number", "intake_form_sent",
-        "confirmation_sent", "status"
-    ])
+    """Load appointments as DataFrame (empty if missing); cached until the table changes."""
+    return _cached_table("appointments")
+
+def find_patients(patient_ids) -> pd.DataFrame:
+    """The patients with the given ids: a primary-key lookup for SQLite, a filter on the cached table for CSV."""
+    ids = [str(p) for p in patient_ids]
+    if STORAGE_BACKEND == "sqlite":
+        return get_backend().find("patients", "patient_id", ids)
+    patients = load_patients()
+    return patients[patients["patient_id"].astype(str).isin(ids)]
+
+def find_appointments(appointment_ids) -> pd.DataFrame:
+    """The appointments with the given ids: a primary-key lookup for SQLite, a filter on the cached table for CSV."""
+    ids = [str(a) for a in appointment_ids]
+    if STORAGE_BACKEND == "sqlite":
+        return get_backend().find("appointments", "appointment_id", ids)
+    appts = load_appointments()
+    return appts[appts["appointment_id"].astype(str).isin(ids)]
+
+def update_appointments(records: list):
+    """Update appointment rows identified by appointment_id."""
+    get_backend().update("appointments", ["appointment_id"], records)
+    READ_CACHE.invalidate("appointments")
+
+def save_reminders(records: list):
+    """Append new reminder row(s)."""
+    with span("save_reminders") as s:
+        s.rows = len(records)
+        get_backend().append("reminders", records)
+
+def load_reminders() -> pd.DataFrame:
+    """Load reminders as DataFrame (empty if missing)."""
+    return get_backend().load("reminders")
+
+def find_reminders(appointment_ids) -> pd.DataFrame:
+    """The reminder rows of the given appointments: an index lookup for SQLite, a filter on the table for CSV."""
+    ids = [str(a) for a in appointment_ids]
+    if STORAGE_BACKEND == "sqlite":
+        return get_backend().find("reminders", "appointment_id", ids)
+    reminders = load_reminders()
+    return reminders[reminders["appointment_id"].astype(str).isin(ids)]
+
+def load_due_reminders(now: str, limit=None) -> pd.DataFrame:
+    """Unsent reminders scheduled at or before `now` ("%Y-%m-%d %H:%M"), earliest first."""
+    return get_backend().due_reminders(now, limit)
+
+def claim_due_reminders(worker_id: str, now, lease_seconds: float, limit: int) -> pd.DataFrame:
+    """Lease up to `limit` due reminders to `worker_id` (see `storage.CsvBackend.claim_reminders`)."""
+    return get_backend().claim_reminders(worker_id, now, lease_seconds, limit)
+
+def complete_reminders(worker_id: str, updates: list, now) -> int:
+    """Mark reminders claimed by `worker_id` as sent; returns how many it still held at `now`."""
+    return get_backend().complete_reminders(worker_id, updates, now)
+
+def update_reminders(records: list):
+    """Update reminder rows identified by (appointment_id, reminder_number)."""
+    get_backend().update("reminders", ["appointment_id", "reminder_number"], records)
+
+def cancel_reminders(appointment_ids: list):
+    """Stop every reminder of the given appointments from being sent."""
+    get_backend().update("reminders", ["appointment_id"],
+                         [{"appointment_id": a, "status": REMINDER_CANCELLED} for a in appointment_ids])
+
+def save_waitlist(records: list):
+    """Append new waitlist entries."""
+    get_backend().append("waitlist", records)
+
+def load_waitlist() -> pd.DataFrame:
+    """Load the waitlist as DataFrame (empty if missing)."""
+    return get_backend().load("waitlist")
+
+def update_waitlist(records: list):
+    """Update waitlist rows identified by waitlist_id."""
+    get_backend().update("waitlist", ["waitlist_id"], records)
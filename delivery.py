@@ -0,0 +1,230 @@
+import itertools
+import logging
+import mimetypes
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.message import EmailMessage
+
+from metrics import span
+
+log = logging.getLogger(__name__)
+
+
+# Random per process, so ids from different processes never collide; the
+# counter keeps them unique within one without an os.urandom call each.
+_ID_PREFIX = uuid.uuid4().hex[:20]
+_id_counter = itertools.count()
+
+
+def new_message_id() -> str:
+    """Time-sortable, collision-free id (timestamp + per-process random prefix + counter)."""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{_ID_PREFIX}{next(_id_counter):012x}"
+
+
+def new_message(to_email: str, subject_and_body: str, attachments=None) -> dict:
+    """An outgoing email; the body starts with "Subject: ..." like the templates."""
+    return {
+        "message_id": new_message_id(),
+        "to": to_email,
+        "body": subject_and_body,
+        "attachments": list(attachments or []),
+    }
+
+
+def to_email_message(message: dict, sender: str) -> EmailMessage:
+    """Build a MIME message, taking header lines from the top of the body."""
+    headers, _, text = message["body"].partition("\n\n")
+    if not all(":" in line for line in headers.splitlines()):
+        headers, text = "", message["body"]
+    msg = EmailMessage()
+    for line in headers.splitlines():
+        name, _, value = line.partition(":")
+        msg[name.strip()] = value.strip()
+    msg["From"] = sender
+    msg["To"] = message["to"]
+    msg["Message-ID"] = f"<{message['message_id']}@ai-scheduler.local>"
+    msg.set_content(text)
+    for path in message["attachments"]:
+        ctype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        maintype, subtype = ctype.split("/", 1)
+        with open(path, "rb") as f:
+            msg.add_attachment(f.read(), maintype=maintype, subtype=subtype, filename=os.path.basename(path))
+    return msg
+
+
+class FileOutboxTransport:
+    """Writes each message to `directory` as a .txt file named after its message id."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def send(self, message: dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        to = message["to"].replace("@", "_at_")
+        fname = os.path.join(self.directory, f"{message['message_id']}_{to}.txt")
+        with span("email.send[outbox]") as s, open(fname, "w", encoding="utf-8") as f:
+            f.write(message["body"])
+            if message["attachments"]:
+                f.write("\n\nAttachments:\n")
+                for a in message["attachments"]:
+                    f.write(f"- {a}\n")
+            s.nbytes = f.tell()
+        return fname
+
+    def close(self):
+        pass
+
+
+class SmtpTransport:
+    """Sends over SMTP, reusing up to `pool_size` open connections across threads."""
+
+    def __init__(self, host: str, port: int = 25, sender: str = "clinic@example.com", pool_size: int = 4,
+                 timeout: float = 10.0, starttls: bool = False, username: str = None, password: str = None):
+        self.host, self.port, self.sender = host, port, sender
+        self.timeout, self.starttls = timeout, starttls
+        self.username, self.password = username, password
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    def send(self, message: dict) -> str:
+        msg = to_email_message(message, self.sender)
+        with span("email.send[smtp]") as s, self._slots:
+            if s:
+                s.nbytes = len(msg.as_bytes())
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            try:
+                _send_on(conn, msg)
+            except smtplib.SMTPServerDisconnected:
+                if not reused:
+                    raise
+                # The pooled connection went stale; retry once on a fresh one.
+                conn = self._connect()
+                _send_on(conn, msg)
+            self._idle.put(conn)
+        return msg["Message-ID"]
+
+    def close(self):
+        while True:
+            try:
+                _quit(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _send_on(conn, msg):
+    try:
+        conn.send_message(msg)
+    except Exception:
+        _quit(conn)
+        raise
+
+
+def _quit(conn):
+    try:
+        conn.quit()
+    except (smtplib.SMTPException, OSError):
+        conn.close()
+
+
+class DeliveryQueue:
+    """Bounded send queue drained by a pool of threads.
+
+    `enqueue` returns as soon as the message is queued; when `max_pending`
+    messages are waiting it blocks (or raises `queue.Full` after `timeout`),
+    which pushes back on producers instead of growing without bound. Failed
+    sends are retried with exponential backoff and end up in `failed`.
+    """
+
+    def __init__(self, transport, workers: int = 4, max_pending: int = 1000, retries: int = 3,
+                 backoff: float = 0.5):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, daemon=True, name=f"delivery-{i}")
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def enqueue(self, message: dict, block: bool = True, timeout: float = None) -> str:
+        self._queue.put(message, block=block, timeout=timeout)
+        return message["message_id"]
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self):
+        """Wait until every queued message has been sent or given up on."""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self.transport.close()
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            try:
+                if message is None:
+                    return
+                self._deliver(message)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, message):
+        for attempt in range(self.retries + 1):
+            try:
+                self.transport.send(message)
+            except Exception as e:
+                if attempt == self.retries:
+                    log.error("Giving up on %s to %s: %s", message["message_id"], message["to"], e)
+                    with self._lock:
+                        self.failed.append((message, repr(e)))
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                with self._lock:
+                    self.sent += 1
+                return
+
+
+def transport_from_env(outbox_dir: str):
+    """Transport chosen by SCHEDULER_EMAIL_TRANSPORT ("outbox" by default, or "smtp")."""
+    kind = os.environ.get("SCHEDULER_EMAIL_TRANSPORT", "outbox")
+    if kind == "outbox":
+        return FileOutboxTransport(outbox_dir)
+    if kind == "smtp":
+        return SmtpTransport(
+            os.environ.get("SMTP_HOST", "localhost"),
+            int(os.environ.get("SMTP_PORT", "25")),
+            sender=os.environ.get("SMTP_FROM", "clinic@example.com"),
+            pool_size=int(os.environ.get("SMTP_POOL_SIZE", "4")),
+            starttls=os.environ.get("SMTP_STARTTLS", "") == "1",
+            username=os.environ.get("SMTP_USERNAME"),
+            password=os.environ.get("SMTP_PASSWORD"),
+        )
+    raise ValueError(f"Unknown email transport {kind!r} (expected 'outbox' or 'smtp')")
+
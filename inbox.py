@@ -0,0 +1,330 @@
+"""Ingest patients' replies to reminders from an inbox directory.
+
+The inbox is a local stand-in for a mail provider: each file in it is one
+received email (RFC 822, e.g. `.eml`). A reply is tied to its reminder by
+the "Reference: <appointment_id>/<reminder_number>" line every reminder ends
+with (replies quote it), and answers the reminder's questions in its own,
+unquoted text: YES/NO (intake forms filled), CONFIRM/CANCEL (the visit) and
+a reason after CANCEL.
+
+    python inbox.py                 # process what is in SCHEDULER_INBOX now
+    python inbox.py --watch         # keep polling the inbox
+
+Replies are parsed in bulk and applied a batch at a time: one `update_reminders`
+call for the answers (SQLite finds each row through the reminders'
+appointment index; the CSV file is rewritten once per batch, not per reply),
+one `update_appointments` call for confirmations, and one
+`booking.cancel_appointments` call for cancellations, which frees the slots
+and offers them to the waitlist. A reply is only applied if it comes from
+the address its reminder was sent to (the reminder row's `email`, or the
+patient record's for reminders stored without one), since the reference
+alone is easy to guess. Processed files move to `processed/`,
+and replies that can't be read (no reference, no answer) or come from
+another sender to `unparsed/` for a human to look at.
+
+Ingestion is idempotent: the Message-ID of every applied reply is recorded
+in the inbox's `.processed_ids` file, and a re-delivered copy is skipped.
+The ids are recorded after the batch is applied, so a crash in between
+re-applies the batch on the next run -- which sets the same values again.
+"""
+import argparse
+import email
+import hashlib
+import os
+import re
+import threading
+import time
+from email.utils import parseaddr, parsedate_to_datetime
+
+import data_loader
+from booking import ACTIVE_STATUSES, CONFIRMED_STATUS, cancel_appointments
+from data_loader import (find_appointments, find_patients, find_reminders, get_backend, update_appointments,
+                         update_reminders)
+from metrics import span, timed
+from storage import file_lock
+
+INBOX_DIR = os.environ.get("SCHEDULER_INBOX", os.path.join(os.path.dirname(__file__), "inbox"))
+PROCESSED_DIR = "processed"
+UNPARSED_DIR = "unparsed"
+LEDGER = ".processed_ids"
+
+YES, NO = "yes", "no"
+REASON_MAX_CHARS = 200
+
+_REFERENCE = re.compile(r"Reference:\s*([A-Za-z0-9_.-]+)/(\d+)")
+# Where the quoted original starts in a reply.
+_QUOTE_START = re.compile(r"^\s*(>|On .* wrote:\s*$|-+\s*Original Message\s*-+|From:\s)", re.IGNORECASE)
+_FORMS = re.compile(r"\bFORMS?\W*(YES|NO)\b", re.IGNORECASE)
+_YES_NO = re.compile(r"\b(YES|NO)\b", re.IGNORECASE)
+_VISIT = re.compile(r"\bVISIT\W*(CONFIRM|CANCEL)", re.IGNORECASE)
+_CONFIRM = re.compile(r"\bCONFIRM(?:ED|ING)?\b", re.IGNORECASE)
+_CANCEL = re.compile(r"\bCANCEL(?:L?ED|L?ING|LATION)?\b", re.IGNORECASE)
+_REASON_PREFIX = re.compile(r"^[\s\W]*(?:(?:reason|because)\b[\s:,-]*)?", re.IGNORECASE)
+_REASON_SUFFIX = re.compile(r"[\s,;-]*(?:please|thanks|thank you)?[\s.!]*$", re.IGNORECASE)
+_ANSWERS = re.compile(r"^[\s\W]*(?:(?:forms?|visit)\W*)?(?:yes|no|confirm\w*)\b", re.IGNORECASE)
+_TAGS = re.compile(r"<[^>]+>")
+_MESSAGE_ID = re.compile(rb"^Message-ID:[ \t]*(\S[^\r\n]*?)[ \t]*\r?$", re.IGNORECASE | re.MULTILINE)
+
+
+def message_id(raw: bytes) -> str:
+    """The Message-ID header of a raw email (without parsing the rest), else a hash of the message."""
+    end = min((i for i in (raw.find(b"\n\n"), raw.find(b"\n\r\n")) if i >= 0), default=len(raw))
+    match = _MESSAGE_ID.search(raw, 0, end)
+    if match:
+        return match.group(1).decode("ascii", errors="replace")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _text(message) -> str:
+    """The plain-text body of a message (the first text/plain part, else text/html without tags)."""
+    html = None
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        ctype = part.get_content_type()
+        if ctype not in ("text/plain", "text/html"):
+            continue
+        payload = part.get_payload(decode=True) or b""
+        text = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+        if ctype == "text/plain":
+            return text
+        html = html or _TAGS.sub(" ", text)
+    return html or ""
+
+
+def _own_text(body: str) -> str:
+    """The reply's own lines, up to where it starts quoting the original."""
+    lines = []
+    for line in body.splitlines():
+        if _QUOTE_START.match(line):
+            break
+        lines.append(line)
+    return " ".join(" ".join(lines).split())
+
+
+def _cancel_reason(text: str, match) -> str:
+    """What the patient wrote after CANCEL, or before it if nothing follows."""
+    reason = _REASON_SUFFIX.sub("", _REASON_PREFIX.sub("", text[match.end():]))
+    if not reason:
+        before = text[:match.start()]
+        while True:
+            stripped = _ANSWERS.sub("", before)
+            if stripped == before:
+                break
+            before = stripped
+        reason = _REASON_SUFFIX.sub("", _REASON_PREFIX.sub("", before))
+    return reason.strip(" ()[]")[:REASON_MAX_CHARS]
+
+
+def parse_answers(text: str) -> dict:
+    """The answers in a reply's own text: {"response_forms_filled", "response_confirmed", "response_cancel_reason"}.
+
+    Only questions that were answered unambiguously are included: "FORMS YES"
+    or a lone YES/NO for the forms, "VISIT CANCEL" or a lone CONFIRM/CANCEL
+    for the visit.
+    """
+    answers = {}
+    forms = _FORMS.search(text)
+    words = {m.upper() for m in _YES_NO.findall(text)}
+    if forms or len(words) == 1:
+        answers["response_forms_filled"] = (forms.group(1) if forms else words.pop()).lower()
+
+    visit = _VISIT.search(text)
+    confirm, cancel = _CONFIRM.search(text), _CANCEL.search(text)
+    if visit:
+        cancelled = visit.group(1).upper() == "CANCEL"
+        if cancelled:
+            cancel = _CANCEL.search(text, visit.start())
+    elif bool(confirm) != bool(cancel):
+        cancelled = bool(cancel)
+    else:
+        return answers
+    answers["response_confirmed"] = NO if cancelled else YES
+    answers["response_cancel_reason"] = _cancel_reason(text, cancel) if cancelled else ""
+    return answers
+
+
+def parse_reply(raw: bytes, received: float = 0.0):
+    """Parse one received email; returns a reply dict, or None if it names no reminder or answers nothing.
+
+    The dict holds "message_id", "received" (the Date header as a timestamp,
+    else `received`), "sender" (the From address, lowercased), "appointment_id",
+    "reminder_number" and the answers.
+    """
+    message = email.message_from_bytes(raw)
+    body = _text(message)
+    reference = _REFERENCE.search(body) or _REFERENCE.search(message.get("Subject", ""))
+    if reference is None:
+        return None
+    answers = parse_answers(_own_text(body))
+    if not answers:
+        return None
+    try:
+        received = parsedate_to_datetime(message["Date"]).timestamp()
+    except (TypeError, ValueError):
+        pass
+    return {"message_id": message_id(raw), "received": received, "sender": _address(message.get("From")),
+            "appointment_id": reference.group(1), "reminder_number": int(reference.group(2)), **answers}
+
+
+def _address(value) -> str:
+    return parseaddr(str(value or ""))[1].strip().lower()
+
+
+def _from_recipients(replies: list) -> tuple:
+    """Split replies into (those sent from their reminder's address, the rest).
+
+    Reminders stored without an address are checked against the email on
+    the appointment's patient record.
+    """
+    rows = find_reminders({r["appointment_id"] for r in replies})
+    sent_to = {(str(a), int(n)): _address(e) for a, n, e in
+               zip(rows["appointment_id"], rows["reminder_number"], rows["email"].fillna(""))}
+    unaddressed = {a for (a, _), e in sent_to.items() if not e}
+    if unaddressed:
+        appts = find_appointments(unaddressed)
+        patients = find_patients(appts["patient_id"].dropna())
+        emails = dict(zip(patients["patient_id"].astype(str), patients["email"].map(_address)))
+        on_file = {str(a): emails.get(str(p), "") for a, p in zip(appts["appointment_id"], appts["patient_id"])}
+        sent_to = {key: e or on_file.get(key[0], "") for key, e in sent_to.items()}
+    accepted, rejected = [], []
+    for reply in replies:
+        recipient = sent_to.get((reply["appointment_id"], reply["reminder_number"]))
+        ok = recipient and reply.get("sender") == recipient
+        (accepted if ok else rejected).append(reply)
+    return accepted, rejected
+
+
+def _load_ledger(path: str) -> set:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return set(f.read().splitlines())
+    except FileNotFoundError:
+        return set()
+
+
+def _move(paths, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for path in paths:
+        os.replace(path, os.path.join(directory, os.path.basename(path)))
+
+
+def apply_replies(replies: list, schedule_path=data_loader.SCHEDULE_CSV, notify=True) -> dict:
+    """Apply parsed replies (oldest first; a later answer overrides an earlier one) in bulk.
+
+    Replies whose sender is not the address their reminder went to are not
+    applied. Returns {"reminders": reminder rows updated, "confirmed":
+    [appointment ids], "cancelled": [appointment ids], "offers": [...],
+    "rejected": [replies not applied]}.
+    """
+    replies, rejected = _from_recipients(replies)
+    reminders, visits = {}, {}
+    for reply in replies:
+        key = (reply["appointment_id"], reply["reminder_number"])
+        answers = {k: v for k, v in reply.items() if k.startswith("response_")}
+        reminders.setdefault(key, {}).update(answers)
+        if "response_confirmed" in answers:
+            visits[reply["appointment_id"]] = answers["response_confirmed"]
+
+    # Cancel first: it locks the schedule before the tables, like booking does.
+    cancel_ids = [a for a, v in visits.items() if v == NO]
+    cancelled = (cancel_appointments(cancel_ids, schedule_path, notify=notify) if cancel_ids
+                 else {"cancelled": [], "offers": []})
+    with get_backend().transaction():
+        appts = find_appointments([a for a, v in visits.items() if v == YES])
+        status = dict(zip(appts["appointment_id"].astype(str), appts["status"]))
+        confirmed = [a for a, v in visits.items()
+                     if v == YES and status.get(a) in ACTIVE_STATUSES and status.get(a) != CONFIRMED_STATUS]
+        update_appointments([{"appointment_id": a, "status": CONFIRMED_STATUS} for a in confirmed])
+        update_reminders([{"appointment_id": a, "reminder_number": n, **answers}
+                          for (a, n), answers in reminders.items()])
+    return {"reminders": len(reminders), "confirmed": confirmed, **cancelled, "rejected": rejected}
+
+
+@timed("ingest_replies")
+def ingest_replies(inbox_dir: str = None, schedule_path=data_loader.SCHEDULE_CSV, batch_size: int = 20_000,
+                   notify=True) -> dict:
+    """Process every email waiting in the inbox, `batch_size` replies per bulk update.
+
+    Returns {"messages", "duplicates", "unparsed", "reminders", "confirmed",
+    "cancelled", "offers"} (the last three as counts).
+    """
+    inbox_dir = inbox_dir or INBOX_DIR
+    summary = {"messages": 0, "duplicates": 0, "unparsed": 0, "reminders": 0, "confirmed": 0, "cancelled": 0,
+               "offers": 0}
+    if not os.path.isdir(inbox_dir):
+        return summary
+    ledger_path = os.path.join(inbox_dir, LEDGER)
+    # One ingester at a time per inbox; bookings and cancellations go on meanwhile.
+    with file_lock(ledger_path):
+        seen = _load_ledger(ledger_path)
+        replies, duplicates, unparsed = [], [], []
+        with span("inbox.parse") as s:
+            for entry in os.scandir(inbox_dir):
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                with open(entry.path, "rb") as f:
+                    raw = f.read()
+                if message_id(raw) in seen:
+                    duplicates.append(entry.path)
+                    continue
+                reply = parse_reply(raw, entry.stat().st_mtime)
+                if reply is None:
+                    unparsed.append(entry.path)
+                elif reply["message_id"] in seen:
+                    duplicates.append(entry.path)
+                else:
+                    seen.add(reply["message_id"])
+                    reply["path"] = entry.path
+                    replies.append(reply)
+            summary.update(messages=len(replies) + len(duplicates) + len(unparsed), duplicates=len(duplicates),
+                           unparsed=len(unparsed))
+            s.rows = summary["messages"]
+        replies.sort(key=lambda r: r["received"])
+
+        _move(unparsed, os.path.join(inbox_dir, UNPARSED_DIR))
+        _move(duplicates, os.path.join(inbox_dir, PROCESSED_DIR))
+        for lo in range(0, len(replies), batch_size):
+            batch = replies[lo:lo + batch_size]
+            result = apply_replies(batch, schedule_path, notify)
+            rejected = {r["path"] for r in result["rejected"]}
+            applied = [r for r in batch if r["path"] not in rejected]
+            with open(ledger_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{r['message_id']}\n" for r in applied))
+            _move([r["path"] for r in applied], os.path.join(inbox_dir, PROCESSED_DIR))
+            _move(sorted(rejected), os.path.join(inbox_dir, UNPARSED_DIR))
+            summary["unparsed"] += len(rejected)
+            summary["reminders"] += result["reminders"]
+            for key in ("confirmed", "cancelled", "offers"):
+                summary[key] += len(result[key])
+    return summary
+
+
+def watch(inbox_dir: str = None, interval: float = 30.0, stop: threading.Event = None, **kwargs):
+    """Ingest replies every `interval` seconds until `stop` is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        ingest_replies(inbox_dir, **kwargs)
+        stop.wait(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply patients' replies to reminders from the inbox directory.")
+    parser.add_argument("inbox", nargs="?", default=INBOX_DIR, help="directory of received emails")
+    parser.add_argument("--batch-size", type=int, default=20_000, help="replies applied per bulk update")
+    parser.add_argument("--watch", action="store_true", help="keep polling the inbox")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between polls with --watch")
+    args = parser.parse_args(argv)
+    if args.watch:
+        watch(args.inbox, args.interval, batch_size=args.batch_size)
+        return
+    t0 = time.perf_counter()
+    summary = ingest_replies(args.inbox, batch_size=args.batch_size)
+    print(f"{summary['messages']} messages in {time.perf_counter() - t0:.1f}s: {summary['reminders']} reminders "
+          f"updated, {summary['confirmed']} confirmed, {summary['cancelled']} cancelled "
+          f"({summary['offers']} waitlist offers), {summary['duplicates']} duplicates, "
+          f"{summary['unparsed']} unparsed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,182 @@
+import atexit
+import logging
 import os
+import string
+import threading
+import time
 from datetime import datetime, timedelta
 import pandas as pd
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+from data_loader import claim_due_reminders, complete_reminders, save_reminders
+from delivery import DeliveryQueue, new_message, transport_from_env
+from metrics import timed
+
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
-OUTBOX_DIR = os.path.join(os.path.dirname(__file__), "outbox")
+OUTBOX_DIR = os.environ.get("SCHEDULER_OUTBOX", os.path.join(os.path.dirname(__file__), "outbox"))
+
+REMINDER_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# How long a worker may hold claimed reminders before others can take them over.
+REMINDER_LEASE_SECONDS = 300
+# A worker starts no send with less than this left on its lease (at most half
+# the lease), so each send is recorded before anyone else may claim the reminder.
+REMINDER_SEND_SECONDS = 30
+
+# "Reference: <appointment_id>/<reminder_number>" at the foot of a reminder ties
+# a patient's reply (which quotes it) back to the reminder (see inbox.py).
+REFERENCE_FORMAT = "{appointment_id}/{reminder_number}"
+
+log = logging.getLogger(__name__)
+
+class MissingPlaceholdersError(KeyError):
+    """Raised before rendering when contexts lack fields the template uses.
+
+    `missing` maps the index of each incomplete context to the sorted names
+    it lacks.
+    """
+
+    def __init__(self, template_name: str, missing: dict):
+        super().__init__(f"{template_name}: missing placeholders {missing}")
+        self.template_name = template_name
+        self.missing = missing
+
+class CompiledTemplate:
+    """Template text plus the placeholder names it uses, parsed once."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.fields = frozenset(
+            field.split(".")[0].split("[")[0]
+            for _, field, _, _ in string.Formatter().parse(text) if field
+        )
+
+    def missing(self, context: dict) -> list:
+        return sorted(self.fields.difference(context))
+
+    def render(self, context: dict) -> str:
+        return self.text.format_map(context)
+
+class TemplateRegistry:
+    """All templates in a directory, loaded once and reloaded when their mtime changes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def __contains__(self, template_name: str) -> bool:
+        return os.path.isfile(os.path.join(self.directory, template_name))
+
+    def load_all(self):
+        """Parse every template in the directory (e.g. at startup)."""
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".txt"):
+                self.get(name)
+
+    def get(self, template_name: str) -> CompiledTemplate:
+        path = os.path.join(self.directory, template_name)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._templates.get(template_name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            compiled = CompiledTemplate(template_name, f.read())
+        with self._lock:
+            self._templates[template_name] = (mtime, compiled)
+            self.loads += 1
+        return compiled
+
+    def missing_placeholders(self, template_name: str, contexts) -> dict:
+        """Map the index of each context that lacks fields to the names it lacks."""
+        return _missing(self.get(template_name), contexts)
+
+    def render(self, template_name: str, context: dict) -> str:
+        return self.render_many(template_name, [context])[0]
+
+    def render_many(self, template_name: str, contexts) -> list:
+        """Render one template for many contexts.
+
+        Every context is checked first, so a batch either renders completely
+        or raises `MissingPlaceholdersError` naming all the gaps.
+        """
+        contexts = list(contexts)
+        template = self.get(template_name)
+        missing = _missing(template, contexts)
+        if missing:
+            raise MissingPlaceholdersError(template_name, missing)
+        return [template.render(c) for c in contexts]
 
-REMINDERS_CSV = os.path.join(DATA_DIR, "reminders.csv")
+def _missing(template: CompiledTemplate, contexts) -> dict:
+    missing = {}
+    for i, context in enumerate(contexts):
+        names = template.missing(context)
+        if names:
+            missing[i] = names
+    return missing
+
+TEMPLATES = TemplateRegistry(TEMPLATES_DIR)
 
 def render_template(template_name: str, context: dict):
-    with open(os.path.join(TEMPLATES_DIR, template_name), "r", encoding="utf-8") as f:
-        content = f.read()
-    return content.format(**context)
-
-def _write_outbox(to_email: str, subject_and_body: str, attachments=None):
-    os.makedirs(OUTBOX_DIR, exist_ok=True)
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    fname = os.path.join(OUTBOX_DIR, f"{ts}_{to_email.replace('@','_at_')}.txt")
-    with open(fname, "w", encoding="utf-8") as f:
-        f.write(subject_and_body)
-        if attachments:
-            f.write("\n\nAttachments:\n")
-            for a in attachments:
-                f.write(f"- {a}\n")
-    return fname
+    return TEMPLATES.render(template_name, context)
+
+def render_many(template_name: str, contexts) -> list:
+    return TEMPLATES.render_many(template_name, contexts)
+
+_transports = {}
+_queues = {}
+_delivery_lock = threading.Lock()
+
+def _delivery_key():
+    return os.environ.get("SCHEDULER_EMAIL_TRANSPORT", "outbox"), OUTBOX_DIR
+
+def get_transport():
+    """Configured email transport (see `delivery.transport_from_env`), shared per process."""
+    key = _delivery_key()
+    with _delivery_lock:
+        if key not in _transports:
+            _transports[key] = transport_from_env(OUTBOX_DIR)
+        return _transports[key]
 
+def get_delivery_queue() -> DeliveryQueue:
+    """Process-wide background send queue, drained at exit."""
+    transport = get_transport()
+    key = _delivery_key()
+    with _delivery_lock:
+        if key not in _queues:
+            _queues[key] = DeliveryQueue(transport)
+            atexit.register(_queues[key].close)
+        return _queues[key]
+
+def deliver_now(to_email: str, subject_and_body: str, attachments=None):
+    """Send synchronously through the configured transport."""
+    return get_transport().send(new_message(to_email, subject_and_body, attachments))
+
+def _attachments(attach_form: bool) -> list:
+    form_path = os.path.join(os.path.dirname(__file__), "forms", "New Patient Intake Form.pdf")
+    return [form_path] if attach_form and os.path.exists(form_path) else []
+
+@timed("simulate_email")
 def simulate_email(to_email: str, template: str, context: dict, attach_form: bool=False):
+    """Render a template and queue it for background delivery; returns the message id."""
     body = render_template(template, context)
-    attachments = []
-    if attach_form:
-        form_path = os.path.join(os.path.dirname(__file__), "forms", "New Patient Intake Form.pdf")
-        if os.path.exists(form_path):
-            attachments.append(form_path)
-    return _write_outbox(to_email, body, attachments=attachments)
+    attachments = _attachments(attach_form)
+    return get_delivery_queue().enqueue(new_message(to_email, body, attachments))
 
+def send_emails(template: str, recipients: list, contexts: list, attach_form: bool = False) -> list:
+    """Render one template for many recipients in a batch and queue the emails; returns message ids."""
+    bodies = render_many(template, contexts)
+    attachments = _attachments(attach_form)
+    queue = get_delivery_queue()
+    return [queue.enqueue(new_message(to, body, attachments)) for to, body in zip(recipients, bodies)]
+
+@timed("schedule_reminders")
 def schedule_reminders_for_appointment(appt_id: str, first_name: str, doctor_name: str, slot_dt, to_email: str):
+    save_reminders(reminder_rows(appt_id, first_name, doctor_name, slot_dt, to_email))
+
+def reminder_rows(appt_id: str, first_name: str, doctor_name: str, slot_dt, to_email: str) -> list:
+    """The reminder rows for one appointment (not saved)."""
     # Reminder schedule: 72h, 24h, 2h before
     plan = [72, 24, 2]
     rows = []
@@ -42,34 +184,115 @@ def schedule_reminders_for_appointment(appt_id: str, first_name: str, doctor_nam
         when = slot_dt - timedelta(hours=hrs)
         rows.append({
             "appointment_id": appt_id,
+            "patient_name": first_name,
+            "doctor_name": doctor_name,
+            "email": to_email,
+            "slot_start": slot_dt.strftime(REMINDER_TIME_FORMAT),
             "reminder_number": i,
-            "scheduled_for": when.strftime("%Y-%m-%d %H:%M"),
+            "scheduled_for": when.strftime(REMINDER_TIME_FORMAT),
             "sent_at": "",
             "channel": "email",
             "response_forms_filled": "",
             "response_confirmed": "",
             "response_cancel_reason": ""
         })
-    df_new = pd.DataFrame(rows)
-    if os.path.exists(REMINDERS_CSV):
-        old = pd.read_csv(REMINDERS_CSV)
-        out = pd.concat([old, df_new], ignore_index=True)
-    else:
-        out = df_new
-    out.to_csv(REMINDERS_CSV, index=False)
+    return rows
 
-def run_due_reminders() -> int:
-    if not os.path.exists(REMINDERS_CSV):
-        return 0
-    df = pd.read_csv(REMINDERS_CSV)
-    now = datetime.now()
+def _reminder_context(row) -> dict:
+    """Template fields available from a reminder row (blank columns are left out)."""
+    context = {"reference": REFERENCE_FORMAT.format(appointment_id=row["appointment_id"],
+                                                    reminder_number=int(row["reminder_number"]))}
+    for field, column in (("first_name", "patient_name"), ("doctor_name", "doctor_name")):
+        if not pd.isna(row.get(column)) and row.get(column) != "":
+            context[field] = row[column]
+    if not pd.isna(row.get("slot_start")) and row.get("slot_start") != "":
+        slot_dt = pd.Timestamp(row["slot_start"])
+        context["slot_date"] = slot_dt.strftime("%b %d, %Y")
+        context["slot_time"] = slot_dt.strftime("%I:%M %p")
+    return context
+
+def render_reminders(rows: list) -> list:
+    """Render the email body for each reminder row, one template batch per reminder number.
+
+    Rows without a template for their number, or without the details their
+    template needs (e.g. scheduled before those were stored), get a generic
+    reminder instead.
+    """
+    bodies = [None] * len(rows)
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(int(row["reminder_number"]), []).append(i)
+    for number, positions in groups.items():
+        name = f"email_reminder_{number}.txt"
+        if name not in TEMPLATES:
+            continue
+        contexts = [_reminder_context(rows[i]) for i in positions]
+        missing = TEMPLATES.missing_placeholders(name, contexts)
+        if missing:
+            log.warning("%d reminders lack fields for %s (%s); sending generic text",
+                        len(missing), name, sorted({f for names in missing.values() for f in names}))
+        ready = [k for k in range(len(positions)) if k not in missing]
+        for k, body in zip(ready, TEMPLATES.render_many(name, [contexts[k] for k in ready])):
+            bodies[positions[k]] = body
+    return [
+        body or f"Subject: Reminder #{row['reminder_number']}\n\nThis is an automated reminder."
+        for row, body in zip(rows, bodies)
+    ]
+
+def send_reminder(row, body: str = None) -> dict:
+    """Send one reminder row and return the update that marks it as sent."""
+    if body is None:
+        body = render_reminders([row])[0]
+    to_email = row.get("email")
+    deliver_now(to_email if isinstance(to_email, str) and to_email else "patient@example.com", body)
+    return {
+        "appointment_id": row["appointment_id"],
+        "reminder_number": row["reminder_number"],
+        "sent_at": datetime.now().strftime(REMINDER_TIME_FORMAT),
+    }
+
+@timed("dispatch_due")
+def dispatch_due(worker_id: str, now=None, batch_size: int = 100,
+                 lease_seconds: float = REMINDER_LEASE_SECONDS) -> int:
+    """Claim, send and complete due reminders in batches until none are left.
+
+    Claims are leases, so several workers (or the admin button) can run this
+    at the same time, and reminders leased by a worker that died are picked
+    up again once the lease expires. Leases fence the sends: a worker starts
+    no send with less than `REMINDER_SEND_SECONDS` left on its lease, leaving
+    the rest of the batch to the next claim, and a send is only recorded
+    while the lease still holds. A reminder goes out twice only if one send
+    outlasts that reserve (or the worker dies between sending and recording).
+    """
+    started = time.monotonic()
+
+    def clock():
+        if now is None:
+            return datetime.now()
+        # A given `now` moves on with the time spent here, so it stays comparable with the leases.
+        return now + timedelta(seconds=time.monotonic() - started)
+
+    reserve = timedelta(seconds=min(REMINDER_SEND_SECONDS, lease_seconds / 2))
     sent = 0
-    for idx, row in df.iterrows():
-        if not row["sent_at"] and datetime.strptime(row["scheduled_for"], "%Y-%m-%d %H:%M") <= now:
-            # simulates messaging
-            content = f"Subject: Reminder #{row['reminder_number']}\n\nThis is an automated reminder."
-            _write_outbox("patient@example.com", content)
-            df.loc[idx, "sent_at"] = now.strftime("%Y-%m-%d %H:%M")
-            sent += 1
-    df.to_csv(REMINDERS_CSV, index=False)
-    return sent
+    while True:
+        claimed_at = clock()
+        batch = claim_due_reminders(worker_id, claimed_at, lease_seconds, batch_size)
+        if batch.empty:
+            return sent
+        last_start = claimed_at + timedelta(seconds=lease_seconds) - reserve
+        rows = batch.to_dict("records")
+        updates = []
+        try:
+            for row, body in zip(rows, render_reminders(rows)):
+                if clock() >= last_start:
+                    log.warning("%s: lease on %d reminders runs out; leaving them to the next claim",
+                                worker_id, len(rows) - len(updates))
+                    break
+                updates.append(send_reminder(row, body))
+        finally:
+            sent += complete_reminders(worker_id, updates, clock())
+        if len(updates) < batch_size:
+            return sent
+
+def run_due_reminders() -> int:
+    return dispatch_due(f"admin-{os.getpid()}")
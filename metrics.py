@@ -0,0 +1,216 @@
+"""Per-stage latency, row and byte counters for the booking pipeline.
+
+Off by default (set SCHEDULER_METRICS=1 or call `enable()`). When off,
+`timed` wrappers and `span` cost one flag check; nothing is recorded.
+
+    @timed("book_slot")
+    def book_slot(...): ...
+
+    with span("csv.write[appointments.csv]") as s:
+        ...
+        s.rows = len(df)
+        if s:                       # only pay for extra stats when recording
+            s.nbytes = os.path.getsize(tmp)
+
+Latencies go into fixed log-scale buckets (Prometheus-style histograms),
+from which p50/p95/p99 are interpolated. `write_prometheus` writes the
+node_exporter text-file format; counters are per process.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+
+METRICS_FILE = os.environ.get(
+    "SCHEDULER_METRICS_FILE", os.path.join(os.path.dirname(__file__), "exports", "scheduler_metrics.prom"))
+
+# Upper bounds in seconds: 50us doubling up to ~52s.
+BUCKETS = tuple(0.00005 * 2 ** i for i in range(21))
+
+_enabled = os.environ.get("SCHEDULER_METRICS", "").lower() in ("1", "true", "yes")
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+class StageStats:
+    """Histogram of one stage's latencies plus its row/byte/error counters."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.nbytes = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, rows: int = 0, nbytes: int = 0, error: bool = False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.nbytes += nbytes
+        self.errors += error
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = BUCKETS[i - 1] if i else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class Metrics:
+    """Thread-safe registry of `StageStats` by stage name."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, rows: int = 0, nbytes: int = 0, error: bool = False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.observe(seconds, rows, nbytes, error)
+
+    def stage(self, stage: str):
+        return self._stages.get(stage)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def summary(self) -> list:
+        """One dict per stage (sorted by name): count, p50/p95/p99/max in ms, rows, bytes, errors."""
+        with self._lock:
+            items = sorted(self._stages.items())
+            return [{
+                "stage": name,
+                "count": s.count,
+                "p50_ms": s.quantile(0.50) * 1e3,
+                "p95_ms": s.quantile(0.95) * 1e3,
+                "p99_ms": s.quantile(0.99) * 1e3,
+                "max_ms": s.max * 1e3,
+                "rows": s.rows,
+                "bytes": s.nbytes,
+                "errors": s.errors,
+            } for name, s in items]
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP scheduler_stage_seconds Time spent in each booking pipeline stage.",
+            "# TYPE scheduler_stage_seconds histogram",
+        ]
+        counters = {"rows": [], "bytes": [], "errors": []}
+        with self._lock:
+            for name, s in sorted(self._stages.items()):
+                label = 'stage="%s"' % name.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), s.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'scheduler_stage_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"scheduler_stage_seconds_sum{{{label}}} {s.total!r}")
+                lines.append(f"scheduler_stage_seconds_count{{{label}}} {s.count}")
+                counters["rows"].append(f"scheduler_stage_rows_total{{{label}}} {s.rows}")
+                counters["bytes"].append(f"scheduler_stage_bytes_written_total{{{label}}} {s.nbytes}")
+                counters["errors"].append(f"scheduler_stage_errors_total{{{label}}} {s.errors}")
+        for kind, help_text, name in (
+                ("rows", "Rows read or written by each stage.", "scheduler_stage_rows_total"),
+                ("bytes", "Bytes written by each stage.", "scheduler_stage_bytes_written_total"),
+                ("errors", "Stage calls that raised.", "scheduler_stage_errors_total")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"] + counters[kind]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class Span:
+    """Times a `with` block; set `rows` / `nbytes` inside it to count them."""
+
+    __slots__ = ("stage", "rows", "nbytes", "_t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.rows = 0
+        self.nbytes = 0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        METRICS.observe(self.stage, time.perf_counter() - self._t0, self.rows, self.nbytes, exc_type is not None)
+        return False
+
+
+class _NullSpan:
+    """Shared stand-in while metrics are off: falsy, and ignores everything set on it."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage: str):
+    """Context manager timing a block as `stage` (a no-op while metrics are off)."""
+    return Span(stage) if _enabled else _NULL_SPAN
+
+
+def timed(stage: str):
+    """Decorator timing every call of the function as `stage`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary() -> list:
+    return METRICS.summary()
+
+
+def write_prometheus(path: str = None) -> str:
+    """Write the metrics in Prometheus text format (atomically, for the node_exporter textfile collector)."""
+    path = path or METRICS_FILE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(METRICS.to_prometheus())
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,110 @@
+import re
+import unicodedata
+from datetime import datetime
+
+import pandas as pd
+
+# Minimum trigram similarity (Jaccard) for a fuzzy match on the full name.
+FUZZY_THRESHOLD = 0.5
+
+_DOB_FORMATS = ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%Y/%m/%d")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_name(name) -> str:
+    """Case-, accent- and punctuation-insensitive form of a name ("  O'Brién " -> "obrien")."""
+    if name is None or (isinstance(name, float) and name != name):
+        return ""
+    text = str(name)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_PUNCTUATION.sub("", text.casefold()).split())
+
+
+def normalize_dob(dob) -> str:
+    """DOB as YYYY-MM-DD where it can be parsed, else the stripped text."""
+    if hasattr(dob, "strftime"):
+        return dob.strftime("%Y-%m-%d")
+    text = "" if dob is None or (isinstance(dob, float) and dob != dob) else str(dob).strip()
+    if _ISO_DATE.fullmatch(text):
+        return text
+    for fmt in _DOB_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return text
+
+
+def patient_key(first, last, dob) -> tuple:
+    return normalize_name(first), normalize_name(last), normalize_dob(dob)
+
+
+def patient_lookup_key(first, last, dob) -> str:
+    """`patient_key` as one string, for stores that index it in a column."""
+    return "|".join(patient_key(first, last, dob))
+
+
+def trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class PatientIndex:
+    """Patients hashed by normalized (first, last, dob), with a fuzzy fallback.
+
+    Exact lookups are one dict probe. For fuzzy matching, patients are also
+    bucketed by DOB, so a typo in the name is only compared (by name
+    trigrams) against people born on the same day.
+    `version` records which state of the store the index reflects.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self._exact = {}
+        self._by_dob = {}
+
+    @classmethod
+    def from_frame(cls, patients: pd.DataFrame, version=None) -> "PatientIndex":
+        index = cls(version)
+        for record in patients.to_dict("records"):
+            index.add(record)
+        return index
+
+    def __len__(self):
+        return len(self._exact)
+
+    def add(self, record: dict):
+        """Index a patient record (the first record wins for duplicate keys)."""
+        key = patient_key(record.get("first_name"), record.get("last_name"), record.get("dob"))
+        if key in self._exact:
+            return
+        self._exact[key] = record
+        self._by_dob.setdefault(key[2], []).append((f"{key[0]} {key[1]}", record))
+
+    def get(self, first, last, dob):
+        """Exact (normalized) match, or None."""
+        return self._exact.get(patient_key(first, last, dob))
+
+    def search(self, first, last, dob, threshold: float = FUZZY_THRESHOLD, limit: int = 5) -> list:
+        """(similarity, record) pairs with the same DOB and a similar name, best first."""
+        first, last, dob = patient_key(first, last, dob)
+        query = trigrams(f"{first} {last}")
+        scored = []
+        for name, record in self._by_dob.get(dob, ()):
+            grams = trigrams(name)
+            score = len(query & grams) / len(query | grams)
+            if score >= threshold:
+                scored.append((score, record))
+        scored.sort(key=lambda pair: -pair[0])
+        return scored[:limit]
+
+    def match(self, first, last, dob, fuzzy: bool = False):
+        """Exact match, else (with `fuzzy`) the most similar patient with the same DOB."""
+        record = self.get(first, last, dob)
+        if record is None and fuzzy:
+            best = self.search(first, last, dob, limit=1)
+            record = best[0][1] if best else None
+        return record
@@ -0,0 +1,127 @@
+import argparse
+import heapq
+import os
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from data_loader import get_backend
+from messaging import REMINDER_LEASE_SECONDS, REMINDER_TIME_FORMAT, TEMPLATES, dispatch_due
+
+
+class ReminderDispatcher:
+    """Send reminders as they fall due, keeping the pending ones in a min-heap.
+
+    New reminders are pulled from the store incrementally
+    (`pending_reminders_since`) and the heap tells the worker how long it can
+    sleep, and whether there is anything to claim at all. Due reminders are
+    claimed with leases (`messaging.dispatch_due`), so any number of
+    dispatchers can run side by side.
+
+    Leases fence the sends (see `dispatch_due`): a worker stops sending
+    before its lease runs out and only records sends while it still holds
+    the lease, so a reminder is sent twice only if a single send outlasts
+    `messaging.REMINDER_SEND_SECONDS` or the worker dies between sending
+    and recording it.
+    """
+
+    def __init__(self, batch_size: int = 100, poll_interval: float = 30.0, worker_id: str = None,
+                 lease_seconds: float = REMINDER_LEASE_SECONDS):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self._heap = []
+        self._queued = {}
+        self._cursor = None
+        self._sweep_at = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def refresh(self) -> int:
+        """Queue reminders added (or rescheduled) in the store since the last refresh.
+
+        A rescheduled reminder is queued again at its new time; its old heap
+        entry stays and at worst causes one claim that finds nothing.
+        """
+        rows, self._cursor = get_backend().pending_reminders_since(self._cursor)
+        added = 0
+        for row in rows.to_dict("records"):
+            key = (row["appointment_id"], int(row["reminder_number"]))
+            if self._queued.get(key) == row["scheduled_for"]:
+                continue
+            self._queued[key] = row["scheduled_for"]
+            heapq.heappush(self._heap, (row["scheduled_for"], key))
+            added += 1
+        return added
+
+    def next_due(self):
+        """When the earliest queued reminder is due, or None if nothing is queued."""
+        if not self._heap:
+            return None
+        return datetime.strptime(self._heap[0][0], REMINDER_TIME_FORMAT)
+
+    def run_once(self, now=None) -> int:
+        """Claim and send every reminder due at `now`, one persisted batch at a time.
+
+        The store is only asked for claims when a queued reminder is due, or
+        once per lease period so that reminders leased by a worker that died
+        are picked up again.
+        """
+        self.refresh()
+        now = now or datetime.now()
+        cutoff = now.strftime(REMINDER_TIME_FORMAT)
+        due = bool(self._heap) and self._heap[0][0] <= cutoff
+        if not due and self._sweep_at is not None and now < self._sweep_at:
+            return 0
+        sent = dispatch_due(self.worker_id, now, self.batch_size, self.lease_seconds)
+        self._sweep_at = now + timedelta(seconds=self.lease_seconds)
+        # Due entries were either sent here or claimed by another worker; a
+        # crashed worker's leases are picked up by a later tick's claim.
+        while self._heap and self._heap[0][0] <= cutoff:
+            scheduled_for, key = heapq.heappop(self._heap)
+            if self._queued.get(key) == scheduled_for:
+                del self._queued[key]
+        return sent
+
+    def run_forever(self):
+        """Dispatch until `stop()` is called, sleeping until the next reminder is due."""
+        while not self._stop.is_set():
+            self.run_once()
+            wait = self.poll_interval
+            due = self.next_due()
+            if due is not None:
+                wait = min(wait, max(0.0, (due - datetime.now()).total_seconds()))
+            self._stop.wait(wait)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the reminder dispatcher as a standalone worker.")
+    parser.add_argument("--batch-size", type=int, default=100, help="reminders sent per persisted batch")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="max seconds between checks for newly scheduled reminders")
+    parser.add_argument("--worker-id", help="name used for claims (default: host-pid)")
+    parser.add_argument("--lease-seconds", type=float, default=REMINDER_LEASE_SECONDS,
+                        help="how long claimed reminders stay reserved for this worker")
+    parser.add_argument("--once", action="store_true", help="send what is due now and exit")
+    args = parser.parse_args(argv)
+
+    TEMPLATES.load_all()
+    dispatcher = ReminderDispatcher(batch_size=args.batch_size, poll_interval=args.poll_interval,
+                                    worker_id=args.worker_id, lease_seconds=args.lease_seconds)
+    if args.once:
+        print(f"Sent {dispatcher.run_once()} due reminders.")
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: dispatcher.stop())
+    dispatcher.run_forever()
+
+
+if __name__ == "__main__":
+    main()
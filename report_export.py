@@ -0,0 +1,231 @@
+"""Streaming admin report export (CSV, XLSX or Parquet), filtered, in the background.
+
+Appointments are read `CHUNK_ROWS` at a time (`backend.iter_chunks`); the
+date, doctor and status filters are applied to each chunk (in the query on
+SQLite) and the chunk is written out before the next one is read, so memory
+stays flat however long the history is. XLSX is written with openpyxl's
+write-only mode; Parquet needs the optional pyarrow package.
+
+    job = start_export("xlsx", date_from=date(2030, 1, 1), doctor_ids=["D1"])
+    job.state, job.progress, job.rows, job.path, job.error
+
+Exports run one at a time on a background thread, so the app stays
+responsive; a failed export keeps its error on the job instead of being
+replaced by a different file.
+"""
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from data_loader import get_backend
+from metrics import span
+
+EXPORTS_DIR = os.environ.get("SCHEDULER_EXPORTS", os.path.join(os.path.dirname(__file__), "exports"))
+
+FORMATS = ("xlsx", "csv", "parquet")
+CHUNK_ROWS = 50_000
+# One sheet holds 1,048,576 rows including the header.
+XLSX_MAX_ROWS = 1_048_575
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+log = logging.getLogger(__name__)
+
+
+def report_filters(date_from=None, date_to=None, doctor_ids=None, statuses=None) -> dict:
+    """`iter_chunks` filters for appointments starting on [date_from, date_to] (inclusive dates)."""
+    filters = {}
+    if date_from is not None or date_to is not None:
+        filters["slot_start"] = (
+            pd.Timestamp(date_from).strftime("%Y-%m-%d") if date_from is not None else None,
+            (pd.Timestamp(date_to) + timedelta(days=1)).strftime("%Y-%m-%d") if date_to is not None else None,
+        )
+    if doctor_ids:
+        filters["doctor_id"] = list(doctor_ids)
+    if statuses:
+        filters["status"] = list(statuses)
+    return filters
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8", newline="")
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.f, index=False, header=self.header)
+        self.header = False
+
+    def close(self, columns):
+        if self.header:
+            pd.DataFrame(columns=columns).to_csv(self.f, index=False)
+        self.f.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.book = Workbook(write_only=True)
+        self.sheet = self.book.create_sheet("appointments")
+        self.header = True
+        self.rows = 0
+
+    def write(self, df):
+        self.rows += len(df)
+        if self.rows > XLSX_MAX_ROWS:
+            raise ValueError(f"More than {XLSX_MAX_ROWS} rows do not fit in an XLSX sheet; "
+                             f"narrow the filters or export CSV/Parquet")
+        if self.header:
+            self.sheet.append(list(df.columns))
+            self.header = False
+        for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def close(self, columns):
+        if self.header:
+            self.sheet.append(list(columns))
+        self.book.save(self.path)
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from e
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.writer = None
+
+    def _table(self, df):
+        # Chunks can infer different dtypes for the same column; text keeps one schema.
+        df = df.astype(object).where(df.notna(), None).astype("string")
+        schema = self.pa.schema([(c, self.pa.string()) for c in df.columns])
+        return self.pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    def write(self, df):
+        table = self._table(df)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self, columns):
+        if self.writer is None:
+            self.write(pd.DataFrame(columns=columns))
+        self.writer.close()
+
+
+_WRITERS = {"csv": _CsvWriter, "xlsx": _XlsxWriter, "parquet": _ParquetWriter}
+
+
+def export_appointments(path: str, fmt: str = None, filters: dict = None, chunk_rows: int = CHUNK_ROWS,
+                        on_progress=None) -> int:
+    """Stream the (filtered) appointments to `path`; returns the number of rows written.
+
+    `fmt` defaults to the file extension. `on_progress(fraction, rows)` is
+    called after every chunk. The file is written under a temporary name
+    and renamed into place, so a failed export leaves nothing behind.
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    rows = 0
+    columns = None
+    try:
+        with span(f"export.{fmt}") as s:
+            writer = _WRITERS[fmt](tmp)
+            for chunk, progress in get_backend().iter_chunks("appointments", chunk_rows, filters):
+                columns = list(chunk.columns)
+                if len(chunk):
+                    writer.write(chunk)
+                    rows += len(chunk)
+                if on_progress is not None:
+                    on_progress(progress, rows)
+            writer.close(columns or [])
+            s.rows = rows
+            if s:
+                s.nbytes = os.path.getsize(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return rows
+
+
+class ExportJob:
+    """State of one background export, updated by the worker as it goes."""
+
+    def __init__(self, job_id: str, path: str, fmt: str, filters: dict):
+        self.job_id = job_id
+        self.path = path
+        self.fmt = fmt
+        self.filters = filters
+        self.state = QUEUED
+        self.progress = 0.0
+        self.rows = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the export has finished (or failed); False on timeout."""
+        return self._done.wait(timeout)
+
+    def _update(self, progress, rows):
+        self.progress, self.rows = progress, rows
+
+    def run(self):
+        self.state, self.started = RUNNING, datetime.now()
+        try:
+            self.rows = export_appointments(self.path, self.fmt, self.filters, on_progress=self._update)
+            self.progress, self.state = 1.0, DONE
+        except Exception as e:
+            log.exception("Export %s failed", self.job_id)
+            self.error, self.state = f"{type(e).__name__}: {e}", FAILED
+        finally:
+            self.finished = datetime.now()
+            self._done.set()
+
+
+_JOBS = {}
+_job_ids = itertools.count(1)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _worker() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-export")
+        return _executor
+
+
+def start_export(fmt: str = "xlsx", directory: str = None, date_from=None, date_to=None, doctor_ids=None,
+                 statuses=None) -> ExportJob:
+    """Queue an export of the filtered appointments to `directory`; returns its `ExportJob`."""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    job_id = f"{datetime.now():%Y%m%d_%H%M%S}_{next(_job_ids)}"
+    path = os.path.join(directory or EXPORTS_DIR, f"admin_report_{job_id}.{fmt}")
+    job = ExportJob(job_id, path, fmt, report_filters(date_from, date_to, doctor_ids, statuses))
+    _JOBS[job_id] = job
+    _worker().submit(job.run)
+    return job
+
+
+def get_export(job_id: str):
+    """The `ExportJob` started with `job_id`, or None."""
+    return _JOBS.get(job_id)
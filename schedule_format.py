@@ -0,0 +1,218 @@
+"""Binary, memory-mapped schedule file (``*.slots``).
+
+Layout: an 8-byte magic, an 8-byte header length, a JSON header, then
+64-byte-aligned raw arrays (offsets in the header count from the first
+aligned byte after it), one row per slot, sorted by doctor and start:
+
+- ``start``: int64 minutes since the epoch
+- ``minutes``: int16 slot length
+- ``doctor``: int16 code into the header's doctor list
+- ``available``: packed bitset (bit i = row i, little-endian bit order)
+
+The header also stores where each doctor's rows begin, so one doctor (and
+a date range within it, by binary search on ``start``) can be read without
+touching the rest of the file. Files are opened with ``mmap``: arrays are
+views of the OS page cache, so several processes reading the same file
+share one copy. Writes go to a temp file that is renamed into place;
+bookings flip bits in place (`write_availability`).
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEDULE_COLUMNS = ["doctor_id", "doctor_name", "slot_start", "slot_end", "available"]
+# Every schedule row is one base slot; appointments are built from consecutive ones.
+BASE_SLOT_MINUTES = 30
+
+MAGIC = b"SLOTS01\n"
+_ALIGN = 64
+
+
+def is_binary_schedule(path: str) -> bool:
+    return path.endswith(".slots")
+
+
+def write_schedule(path: str, doctors: list, codes, starts, minutes, available) -> int:
+    """Write rows sorted by (doctor code, start); `doctors` is a list of (doctor_id, doctor_name).
+
+    Returns the file size in bytes.
+    """
+    codes = np.asarray(codes, dtype=np.int16)
+    starts = np.asarray(starts, dtype=np.int64)
+    arrays = {
+        "start": starts,
+        "minutes": np.asarray(minutes, dtype=np.int16),
+        "doctor": codes,
+        "available": np.packbits(np.asarray(available, dtype=bool), bitorder="little"),
+    }
+    bounds = np.searchsorted(codes, np.arange(len(doctors) + 1)).tolist()
+    header = {"rows": len(starts), "doctors": [list(d) for d in doctors], "doctor_rows": bounds, "arrays": {}}
+
+    # Array offsets are relative to the first aligned byte after the header.
+    offset = 0
+    for name, arr in arrays.items():
+        header["arrays"][name] = [offset, arr.dtype.str, len(arr)]
+        offset = _aligned(offset + arr.nbytes)
+    blob = json.dumps(header).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(blob))
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(blob).to_bytes(8, "little"))
+        f.write(blob)
+        for name, arr in arrays.items():
+            f.seek(data_start + header["arrays"][name][0])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return data_start + offset
+
+
+def write_frame(path: str, schedule: pd.DataFrame) -> int:
+    """Write a schedule frame (doctor_schedule.csv layout) in binary form."""
+    ids = pd.Categorical(schedule["doctor_id"].astype(str))
+    starts = pd.to_datetime(schedule["slot_start"]).to_numpy().astype("datetime64[m]").astype(np.int64)
+    ends = pd.to_datetime(schedule["slot_end"]).to_numpy().astype("datetime64[m]").astype(np.int64)
+    codes = ids.codes.astype(np.int16)
+    order = np.lexsort((starts, codes))
+    names = dict(zip(schedule["doctor_id"].astype(str), schedule["doctor_name"]))
+    doctors = [(d, names[d]) for d in ids.categories]
+    return write_schedule(path, doctors, codes[order], starts[order], (ends - starts)[order],
+                          schedule["available"].to_numpy(dtype=bool)[order])
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+class ScheduleFile:
+    """A memory-mapped ``.slots`` file; arrays are zero-copy views into it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header = read_header(path)
+        self._arrays = {}
+        self.doctors = [tuple(d) for d in self.header["doctors"]]
+        self._codes = {d[0]: i for i, d in enumerate(self.doctors)}
+        self._bounds = self.header["doctor_rows"]
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            offset, dtype, count = self.header["arrays"][name]
+            self._arrays[name] = np.empty(0, dtype=np.dtype(dtype)) if not count else np.memmap(
+                self.path, dtype=np.dtype(dtype), mode="r", offset=self.header["data_start"] + offset, shape=(count,))
+        return self._arrays[name]
+
+    def rows(self, doctor_id=None, start=None, end=None) -> tuple:
+        """(lo, hi) row range for one doctor (or all) with start in [start, end)."""
+        if doctor_id is None:
+            lo, hi = 0, len(self)
+        elif doctor_id in self._codes:
+            code = self._codes[doctor_id]
+            lo, hi = self._bounds[code], self._bounds[code + 1]
+        else:
+            return 0, 0
+        if start is None and end is None:
+            return lo, hi
+        if doctor_id is None:
+            # Rows are only sorted within a doctor, so a range is searched per doctor.
+            raise ValueError("a date range needs a doctor_id (read() handles all doctors)")
+        starts = self.array("start")
+        if start is not None:
+            lo += int(np.searchsorted(starts[lo:hi], _minute(start)))
+        if end is not None:
+            hi = lo + int(np.searchsorted(starts[lo:hi], _minute(end)))
+        return lo, hi
+
+    def available(self, lo: int = 0, hi: int = None) -> np.ndarray:
+        """Availability of rows [lo, hi) as booleans (unpacks only the bytes involved)."""
+        hi = len(self) if hi is None else hi
+        packed = self.array("available")[lo // 8:-(-hi // 8)]
+        return np.unpackbits(packed, bitorder="little")[lo % 8:lo % 8 + hi - lo].astype(bool)
+
+    def read(self, doctor_id=None, start=None, end=None) -> pd.DataFrame:
+        """Schedule frame for one doctor and/or a date range [start, end)."""
+        if doctor_id is None and (start is not None or end is not None):
+            ranges = [self.rows(d, start, end) for d, _ in self.doctors]
+        else:
+            ranges = [self.rows(doctor_id, start, end)]
+        ranges = [(lo, hi) for lo, hi in ranges if hi > lo]
+        if len(ranges) == 1:
+            rows = slice(*ranges[0])   # contiguous: plain views of the mapping
+        else:
+            rows = np.concatenate([np.arange(lo, hi) for lo, hi in ranges]) if ranges else slice(0, 0)
+        starts = self.array("start")[rows]
+        codes = self.array("doctor")[rows]
+        ends = starts + self.array("minutes")[rows]
+        available = (np.concatenate([self.available(lo, hi) for lo, hi in ranges]) if ranges
+                     else np.empty(0, dtype=bool))
+        ids = [d[0] for d in self.doctors]
+        names = list(dict.fromkeys(d[1] for d in self.doctors))
+        name_codes = np.array([names.index(d[1]) for d in self.doctors], dtype=np.int16)
+        return pd.DataFrame({
+            "doctor_id": pd.Categorical.from_codes(codes, ids),
+            "doctor_name": pd.Categorical.from_codes(name_codes[codes] if len(codes) else codes, names),
+            "slot_start": starts.astype("datetime64[m]").astype("datetime64[ns]"),
+            "slot_end": ends.astype("datetime64[m]").astype("datetime64[ns]"),
+            "available": available,
+        }, columns=SCHEDULE_COLUMNS)
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a schedule file")
+        size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(size))
+    header["data_start"] = _aligned(len(MAGIC) + 8 + size)
+    return header
+
+
+def _minute(ts) -> int:
+    return int(np.datetime64(pd.Timestamp(ts), "m").astype(np.int64))
+
+
+def write_availability(path: str, rows: dict) -> int:
+    """Overwrite availability bits in place; `rows` maps a first row to a bool array.
+
+    Used for bookings, which change no other column, so the rest of the
+    file (and every reader's mapping of it) stays as it is. Returns the
+    number of bytes rewritten.
+    """
+    header = read_header(path)
+    offset, _, count = header["arrays"]["available"]
+    packed = np.memmap(path, dtype=np.uint8, mode="r+", offset=header["data_start"] + offset, shape=(count,))
+    written = 0
+    for first, flags in rows.items():
+        lo, hi = first // 8, -(-(first + len(flags)) // 8)
+        bits = np.unpackbits(packed[lo:hi], bitorder="little")
+        bits[first % 8:first % 8 + len(flags)] = flags
+        packed[lo:hi] = np.packbits(bits, bitorder="little")
+        written += hi - lo
+    packed.flush()
+    del packed
+    os.utime(path)   # readers cache by mtime; make sure this write is seen
+    return written
+
+
+def convert(src: str, dst: str):
+    """Convert a schedule between CSV and ``.slots`` (by file extension)."""
+    if is_binary_schedule(src):
+        ScheduleFile(src).read().to_csv(dst, index=False, date_format="%Y-%m-%d %H:%M")
+    else:
+        write_frame(dst, pd.read_csv(src))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert doctor_schedule.csv to/from the binary .slots format.")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    args = parser.parse_args()
+    convert(args.src, args.dst)
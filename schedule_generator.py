@@ -0,0 +1,174 @@
+"""Doctor schedule generation from a config of working hours.
+
+`extend_schedule` keeps `doctor_schedule.csv` on a rolling horizon: it
+appends slots for days that are not in the file yet, drops days that are
+over, and never touches the days in between, so existing bookings survive.
+Slots are computed with NumPy per doctor (one day-by-slot grid), not one
+row at a time.
+
+Config (data/doctors.json) looks like::
+
+    {
+      "defaults": {"hours": ["09:00", "17:00"], "breaks": [["13:00", "13:30"]],
+                   "slot_minutes": 30, "weekdays": [0, 1, 2, 3, 4], "holidays": ["2025-12-25"]},
+      "doctors": [
+        {"doctor_id": "D1", "doctor_name": "Dr. Maya Rao", "hours_by_weekday": {"5": ["09:00", "13:00"]},
+         "weekdays": [0, 1, 2, 3, 4, 5], "holidays": ["2025-10-02"],
+         "locations": ["Main Clinic - Bengaluru"]}
+      ]
+    }
+
+Weekdays count from Monday = 0. A doctor's holidays add to the clinic-wide
+ones; every other key overrides the defaults. A doctor without a
+"locations" list works at every clinic location. "slot_minutes" must be a
+multiple of the base slot (`schedule_format.BASE_SLOT_MINUTES`, 30): it sets
+the grid the doctor's day is laid out on, and each slot is stored as that
+many consecutive base slots, since bookings count visit lengths in base
+slots.
+"""
+import json
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from data_loader import READ_CACHE
+from schedule_format import BASE_SLOT_MINUTES
+from slot_store import SCHEDULE_COLUMNS, open_store, save_store, schedule_lock
+from storage import file_stamp
+
+DOCTORS_CONFIG = os.path.join(os.path.dirname(__file__), "data", "doctors.json")
+
+DEFAULT_CONFIG = {
+    "defaults": {"hours": ["09:00", "17:00"], "breaks": [], "slot_minutes": 30,
+                 "weekdays": [0, 1, 2, 3, 4, 5, 6], "holidays": []},
+    "doctors": [
+        {"doctor_id": "D1", "doctor_name": "Dr. Maya Rao"},
+        {"doctor_id": "D2", "doctor_name": "Dr. Arvind Nair"},
+        {"doctor_id": "D3", "doctor_name": "Dr. Leena Kapoor"},
+    ],
+}
+
+_MINUTES_PER_DAY = 24 * 60
+
+
+def _clock(text: str) -> int:
+    """"HH:MM" -> minutes after midnight."""
+    hours, minutes = text.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def load_doctor_config(path: str = None) -> list:
+    """Per-doctor settings with the defaults filled in (built-in doctors if the file is missing).
+
+    Cached in `READ_CACHE` until the file changes; treat the result as read-only.
+    """
+    path = os.path.abspath(path or DOCTORS_CONFIG)
+    return READ_CACHE.get("doctors", path, file_stamp(path), lambda: _read_doctor_config(path))
+
+
+def _read_doctor_config(path: str) -> list:
+    config = DEFAULT_CONFIG
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    defaults = {**DEFAULT_CONFIG["defaults"], **config.get("defaults", {})}
+    doctors = []
+    for entry in config["doctors"]:
+        doctor = {**defaults, **entry}
+        doctor["holidays"] = sorted(set(defaults["holidays"]) | set(entry.get("holidays", [])))
+        if doctor["slot_minutes"] < 1 or doctor["slot_minutes"] % BASE_SLOT_MINUTES:
+            raise ValueError(f"{doctor['doctor_id']}: slot_minutes must be a multiple of {BASE_SLOT_MINUTES}, "
+                             f"got {doctor['slot_minutes']}")
+        doctors.append(doctor)
+    return doctors
+
+
+def doctors_at(location: str, doctors: list = None) -> set:
+    """IDs of the doctors who work at clinic `location`."""
+    doctors = load_doctor_config() if doctors is None else doctors
+    return {d["doctor_id"] for d in doctors if not d.get("locations") or location in d["locations"]}
+
+
+def _day_offsets(hours, breaks, slot_minutes: int) -> np.ndarray:
+    """Base slot start times (minutes after midnight) for one working day of `slot_minutes` slots."""
+    if not hours:
+        return np.empty(0, dtype=np.int64)
+    start, end = _clock(hours[0]), _clock(hours[1])
+    offsets = np.arange(start, end - slot_minutes + 1, slot_minutes, dtype=np.int64)
+    keep = np.ones(len(offsets), dtype=bool)
+    for b_start, b_end in breaks:
+        keep &= (offsets + slot_minutes <= _clock(b_start)) | (offsets >= _clock(b_end))
+    return (offsets[keep, None] + np.arange(0, slot_minutes, BASE_SLOT_MINUTES)[None, :]).ravel()
+
+
+def doctor_slots(doctor: dict, start_day, end_day):
+    """(starts, ends) of the base slots in epoch minutes for one doctor on days [start_day, end_day), sorted."""
+    days = np.arange(np.datetime64(start_day, "D"), np.datetime64(end_day, "D"))
+    if doctor["holidays"]:
+        days = days[~np.isin(days, np.array(doctor["holidays"], dtype="datetime64[D]"))]
+    day_numbers = days.astype(np.int64)
+    weekday = (day_numbers + 3) % 7   # 1970-01-01 was a Thursday
+    slot = int(doctor["slot_minutes"])
+    by_weekday = {int(k): v for k, v in doctor.get("hours_by_weekday", {}).items()}
+
+    # Weekdays sharing the same hours share one grid: days x offsets.
+    groups = {}
+    for wd in doctor["weekdays"]:
+        hours = by_weekday.get(wd, doctor["hours"])
+        groups.setdefault(tuple(hours) if hours else None, []).append(wd)
+    parts = []
+    for hours, weekdays in groups.items():
+        offsets = _day_offsets(hours, doctor["breaks"], slot)
+        selected = day_numbers[np.isin(weekday, weekdays)]
+        parts.append((selected[:, None] * _MINUTES_PER_DAY + offsets[None, :]).ravel())
+    starts = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    if len(parts) > 1:
+        starts.sort()
+    return starts, starts + BASE_SLOT_MINUTES
+
+
+def generate_slots(doctors: list, start_day, days: int) -> pd.DataFrame:
+    """All slots for `days` days from `start_day` as a schedule frame (every slot available)."""
+    end_day = np.datetime64(start_day, "D") + days
+    starts, codes = [], []
+    for code, doctor in enumerate(doctors):
+        s, _ = doctor_slots(doctor, start_day, end_day)
+        starts.append(s)
+        codes.append(np.full(len(s), code, dtype=np.int32))
+    starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int32)
+    names = list(dict.fromkeys(d["doctor_name"] for d in doctors))
+    name_codes = np.array([names.index(d["doctor_name"]) for d in doctors], dtype=np.int32)
+    return pd.DataFrame({
+        "doctor_id": pd.Categorical.from_codes(codes, [d["doctor_id"] for d in doctors]),
+        "doctor_name": pd.Categorical.from_codes(name_codes[codes] if len(codes) else codes, names),
+        "slot_start": starts.astype("datetime64[m]").astype("datetime64[ns]"),
+        "slot_end": (starts + BASE_SLOT_MINUTES).astype("datetime64[m]").astype("datetime64[ns]"),
+        "available": np.ones(len(starts), dtype=bool),
+    }, columns=SCHEDULE_COLUMNS)
+
+
+def extend_schedule(schedule_path: str, doctors: list = None, days: int = 7, today=None,
+                    prune_past: bool = True) -> dict:
+    """Roll the schedule file forward to cover `days` days from `today`.
+
+    Adds slots only for (doctor, day) pairs the file does not have yet and,
+    with `prune_past`, drops days before `today`. Existing days, and the
+    bookings in them, are kept as they are. Returns counts of slots added,
+    removed and kept.
+    """
+    doctors = load_doctor_config() if doctors is None else doctors
+    today = np.datetime64(today or date.today(), "D")
+    with schedule_lock(schedule_path):
+        store = open_store(schedule_path)
+        removed = store.drop_days_before(str(today)) if prune_past else 0
+        added = 0
+        for doctor in doctors:
+            starts, ends = doctor_slots(doctor, today, today + days)
+            added += store.add_free_days(doctor["doctor_id"], doctor["doctor_name"], starts, ends)
+        if added or removed or not os.path.exists(schedule_path):
+            save_store(store, schedule_path)
+    READ_CACHE.invalidate("schedule")
+    return {"added": added, "removed": removed, "slots": len(store)}
@@ -1,12 +1,49 @@
+import heapq
+from itertools import islice
+
+import numpy as np
 import pandas as pd
 
+import data_loader
+from metrics import timed
+from schedule_format import BASE_SLOT_MINUTES
+from schedule_generator import doctors_at
+from slot_store import SCHEDULE_COLUMNS, ShardedStore, SlotStore, forget_store, open_store, save_store, schedule_lock
+
+
+class SlotTakenError(Exception):
+    """Raised when a booking hits a slot that is no longer available."""
+
+
 def duration_for_patient_type(patient_type):
     """Return appointment duration in minutes based on patient type."""
     return 60 if patient_type == "new" else 30
 
 
+def slots_needed(duration):
+    """Return how many consecutive base slots make up `duration` minutes."""
+    n, rem = divmod(int(duration), BASE_SLOT_MINUTES)
+    if n < 1 or rem:
+        raise ValueError(f"duration must be a positive multiple of {BASE_SLOT_MINUTES} minutes, got {duration}")
+    return n
+
+
 def get_available_slots(schedule, doctor_name, duration):
-    """Return available slots depending on duration (30 or 60 minutes)."""
+    """Return available slots for any duration that is a multiple of the base slot.
+
+    A longer visit needs `duration / 30` consecutive free slots of the same
+    doctor, each starting where the previous one ends. The search is done with
+    shifted comparisons over the whole (doctor_id, slot_start)-sorted frame, so
+    there is no Python-level loop over rows. `slot_indices` holds the
+    positions of the combined rows in that sorted frame.
+
+    `schedule` may also be a `SlotStore` (or `ShardedStore`), in which case
+    the search only walks its per-day availability bitmaps.
+    """
+    n = slots_needed(duration)
+    if isinstance(schedule, (SlotStore, ShardedStore)):
+        return schedule.available_slots(doctor_name, n)
+
     slots = schedule.copy()
     if doctor_name != "Any":
         slots = slots[slots["doctor_name"] == doctor_name]
@@ -15,64 +52,144 @@ def get_available_slots(schedule, doctor_name, duration):
     slots["slot_start"] = pd.to_datetime(slots["slot_start"])
     slots["slot_end"] = pd.to_datetime(slots["slot_end"])
 
-    available = []
-    if duration == 30:
+    if n == 1:
         # Return available slots
-        available = slots[slots["available"]].copy()
-    elif duration == 60:
-        # Combine two consecutive slots into one 60-min slot
-        slots = slots.sort_values(["doctor_id", "slot_start"])
-        for i in range(len(slots) - 1):
-            s1, s2 = slots.iloc[i], slots.iloc[i + 1]
-            if (
-                s1["doctor_id"] == s2["doctor_id"]
-                and s1["available"] == True
-                and s2["available"] == True
-                and s2["slot_start"] == s1["slot_end"] 
-            ):
-                available.append({
-                    "doctor_id": s1["doctor_id"],
-                    "doctor_name": s1["doctor_name"],
-                    "slot_start": s1["slot_start"],
-                    "slot_end": s2["slot_end"],
-                    "available": True,
-                    "slot_indices": [i, i+1]
-                })
-        available = pd.DataFrame(available)
-
-    return available
+        return slots[slots["available"].astype(bool)].copy()
+
+    columns = ["doctor_id", "doctor_name", "slot_start", "slot_end", "available", "slot_indices"]
+    if len(slots) < n:
+        return pd.DataFrame(columns=columns)
+
+    slots = slots.sort_values(["doctor_id", "slot_start"], kind="stable")
+    free = slots["available"].to_numpy(dtype=bool)
+    doctor = slots["doctor_id"].to_numpy()
+    start = slots["slot_start"].to_numpy()
+    end = slots["slot_end"].to_numpy()
+
+    # link[i] is True when slot i and slot i+1 can be joined into one visit.
+    link = (doctor[1:] == doctor[:-1]) & (start[1:] == end[:-1]) & free[1:] & free[:-1]
+    # A visit starting at i needs n-1 joinable pairs in a row: count them with
+    # a running sum instead of a rolling window per doctor.
+    runs = np.concatenate(([0], np.cumsum(link, dtype=np.int64)))
+    first = np.flatnonzero(runs[n - 1:] - runs[:len(runs) - n + 1] == n - 1)
+    if not len(first):
+        return pd.DataFrame(columns=columns)
+
+    last = first + n - 1
+    return pd.DataFrame({
+        "doctor_id": doctor[first],
+        "doctor_name": slots["doctor_name"].to_numpy()[first],
+        "slot_start": start[first],
+        "slot_end": end[last],
+        "available": True,
+        "slot_indices": (first[:, None] + np.arange(n)).tolist(),
+    }, columns=columns)
+
 
+def _epoch_minute(ts) -> int:
+    return pd.Timestamp(ts).value // 60_000_000_000
 
+
+def _day_minute(t) -> int:
+    """A time of day ("HH:MM" or a `datetime.time`) as minutes after midnight."""
+    if hasattr(t, "hour"):
+        return t.hour * 60 + t.minute
+    hours, minutes = str(t).split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _tagged(doctor_id, visits):
+    for start, end in visits:
+        yield start, doctor_id, end
+
+
+def recommend_slots(store: SlotStore, doctor_name="Any", duration=30, k: int = 10, cursor: str = None,
+                    date_from=None, date_to=None, time_from=None, time_to=None, weekdays=None,
+                    location: str = None, not_before=None, doctors: list = None):
+    """The k earliest free visits that match the filters, plus a cursor for the next page.
+
+    Each doctor's free visits are read lazily in time order from the store
+    and merged with a heap, so only about k visits are ever produced: the
+    cost depends on k (and on how many days must be skipped to find them),
+    not on the size of the schedule.
+
+    Filters: `date_from`/`date_to` (inclusive dates), `time_from`/`time_to`
+    (the visit must fit in that window of the day), `weekdays` (0 = Monday),
+    `location` (doctors working there, see `schedule_generator.doctors_at`)
+    and `not_before` (e.g. now). Pass the returned cursor back to get the
+    page after this one; it is None after the last page.
+
+    Returns (slots, next_cursor); `slots` has the schedule columns (no
+    `slot_indices`: visits come from the store's bitmaps, not frame rows).
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    n = slots_needed(duration)
+    doctor_ids = store.doctor_ids(doctor_name)
+    if location is not None:
+        here = doctors_at(location, doctors)
+        doctor_ids = [d for d in doctor_ids if d in here]
+
+    lo = None if not_before is None else _epoch_minute(not_before)
+    if date_from is not None:
+        lo = max(lo or 0, _epoch_minute(pd.Timestamp(date_from).normalize()))
+    until = None if date_to is None else _epoch_minute(pd.Timestamp(date_to).normalize()) + 24 * 60
+    day_minutes = None
+    if time_from is not None or time_to is not None:
+        day_minutes = (_day_minute(time_from or "00:00"), _day_minute(time_to or "24:00"))
+    weekdays = None if weekdays is None else set(weekdays)
+
+    after = None
+    if cursor:
+        minute, _, doctor_id = cursor.partition(":")
+        after = (int(minute), doctor_id)
+    store.prefetch(doctor_ids, lo if after is None else max(lo or 0, after[0]))
+    streams = []
+    for doctor_id in doctor_ids:
+        begin = lo
+        if after is not None:
+            # Resume strictly after the cursor in (start, doctor_id) order.
+            resume = after[0] + (doctor_id <= after[1])
+            begin = resume if begin is None else max(begin, resume)
+        streams.append(_tagged(doctor_id, store.free_visits(doctor_id, n, begin, until, weekdays, day_minutes)))
+
+    page = list(islice(heapq.merge(*streams), k + 1))
+    next_cursor = f"{page[k - 1][0]}:{page[k - 1][1]}" if len(page) > k else None
+    page = page[:k]
+    minutes = np.array([[start, end] for start, _, end in page], dtype=np.int64).reshape(-1, 2)
+    slots = pd.DataFrame({
+        "doctor_id": [doctor_id for _, doctor_id, _ in page],
+        "doctor_name": [store.doctor_names[doctor_id] for _, doctor_id, _ in page],
+        "slot_start": minutes[:, 0].astype("datetime64[m]").astype("datetime64[ns]"),
+        "slot_end": minutes[:, 1].astype("datetime64[m]").astype("datetime64[ns]"),
+        "available": True,
+    }, columns=SCHEDULE_COLUMNS)
+    return slots, next_cursor
+
+
+@timed("book_slot")
 def book_slot(slot_row, duration, schedule_path="data/doctor_schedule.csv"):
     """
-    Mark slots as booked (handles both 30- and 60-min cases).
+    Mark every base slot covered by the booking as unavailable.
     Updates doctor_schedule.csv to persist the change.
+
+    The check and the update happen under the schedule's file lock, so two
+    sessions racing for the same slot cannot both win: the loser gets a
+    `SlotTakenError` and the file is left untouched.
     """
-    schedule = pd.read_csv(schedule_path)
-    schedule["slot_start"] = pd.to_datetime(schedule["slot_start"])
-    schedule["slot_end"] = pd.to_datetime(schedule["slot_end"])
-
-    if duration == 30:
-        # Match by doctor + start time
-        schedule.loc[
-            (schedule["doctor_id"] == slot_row["doctor_id"]) &
-            (schedule["slot_start"] == pd.to_datetime(slot_row["slot_start"])),
-            "available"
-        ] = False
-    elif duration == 60:
-        # Block both consecutive slots
-        schedule.loc[
-            (schedule["doctor_id"] == slot_row["doctor_id"]) &
-            (schedule["slot_start"] == pd.to_datetime(slot_row["slot_start"])),
-            "available"
-        ] = False
-        schedule.loc[
-            (schedule["doctor_id"] == slot_row["doctor_id"]) &
-            (schedule["slot_end"] == pd.to_datetime(slot_row["slot_end"])),
-            "available"
-        ] = False
-
-    # Save back
-    schedule.to_csv(schedule_path, index=False)
+    n = slots_needed(duration)
+    with schedule_lock(schedule_path, [(slot_row["doctor_id"], slot_row["slot_start"])]):
+        store = open_store(schedule_path)
+        if not store.book(slot_row["doctor_id"], slot_row["slot_start"], n):
+            raise SlotTakenError(
+                f"Slot {slot_row['slot_start']} with {slot_row['doctor_id']} is no longer available."
+            )
+        try:
+            save_store(store, schedule_path)
+        except Exception:
+            forget_store(schedule_path)
+            raise
+        finally:
+            data_loader.READ_CACHE.invalidate("schedule")
 
     return slot_row
@@ -0,0 +1,844 @@
+import csv
+import io
+import os
+import threading
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
+from schedule_format import SCHEDULE_COLUMNS, ScheduleFile, is_binary_schedule, write_availability, write_schedule
+from storage import atomic_write_csv, file_lock, file_stamp
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+_NS_PER_MINUTE = 60 * 10**9
+_MINUTES_PER_DAY = 24 * 60
+
+
+def _to_minutes(ts) -> int:
+    """Convert a timestamp-like value to integer minutes since the epoch."""
+    return pd.Timestamp(ts).value // _NS_PER_MINUTE
+
+
+def _from_minutes(minutes):
+    """Convert epoch minutes to a datetime64[ns] array."""
+    return np.asarray(minutes, dtype=np.int64).astype("datetime64[m]").astype("datetime64[ns]")
+
+
+def _format_minutes(minutes):
+    """Format epoch minutes as TIME_FORMAT strings without a per-row strftime."""
+    text = np.datetime_as_string(np.asarray(minutes, dtype="datetime64[m]"), unit="m")
+    return np.char.replace(text, "T", " ").tolist()
+
+
+def _unbits(mask: int, n: int) -> np.ndarray:
+    """Inverse of `_bits`: the first n flags of a bitmap as booleans."""
+    packed = np.frombuffer(mask.to_bytes((n + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(packed, count=n, bitorder="little").astype(bool)
+
+
+def _bits(flags) -> int:
+    """Pack a boolean sequence into an int (bit i <-> flags[i])."""
+    flags = np.asarray(flags, dtype=bool)
+    if not len(flags):
+        return 0
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+class DaySlots:
+    """The base slots of one doctor on one day, with a free-slot bitmap.
+
+    Bit i of `free` is set when slot i is available; bit i of `chain` is set
+    when slot i+1 starts exactly where slot i ends, i.e. the two can be
+    combined into one longer visit.
+    """
+
+    __slots__ = ("starts", "ends", "free", "chain", "_pos", "_text")
+
+    def __init__(self, starts, ends, free):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.free = _bits(free)
+        self.chain = _bits(self.starts[1:] == self.ends[:-1])
+        self._pos = None   # start minute -> position, built on first lookup
+        self._text = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def runs(self, n: int) -> int:
+        """Bitmap of slot positions that start n free, back-to-back slots."""
+        mask = self.free
+        for k in range(1, n):
+            mask &= (self.free >> k) & (self.chain >> (k - 1))
+        return mask
+
+    def span_mask(self, start_minute: int, n: int):
+        """Return the bitmask covering n slots from `start_minute`, or None if they are not back-to-back."""
+        if self._pos is None:
+            self._pos = dict(zip(self.starts.tolist(), range(len(self.starts))))
+        i = self._pos.get(start_minute)
+        if i is None or i + n > len(self.starts):
+            return None
+        chain = ((1 << (n - 1)) - 1) << i
+        if self.chain & chain != chain:
+            return None
+        return ((1 << n) - 1) << i
+
+
+class SlotStore:
+    """In-memory doctor schedule indexed by (doctor_id, day).
+
+    Availability queries and bookings only touch the `DaySlots` of the days
+    involved, so their cost depends on the number of slots in a day rather
+    than the size of the whole schedule. Changed days are tracked and only
+    those are re-serialised by `save`.
+    """
+
+    def __init__(self):
+        self.doctor_names = {}
+        self._ids_by_name = {}
+        self._days = {}
+        self._doctor_days = {}
+        self._dirty = set()
+        # First row of each day in the binary file this store was loaded from
+        # or saved to; cleared when days are added or removed.
+        self._rows = {}
+
+    # --- construction / persistence ---------------------------------------
+
+    @classmethod
+    def from_frame(cls, schedule: pd.DataFrame) -> "SlotStore":
+        """Build a store from a schedule DataFrame (doctor_schedule.csv layout)."""
+        store = cls()
+        if schedule.empty:
+            return store
+        df = pd.DataFrame({
+            "doctor_id": schedule["doctor_id"].to_numpy(),
+            "doctor_name": schedule["doctor_name"].to_numpy(),
+            "start": pd.to_datetime(schedule["slot_start"]).to_numpy().astype(np.int64) // _NS_PER_MINUTE,
+            "end": pd.to_datetime(schedule["slot_end"]).to_numpy().astype(np.int64) // _NS_PER_MINUTE,
+            "available": schedule["available"].to_numpy(dtype=bool),
+        }).sort_values(["doctor_id", "start"], kind="stable")
+        df["day"] = df["start"] // _MINUTES_PER_DAY
+
+        doctor = df["doctor_id"].to_numpy()
+        day = df["day"].to_numpy()
+        cuts = np.flatnonzero((doctor[1:] != doctor[:-1]) | (day[1:] != day[:-1])) + 1
+        bounds = zip(np.concatenate(([0], cuts)).tolist(), np.concatenate((cuts, [len(df)])).tolist())
+        starts, ends, free = df["start"].to_numpy(), df["end"].to_numpy(), df["available"].to_numpy()
+        names = df["doctor_name"].to_numpy()
+
+        for lo, hi in bounds:
+            store._add_day(doctor[lo], names[lo], int(day[lo]), DaySlots(starts[lo:hi], ends[lo:hi], free[lo:hi]))
+        return store
+
+    @classmethod
+    def from_binary(cls, path: str) -> "SlotStore":
+        """Build a store from a ``.slots`` file; slot start arrays stay views of the mapped file."""
+        store = cls()
+        f = ScheduleFile(path)
+        if not len(f):
+            return store
+        starts = f.array("start")
+        ends = starts + f.array("minutes")
+        free = f.available()
+        codes = f.array("doctor")
+        day = starts // _MINUTES_PER_DAY
+        cuts = (np.flatnonzero((codes[1:] != codes[:-1]) | (day[1:] != day[:-1])) + 1).tolist()
+        rows = {}
+        for lo, hi in zip([0] + cuts, cuts + [len(f)]):
+            doctor_id, doctor_name = f.doctors[codes[lo]]
+            key = (doctor_id, int(day[lo]))
+            store._add_day(doctor_id, doctor_name, key[1], DaySlots(starts[lo:hi], ends[lo:hi], free[lo:hi]))
+            rows[key] = lo
+        store._rows = rows
+        return store
+
+    @classmethod
+    def load(cls, path: str) -> "SlotStore":
+        """Load a store from doctor_schedule.csv or a ``.slots`` file (empty if missing)."""
+        if not os.path.exists(path):
+            return cls()
+        if is_binary_schedule(path):
+            return cls.from_binary(path)
+        return cls.from_frame(pd.read_csv(path, parse_dates=["slot_start", "slot_end"], date_format="ISO8601"))
+
+    def save(self, path: str) -> int:
+        """Write the schedule to `path`, re-rendering only the days that changed.
+
+        For a ``.slots`` file whose days are unchanged apart from bookings,
+        only the availability bits of the changed days are rewritten.
+        Returns the number of bytes written.
+        """
+        if is_binary_schedule(path):
+            return self._save_binary(path)
+        for key in self._dirty:
+            self._days[key]._text = None
+        keys = [(d, day) for d in sorted(self._doctor_days) for day in self._doctor_days[d]]
+        self._render([k for k in keys if self._days[k]._text is None])
+
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(SCHEDULE_COLUMNS) + "\n")
+            f.writelines(self._days[k]._text for k in keys)
+            written = f.tell()
+        os.replace(tmp, path)
+        self._dirty.clear()
+        return written
+
+    def _save_binary(self, path: str) -> int:
+        if self._rows and os.path.exists(path):
+            written = write_availability(path, {
+                self._rows[k]: _unbits(self._days[k].free, len(self._days[k])) for k in self._dirty
+            })
+            self._dirty.clear()
+            return written
+        doctor_ids = sorted(self._doctor_days)
+        keys = [(d, day) for d in doctor_ids for day in self._doctor_days[d]]
+        days = [self._days[k] for k in keys]
+        lengths = [len(s) for s in days]
+        codes = np.repeat(np.repeat(np.arange(len(doctor_ids)), [len(self._doctor_days[d]) for d in doctor_ids]),
+                          lengths)
+        starts = np.concatenate([s.starts for s in days]) if days else np.empty(0, dtype=np.int64)
+        ends = np.concatenate([s.ends for s in days]) if days else np.empty(0, dtype=np.int64)
+        free = np.concatenate([_unbits(s.free, len(s)) for s in days]) if days else np.empty(0, dtype=bool)
+        written = write_schedule(path, [(d, self.doctor_names[d]) for d in doctor_ids], codes, starts, ends - starts,
+                                 free)
+        self._rows = dict(zip(keys, np.concatenate(([0], np.cumsum(lengths)[:-1])).tolist())) if keys else {}
+        self._dirty.clear()
+        return written
+
+    def _render(self, keys):
+        """Cache the CSV text of the given days, formatting timestamps in one batch."""
+        if not keys:
+            return
+        days = [self._days[k] for k in keys]
+        starts = _format_minutes(np.concatenate([s.starts for s in days]))
+        ends = _format_minutes(np.concatenate([s.ends for s in days]))
+        prefix = {}
+        pos = 0
+        for (doctor_id, _), slots in zip(keys, days):
+            if doctor_id not in prefix:
+                buf = io.StringIO()
+                csv.writer(buf, lineterminator="").writerow([doctor_id, self.doctor_names[doctor_id]])
+                prefix[doctor_id] = buf.getvalue()
+            head = prefix[doctor_id]
+            slots._text = "".join(
+                f"{head},{starts[pos + i]},{ends[pos + i]},{bool(slots.free >> i & 1)}\n"
+                for i in range(len(slots))
+            )
+            pos += len(slots)
+
+    def _add_day(self, doctor_id, doctor_name, day, slots):
+        if doctor_id not in self.doctor_names:
+            self.doctor_names[doctor_id] = doctor_name
+            self._ids_by_name.setdefault(doctor_name, []).append(doctor_id)
+            self._doctor_days[doctor_id] = []
+        if (doctor_id, day) not in self._days:
+            insort(self._doctor_days[doctor_id], day)
+        self._days[(doctor_id, day)] = slots
+        self._rows.clear()
+        self._dirty.add((doctor_id, day))
+
+    # --- queries ------------------------------------------------------------
+
+    def __len__(self):
+        return sum(len(s) for s in self._days.values())
+
+    @property
+    def dirty(self):
+        """(doctor_id, day) keys changed since the last save."""
+        return set(self._dirty)
+
+    def doctor_ids(self, doctor_name="Any"):
+        if doctor_name == "Any":
+            return sorted(self.doctor_names)
+        return sorted(self._ids_by_name.get(doctor_name, []))
+
+    def day_slots(self, doctor_id, day):
+        """Return the `DaySlots` for a doctor and a date-like `day`, or None."""
+        return self._days.get((doctor_id, _to_minutes(pd.Timestamp(day).normalize()) // _MINUTES_PER_DAY))
+
+    def available_slots(self, doctor_name, n: int) -> pd.DataFrame:
+        """Return visits made of n back-to-back free slots, like `get_available_slots`."""
+        owners, days = [], []
+        for doctor_id in self.doctor_ids(doctor_name):
+            for day in self._doctor_days[doctor_id]:
+                owners.append(doctor_id)
+                days.append(self._days[(doctor_id, day)])
+
+        columns = SCHEDULE_COLUMNS + (["slot_indices"] if n > 1 else [])
+        if not days:
+            return pd.DataFrame(columns=columns)
+
+        # Unpack every day's run bitmap in one go: row = day, column = slot.
+        width = max((len(s) + 7) // 8 for s in days)
+        packed = b"".join(s.runs(n).to_bytes(width, "little") for s in days)
+        bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder="little").reshape(len(days), -1)
+        row, pos = np.nonzero(bits)
+
+        lengths = np.fromiter((len(s) for s in days), dtype=np.int64, count=len(days))
+        first = np.concatenate(([0], np.cumsum(lengths)[:-1]))[row] + pos
+        starts = np.concatenate([s.starts for s in days])
+        ends = np.concatenate([s.ends for s in days])
+        owners = np.array(owners, dtype=object)[row].tolist()
+
+        out = pd.DataFrame({
+            "doctor_id": owners,
+            "doctor_name": np.array([self.doctor_names[d] for d in owners], dtype=object),
+            "slot_start": _from_minutes(starts[first]),
+            "slot_end": _from_minutes(ends[first + n - 1]),
+            "available": True,
+        }, columns=SCHEDULE_COLUMNS)
+        if n > 1:
+            out["slot_indices"] = pd.Series((first[:, None] + np.arange(n)).tolist(), dtype=object)
+        return out
+
+    def is_free(self, doctor_id, slot_start, n: int) -> bool:
+        """True if n back-to-back slots starting at `slot_start` are all free."""
+        start = _to_minutes(slot_start)
+        slots = self._days.get((doctor_id, start // _MINUTES_PER_DAY))
+        if slots is None:
+            return False
+        mask = slots.span_mask(start, n)
+        return mask is not None and slots.free & mask == mask
+
+    def free_visits(self, doctor_id, n: int, not_before: int = None, until: int = None,
+                    weekdays=None, day_minutes=None):
+        """Yield (start, end) epoch minutes of the doctor's free n-slot visits, earliest first.
+
+        Only visits starting in [not_before, until) are yielded; `weekdays`
+        (0 = Monday) limits the days and `day_minutes` = (lo, hi) minutes
+        after midnight limits each visit to start at or after lo and end by
+        hi. Days are read one at a time, so stopping early is cheap.
+        """
+        days = self._doctor_days.get(doctor_id, [])
+        i = 0 if not_before is None else bisect_left(days, not_before // _MINUTES_PER_DAY)
+        for day in days[i:]:
+            midnight = day * _MINUTES_PER_DAY
+            if until is not None and midnight >= until:
+                return
+            if weekdays is not None and (day + 3) % 7 not in weekdays:   # 1970-01-01 was a Thursday
+                continue
+            slots = self._days[(doctor_id, day)]
+            mask = slots.runs(n)
+            lo = not_before
+            if day_minutes is not None:
+                lo = max(lo or midnight, midnight + day_minutes[0])
+            if mask and lo is not None and slots.starts[0] < lo:
+                mask &= ~((1 << int(np.searchsorted(slots.starts, lo))) - 1)
+            while mask:
+                pos = (mask & -mask).bit_length() - 1
+                mask &= mask - 1
+                start, end = int(slots.starts[pos]), int(slots.ends[pos + n - 1])
+                if until is not None and start >= until:
+                    return
+                if day_minutes is not None and end > midnight + day_minutes[1]:
+                    break
+                yield start, end
+
+    def next_free(self, doctor_id, n: int, not_before: int = None):
+        """Earliest free visit of n slots starting at or after `not_before` (epoch minutes), or None."""
+        return next(self.free_visits(doctor_id, n, not_before), None)
+
+    def prefetch(self, doctor_ids, not_before: int = None):
+        """Nothing to load: the whole schedule is in memory (see `ShardedStore.prefetch`)."""
+
+    # --- updates ------------------------------------------------------------
+
+    def add_free_days(self, doctor_id, doctor_name, starts, ends) -> int:
+        """Add free slots (sorted epoch-minute arrays) for days the doctor has no slots on yet.
+
+        Days already in the store are left exactly as they are, bookings
+        included. Returns the number of slots added.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if not len(starts):
+            return 0
+        day = starts // _MINUTES_PER_DAY
+        cuts = np.flatnonzero(day[1:] != day[:-1]) + 1
+        existing = set(self._doctor_days.get(doctor_id, ()))
+        added = 0
+        for lo, hi in zip([0] + cuts.tolist(), cuts.tolist() + [len(starts)]):
+            d = int(day[lo])
+            if d in existing:
+                continue
+            self._add_day(doctor_id, doctor_name, d, DaySlots(starts[lo:hi], ends[lo:hi], np.ones(hi - lo, bool)))
+            added += hi - lo
+        return added
+
+    def drop_days_before(self, day) -> int:
+        """Remove every doctor's slots on days before the date-like `day`; returns slots removed."""
+        cutoff = _to_minutes(pd.Timestamp(day).normalize()) // _MINUTES_PER_DAY
+        removed = 0
+        for doctor_id, days in self._doctor_days.items():
+            n = bisect_left(days, cutoff)
+            for d in days[:n]:
+                removed += len(self._days.pop((doctor_id, d)))
+                self._dirty.discard((doctor_id, d))
+            del days[:n]
+        if removed:
+            self._rows.clear()
+        return removed
+
+    def book(self, doctor_id, slot_start, n: int) -> bool:
+        """Mark n back-to-back slots starting at `slot_start` as booked.
+
+        Returns False (and changes nothing) if any of them is missing or
+        already booked.
+        """
+        if not self.is_free(doctor_id, slot_start, n):
+            return False
+        start = _to_minutes(slot_start)
+        key = (doctor_id, start // _MINUTES_PER_DAY)
+        slots = self._days[key]
+        slots.free &= ~slots.span_mask(start, n)
+        self._dirty.add(key)
+        return True
+
+    def release(self, doctor_id, slot_start, n: int) -> bool:
+        """Mark n back-to-back slots starting at `slot_start` as free again (e.g. on a cancellation).
+
+        Returns False (and changes nothing) if the slots do not exist or none
+        of them is booked.
+        """
+        start = _to_minutes(slot_start)
+        key = (doctor_id, start // _MINUTES_PER_DAY)
+        slots = self._days.get(key)
+        mask = slots.span_mask(start, n) if slots is not None else None
+        if mask is None or slots.free & mask == mask:
+            return False
+        slots.free |= mask
+        self._dirty.add(key)
+        return True
+
+
+def _month(minute: int) -> str:
+    """"YYYY-MM" of an epoch minute."""
+    return str(np.datetime64(minute // _MINUTES_PER_DAY, "D").astype("datetime64[M]"))
+
+
+def _month_start(month: str) -> int:
+    return int(np.datetime64(month, "M").astype("datetime64[m]").astype(np.int64))
+
+
+def is_sharded_schedule(path: str) -> bool:
+    """A schedule path without a file extension (or an existing directory) holds one file per doctor and month."""
+    return os.path.isdir(path) or not os.path.splitext(path)[1]
+
+
+ARCHIVE_DIR = "archive"
+MANIFEST = "doctors.csv"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _shard_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                       thread_name_prefix="schedule-shard")
+        return _pool
+
+
+class ShardedStore:
+    """A schedule directory with one CSV per (doctor, month): ``<root>/<doctor_id>/<YYYY-MM>.csv``.
+
+    It answers the same queries and updates as `SlotStore`, but each call
+    opens only the shards it needs (each one a `SlotStore`, cached by
+    `open_store` and reloaded when its file changes), and `save` rewrites
+    only the shards that changed. A booking therefore reads, locks (see
+    `schedule_lock`) and writes a single doctor-month. Changed shards are
+    tracked per thread, so threads sharing the store each save (or forget)
+    only the shards they changed under their own locks. "Any doctor" scans
+    load their shards in parallel on a thread pool and merge the results.
+    Past months are moved to ``<root>/archive/`` without touching the rest.
+    Doctor names live in ``<root>/doctors.csv``.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._local = threading.local()
+        self._new_names = {}    # doctors added since the last save
+        self._manifest = (None, {})
+        self._months = {}       # doctor_id -> (directory stamp, months on disk)
+        self._names = None
+        self._ids_by_name = None
+
+    @property
+    def _touched(self) -> set:
+        """(doctor_id, month) of the shards this thread changed since its last save."""
+        touched = getattr(self._local, "touched", None)
+        if touched is None:
+            touched = self._local.touched = set()
+        return touched
+
+    # --- layout -------------------------------------------------------------
+
+    def shard_path(self, doctor_id, month: str) -> str:
+        return os.path.join(self.root, quote(str(doctor_id), safe=""), f"{month}.csv")
+
+    def months(self, doctor_id) -> list:
+        """Months the doctor has a shard for, oldest first."""
+        directory = os.path.join(self.root, quote(str(doctor_id), safe=""))
+        stamp = file_stamp(directory)
+        cached = self._months.get(doctor_id)
+        if cached is None or cached[0] != stamp:
+            names = os.listdir(directory) if stamp is not None else []
+            cached = self._months[doctor_id] = (
+                stamp, sorted(name[:-4] for name in names if name.endswith(".csv") and len(name) == 11))
+        unsaved = [m for d, m in self._touched if d == doctor_id and m not in cached[1]]
+        return sorted(cached[1] + unsaved) if unsaved else cached[1]
+
+    def _shard(self, doctor_id, month: str) -> SlotStore:
+        # Always through the cache: a shard rewritten by another process is reloaded,
+        # dropping any unsaved change to it, exactly like a single schedule file.
+        return open_store(self.shard_path(doctor_id, month))
+
+    def _keys(self, doctor_ids, first_month: str = None) -> list:
+        return [(d, m) for d in doctor_ids for m in self.months(d) if first_month is None or m >= first_month]
+
+    # --- doctors ------------------------------------------------------------
+
+    @property
+    def doctor_names(self) -> dict:
+        path = os.path.join(self.root, MANIFEST)
+        stamp = file_stamp(path)
+        if stamp != self._manifest[0]:
+            names = {}
+            if stamp is not None:
+                df = pd.read_csv(path, dtype=str, keep_default_na=False)
+                names = dict(zip(df["doctor_id"], df["doctor_name"]))
+            self._manifest, self._names = (stamp, names), None
+        if self._names is None:
+            self._names = {**self._manifest[1], **self._new_names}
+            self._ids_by_name = {}
+            for doctor_id, name in self._names.items():
+                self._ids_by_name.setdefault(name, []).append(doctor_id)
+        return self._names
+
+    def doctor_ids(self, doctor_name="Any"):
+        names = self.doctor_names
+        if doctor_name == "Any":
+            return sorted(names)
+        return sorted(self._ids_by_name.get(doctor_name, []))
+
+    # --- queries ------------------------------------------------------------
+
+    def __len__(self):
+        keys = self._keys(self.doctor_ids())
+        return sum(_shard_pool().map(lambda k: len(self._shard(*k)), keys))
+
+    @property
+    def dirty(self):
+        """(doctor_id, day) keys changed since the last save."""
+        return set().union(*(self._shard(*key).dirty for key in self._touched))
+
+    def prefetch(self, doctor_ids, not_before: int = None):
+        """Load each doctor's first shard from `not_before` on, in parallel."""
+        first = None if not_before is None else _month(not_before)
+        paths = []
+        for doctor_id in doctor_ids:
+            months = [m for m in self.months(doctor_id) if first is None or m >= first]
+            if months and _cached_store(self.shard_path(doctor_id, months[0])) is None:
+                paths.append(self.shard_path(doctor_id, months[0]))
+        if len(paths) > 1:
+            list(_shard_pool().map(open_store, paths))
+
+    def day_slots(self, doctor_id, day):
+        return self._shard(doctor_id, _month(_to_minutes(day))).day_slots(doctor_id, day)
+
+    def available_slots(self, doctor_name, n: int) -> pd.DataFrame:
+        """`SlotStore.available_slots` over every shard, scanned in parallel; `slot_indices` count across shards."""
+        keys = self._keys(self.doctor_ids(doctor_name))
+
+        def scan(key):
+            shard = self._shard(*key)
+            return len(shard), shard.available_slots("Any", n)
+
+        results = list(_shard_pool().map(scan, keys))
+        frames, offset = [], 0
+        for length, df in results:
+            if len(df):
+                if n > 1:
+                    df["slot_indices"] = [[i + offset for i in ix] for ix in df["slot_indices"]]
+                frames.append(df)
+            offset += length
+        if not frames:
+            return pd.DataFrame(columns=SCHEDULE_COLUMNS + (["slot_indices"] if n > 1 else []))
+        return pd.concat(frames, ignore_index=True)
+
+    def is_free(self, doctor_id, slot_start, n: int) -> bool:
+        return self._shard(doctor_id, _month(_to_minutes(slot_start))).is_free(doctor_id, slot_start, n)
+
+    def free_visits(self, doctor_id, n: int, not_before: int = None, until: int = None,
+                    weekdays=None, day_minutes=None):
+        """`SlotStore.free_visits`, reading the doctor's shards month by month."""
+        first = None if not_before is None else _month(not_before)
+        for month in self.months(doctor_id):
+            if first is not None and month < first:
+                continue
+            if until is not None and _month_start(month) >= until:
+                return
+            yield from self._shard(doctor_id, month).free_visits(doctor_id, n, not_before, until, weekdays,
+                                                                  day_minutes)
+
+    def next_free(self, doctor_id, n: int, not_before: int = None):
+        return next(self.free_visits(doctor_id, n, not_before), None)
+
+    # --- updates ------------------------------------------------------------
+
+    def _update(self, doctor_id, slot_start, change) -> bool:
+        key = (doctor_id, _month(_to_minutes(slot_start)))
+        shard = self._shard(*key)
+        if not change(shard):
+            return False
+        self._touched.add(key)
+        return True
+
+    def book(self, doctor_id, slot_start, n: int) -> bool:
+        return self._update(doctor_id, slot_start, lambda shard: shard.book(doctor_id, slot_start, n))
+
+    def release(self, doctor_id, slot_start, n: int) -> bool:
+        return self._update(doctor_id, slot_start, lambda shard: shard.release(doctor_id, slot_start, n))
+
+    def add_free_days(self, doctor_id, doctor_name, starts, ends) -> int:
+        """`SlotStore.add_free_days`, split into the months' shards."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if not len(starts):
+            return 0
+        if doctor_id not in self.doctor_names:
+            self._new_names[doctor_id] = doctor_name
+            self._names = None
+        month = (starts // _MINUTES_PER_DAY).astype("datetime64[D]").astype("datetime64[M]")
+        cuts = (np.flatnonzero(month[1:] != month[:-1]) + 1).tolist()
+        added = 0
+        for lo, hi in zip([0] + cuts, cuts + [len(starts)]):
+            key = (doctor_id, str(month[lo]))
+            shard = self._shard(*key)
+            n = shard.add_free_days(doctor_id, doctor_name, starts[lo:hi], ends[lo:hi])
+            if n:
+                self._touched.add(key)
+                added += n
+        return added
+
+    def drop_days_before(self, day) -> int:
+        """Archive the months before `day` (see `archive_months`) and drop the earlier days of its month."""
+        cutoff = _to_minutes(pd.Timestamp(day).normalize())
+        removed = self.archive_months(_month(cutoff))["slots"]
+        for doctor_id in self.doctor_ids():
+            key = (doctor_id, _month(cutoff))
+            shard = self._shard(*key)
+            n = shard.drop_days_before(day)
+            if n:
+                self._touched.add(key)
+                removed += n
+        return removed
+
+    def archive_months(self, before: str) -> dict:
+        """Move every shard of a month before `before` ("YYYY-MM") to ``<root>/archive/``.
+
+        The files are renamed, not rewritten, and no other shard is read.
+        Returns {"shards": moved, "slots": slots in them}.
+        """
+        before = str(np.datetime64(before, "M"))
+        moved = slots = 0
+        for doctor_id in self.doctor_ids():
+            for month in self.months(doctor_id):
+                if month >= before:
+                    break
+                src = self.shard_path(doctor_id, month)
+                slots += len(self._shard(doctor_id, month))
+                self._touched.discard((doctor_id, month))
+                if os.path.exists(src):
+                    dst = os.path.join(self.root, ARCHIVE_DIR, os.path.relpath(src, self.root))
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    os.replace(src, dst)
+                    moved += 1
+                forget_store(src)
+        return {"shards": moved, "slots": slots}
+
+    # --- persistence --------------------------------------------------------
+
+    def save(self, path: str = None) -> int:
+        """Write the shards this thread changed (and the doctor list if it grew); returns bytes written."""
+        written = 0
+        for key in sorted(self._touched):
+            shard_path = self.shard_path(*key)
+            os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+            save_store(self._shard(*key), shard_path)
+            written += os.path.getsize(shard_path)
+        self._touched.clear()
+        manifest = os.path.join(self.root, MANIFEST)
+        if self._new_names or not os.path.exists(manifest):
+            os.makedirs(self.root, exist_ok=True)
+            names = self.doctor_names
+            atomic_write_csv(pd.DataFrame({"doctor_id": list(names), "doctor_name": list(names.values())}),
+                             manifest)
+            self._new_names.clear()
+            self._names = None
+        return written
+
+    def forget(self):
+        """Drop this thread's unsaved changes: its changed shards are reloaded from disk on next use."""
+        for key in self._touched:
+            forget_store(self.shard_path(*key))
+        self._touched.clear()
+        self._new_names.clear()
+        self._names = None
+
+    def shard_files(self) -> list:
+        """Paths of every live (not archived) shard."""
+        return [self.shard_path(d, m) for d, m in self._keys(self.doctor_ids())]
+
+    def read(self) -> pd.DataFrame:
+        """The whole live schedule as a frame (doctor_schedule.csv layout); shards are read in parallel."""
+        frames = [f for f in _shard_pool().map(pd.read_csv, self.shard_files()) if len(f)]
+        if not frames:
+            return pd.DataFrame(columns=SCHEDULE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+def split_schedule(src: str, root: str) -> int:
+    """Write a schedule file (CSV or ``.slots``) as a sharded schedule directory; returns the shard count."""
+    store = SlotStore.load(src)
+    sharded = ShardedStore(os.path.abspath(root))
+    shards = {}
+    for doctor_id in store.doctor_ids():
+        sharded._new_names[doctor_id] = store.doctor_names[doctor_id]
+        for day in store._doctor_days[doctor_id]:
+            key = (doctor_id, _month(day * _MINUTES_PER_DAY))
+            shard = shards.setdefault(key, SlotStore())
+            shard._add_day(doctor_id, store.doctor_names[doctor_id], day, store._days[(doctor_id, day)])
+    for key, shard in shards.items():
+        path = sharded.shard_path(*key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_store(shard, path)
+    sharded.save()
+    return len(shards)
+
+
+@contextmanager
+def schedule_lock(path: str, slots=None):
+    """Lock the schedule at `path` for an update.
+
+    A single file is locked as a whole. For a sharded schedule only the
+    shards of `slots` — (doctor_id, slot_start) pairs — are locked, in a
+    fixed order so that overlapping callers cannot deadlock; without
+    `slots`, every shard and the doctor list are locked (schedule-wide
+    changes like `extend_schedule`).
+    """
+    if not is_sharded_schedule(path):
+        with file_lock(path):
+            yield
+        return
+    root = os.path.abspath(path)
+    sharded = ShardedStore(root)
+    if slots is None:
+        paths = sharded.shard_files() + [os.path.join(root, MANIFEST)]
+    else:
+        paths = [sharded.shard_path(d, _month(_to_minutes(start))) for d, start in slots]
+    with ExitStack() as stack:
+        for p in sorted(set(paths)):
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            stack.enter_context(file_lock(p))
+        yield
+
+
+def schedule_stamp(path: str):
+    """Changes whenever the schedule at `path` does (`file_stamp` of the file, or of every shard)."""
+    if not is_sharded_schedule(path):
+        return file_stamp(path)
+    sharded = open_store(path)
+    return tuple(file_stamp(p) for p in [os.path.join(sharded.root, MANIFEST)] + sharded.shard_files())
+
+
+# Stores opened from disk, keyed by path and validated against the file's
+# inode/mtime/size so that writes from other processes are picked up.
+# A sharded schedule is one long-lived `ShardedStore` per directory; its
+# shards are cached here individually.
+_OPEN_STORES = {}
+
+
+def _cached_store(path: str):
+    """The cached store for the absolute `path` if its file has not changed since, else None."""
+    cached = _OPEN_STORES.get(path)
+    if cached is not None and cached[0] == file_stamp(path):
+        return cached[1]
+    return None
+
+
+def open_store(path: str):
+    """Return the cached `SlotStore` for `path`, reloading it if the file changed.
+
+    For a sharded schedule directory this is its `ShardedStore`.
+    """
+    path = os.path.abspath(path)
+    if is_sharded_schedule(path):
+        cached = _OPEN_STORES.get(path)
+        if cached is None:
+            cached = _OPEN_STORES.setdefault(path, (None, ShardedStore(path)))
+        return cached[1]
+    store = _cached_store(path)
+    if store is not None:
+        return store
+    stamp = file_stamp(path)
+    store = SlotStore.load(path)
+    store._dirty.clear()
+    _OPEN_STORES[path] = (stamp, store)
+    return store
+
+
+def save_store(store, path: str):
+    """Persist `store` to `path` and refresh its cache entry."""
+    path = os.path.abspath(path)
+    if isinstance(store, ShardedStore):
+        store.save(path)
+        return
+    with span("schedule.write") as s:
+        s.nbytes = store.save(path)
+    _OPEN_STORES[path] = (file_stamp(path), store)
+
+
+def forget_store(path: str):
+    """Drop the cached store for `path` (e.g. after a failed write).
+
+    A sharded schedule only drops the shards the calling thread changed.
+    """
+    path = os.path.abspath(path)
+    cached = _OPEN_STORES.get(path)
+    if cached is not None and isinstance(cached[1], ShardedStore):
+        cached[1].forget()
+        return
+    _OPEN_STORES.pop(path, None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split a schedule into per-doctor, per-month shards, "
+                                                 "or archive a sharded schedule's old months.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split = commands.add_parser("split", help="doctor_schedule.csv (or .slots) -> schedule directory")
+    split.add_argument("src")
+    split.add_argument("root")
+    archive = commands.add_parser("archive", help="move months before --before to <root>/archive/")
+    archive.add_argument("root")
+    archive.add_argument("--before", required=True, help="YYYY-MM")
+    args = parser.parse_args()
+    if args.command == "split":
+        print(f"Wrote {split_schedule(args.src, args.root)} shards to {args.root}")
+    else:
+        with schedule_lock(args.root):
+            result = open_store(args.root).archive_months(args.before)
+        print(f"Archived {result['shards']} shards ({result['slots']} slots)")
@@ -0,0 +1,763 @@
+"""Storage backends for patients, appointments and reminders.
+
+`CsvBackend` keeps the original data/*.csv files; `SqliteBackend` stores the
+same tables in one SQLite database in WAL mode, so appends and updates touch
+only the affected rows. `data_loader.get_backend()` picks one from config.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
+from patient_index import patient_lookup_key
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+TABLE_COLUMNS = {
+    "patients": ["patient_id", "first_name", "last_name", "dob", "email"],
+    "appointments": [
+        "appointment_id", "patient_id", "patient_name", "dob", "patient_type",
+        "doctor_id", "doctor_name", "slot_start", "slot_end", "clinic_location",
+        "insurance_carrier", "member_id", "group_number", "intake_form_sent",
+        "confirmation_sent", "status"
+    ],
+    "reminders": [
+        "reminder_id", "appointment_id", "patient_name", "doctor_name", "send_time",
+        "email", "status", "reminder_number", "scheduled_for", "sent_at", "channel",
+        "response_forms_filled", "response_confirmed", "response_cancel_reason",
+        "claimed_by", "lease_expires", "slot_start"
+    ],
+    "waitlist": [
+        "waitlist_id", "patient_id", "first_name", "last_name", "dob", "email", "patient_type",
+        "doctor_id", "duration", "window_start", "window_end", "clinic_location", "created_at",
+        "status", "appointment_id", "offered_at"
+    ],
+}
+
+REMINDER_KEYS = ["appointment_id", "reminder_number"]
+# CsvBackend records reminder claims and sends in an append-only journal next
+# to reminders.csv (these columns, one line per row changed) instead of
+# rewriting the table for every batch; readers apply it on load, and it is
+# folded into the table on the next table write or once it passes this size.
+REMINDER_JOURNAL_COLUMNS = REMINDER_KEYS + ["claimed_by", "lease_expires", "sent_at"]
+REMINDER_JOURNAL_FOLD_BYTES = 1 << 20
+# Reminders of cancelled appointments keep their row but are never sent.
+REMINDER_CANCELLED = "cancelled"
+LEASE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_locks_held = threading.local()
+# Per thread, while a `CsvBackend.transaction` is open: the table files it
+# covers and, for each one rewritten so far, its previous version (None if
+# the file did not exist).
+_csv_journal = threading.local()
+# reminders.csv path -> (file stamp, parsed table), so claiming workers only
+# parse the table again after someone rewrote it.
+_reminder_tables = {}
+
+
+def _lock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.01)
+
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on `path` (via `path.lock`) across threads and processes.
+
+    Re-entrant within a thread, so a function that already holds the lock can
+    call other helpers that take it too.
+    """
+    lock_path = os.path.abspath(path) + ".lock"
+    held = getattr(_locks_held, "paths", None)
+    if held is None:
+        held = _locks_held.paths = set()
+    if lock_path in held:
+        yield
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _lock_fd(fd)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+
+def file_stamp(path: str):
+    """(inode, mtime, size) of `path`, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def atomic_write_csv(df: pd.DataFrame, path: str):
+    """Write `df` to a temp file next to `path` and rename it into place."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with span(f"csv.write[{os.path.basename(path)}]") as s:
+        df.to_csv(tmp, index=False)
+        s.rows = len(df)
+        if s:
+            s.nbytes = os.path.getsize(tmp)
+        _keep_original(path)
+        os.replace(tmp, path)
+
+
+def _keep_original(path: str):
+    """Before a table file's first rewrite in a CSV transaction, hard-link its current version aside."""
+    originals = getattr(_csv_journal, "originals", None)
+    path = os.path.abspath(path)
+    if originals is None or path in originals or path not in _csv_journal.paths:
+        return
+    backup = None
+    if os.path.exists(path):
+        backup = f"{path}.{os.getpid()}.orig"
+        if os.path.exists(backup):
+            os.remove(backup)
+        try:
+            os.link(path, backup)
+        except OSError:   # no hard links on this filesystem
+            shutil.copy2(path, backup)
+    originals[path] = backup
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """`pd.read_csv`, timed as a ``csv.read[<file>]`` stage."""
+    with span(f"csv.read[{os.path.basename(path)}]") as s:
+        df = pd.read_csv(path, **kwargs)
+        s.rows = len(df)
+    return df
+
+
+def _filter_frame(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """Apply `iter_chunks` filters to a loaded frame (values compared as text)."""
+    for column, condition in (filters or {}).items():
+        values = df[column].astype(str)
+        if isinstance(condition, tuple):
+            lo, hi = condition
+            if lo is not None:
+                df, values = df[values >= lo], values[values >= lo]
+            if hi is not None:
+                df = df[values < hi]
+        else:
+            df = df[values.isin([str(v) for v in condition])]
+    return df
+
+
+def _unsent(reminders: pd.DataFrame) -> pd.Series:
+    """Reminders still to be sent: no `sent_at` and not cancelled."""
+    unsent = reminders["sent_at"].isna() | (reminders["sent_at"] == "")
+    if "status" in reminders:
+        unsent &= reminders["status"] != REMINDER_CANCELLED
+    return unsent
+
+
+class CsvBackend:
+    """One CSV file per table. Every write rewrites the file under its lock,
+    except reminder claims and sends, which append to the reminder journal."""
+
+    name = "csv"
+
+    def __init__(self, paths: dict):
+        self.paths = paths
+
+    def load(self, table: str) -> pd.DataFrame:
+        path = self.paths[table]
+        if os.path.exists(path):
+            df = read_csv(path)
+            return self._apply_journal(df) if table == "reminders" else df
+        return pd.DataFrame(columns=TABLE_COLUMNS[table])
+
+    def version(self, table: str):
+        """Changes whenever the table's file is rewritten (its stamp)."""
+        return file_stamp(self.paths[table])
+
+    def append(self, table: str, records: list):
+        path = self.paths[table]
+        df = pd.DataFrame(records)
+        with file_lock(path):
+            if table == "reminders":
+                self._fold_journal()
+            if os.path.exists(path):
+                old = read_csv(path)
+                out = pd.concat([old, df], ignore_index=True)
+            else:
+                columns = TABLE_COLUMNS[table]
+                out = df.reindex(columns=columns + [c for c in df.columns if c not in columns])
+            atomic_write_csv(out, path)
+
+    def update(self, table: str, keys: list, records: list):
+        """Set the non-key fields of `records` on the rows matching their `keys`."""
+        if not records:
+            return
+        path = self.paths[table]
+        # Keys are matched as text on both sides: read_csv would otherwise
+        # turn an all-digit id like "12345678" into an int that no str key matches.
+        changes = pd.DataFrame(records).astype({k: str for k in keys}).set_index(keys)
+        if not os.path.exists(path):
+            return
+        with file_lock(path):
+            if table == "reminders":
+                self._fold_journal()
+            df = read_csv(path, dtype={k: str for k in keys})
+            # Files written before a column existed get it now.
+            columns = list(df.columns) + [c for c in changes.columns if c not in df.columns]
+            df = df.set_index(keys)
+            for column in changes.columns:
+                df[column] = df[column].astype(object) if column in df else None
+            df.update(changes)
+            atomic_write_csv(df.reset_index()[columns], path)
+
+    def iter_chunks(self, table: str, chunk_rows: int, filters: dict = None):
+        """Yield (rows, progress) for the table `chunk_rows` rows at a time, filtered.
+
+        `filters` maps a column to a list of allowed values or to a (lo, hi)
+        half-open range (either end may be None); values are compared as
+        text. `progress` is the fraction of the table read so far. The file
+        is read from one open handle, so a concurrent rewrite (a rename over
+        it) does not affect the rows returned.
+        """
+        path = self.paths[table]
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path) or 1
+        with open(path, "rb") as f:
+            for chunk in pd.read_csv(f, chunksize=chunk_rows):
+                yield _filter_frame(chunk, filters), min(f.tell() / size, 1.0)
+
+    def find_patient(self, first: str, last: str, dob: str):
+        df = self.load("patients")
+        if df.empty:
+            return None
+        m = df[
+            (df["first_name"].str.lower() == first.lower()) &
+            (df["last_name"].str.lower() == last.lower()) &
+            (df["dob"] == dob)
+        ]
+        return m.iloc[0].to_dict() if len(m) else None
+
+    def _pending_reminders(self) -> pd.DataFrame:
+        df = self.load("reminders")
+        return df[_unsent(df)]
+
+    def due_reminders(self, now: str, limit=None) -> pd.DataFrame:
+        """Unsent reminders with scheduled_for <= `now` ("%Y-%m-%d %H:%M"), earliest first."""
+        df = self._pending_reminders()
+        df = df[df["scheduled_for"] <= now].sort_values("scheduled_for", kind="stable")
+        return df if limit is None else df.head(limit)
+
+    def pending_reminders_since(self, cursor):
+        """Return (unsent reminders, new cursor) if the table changed since `cursor`.
+
+        The cursor is the file's stamp, so an unchanged file costs one stat().
+        """
+        stamp = file_stamp(self.paths["reminders"])
+        if stamp == cursor or stamp is None:
+            return pd.DataFrame(columns=TABLE_COLUMNS["reminders"]), stamp
+        return self._pending_reminders(), stamp
+
+    def _journal_path(self) -> str:
+        return self.paths["reminders"] + ".journal"
+
+    def _apply_journal(self, df: pd.DataFrame) -> pd.DataFrame:
+        """`df` (reminder rows) with the claims and sends in the journal applied; `df` itself is not changed."""
+        path = self._journal_path()
+        if not os.path.exists(path) or df.empty:
+            return df
+        journal = read_csv(path, dtype={"appointment_id": str, "claimed_by": object, "lease_expires": object,
+                                        "sent_at": object})
+        latest = journal.drop_duplicates(REMINDER_KEYS, keep="last").set_index(REMINDER_KEYS)
+        pos = latest.index.get_indexer(pd.MultiIndex.from_arrays(
+            [df["appointment_id"].astype(str), df["reminder_number"].astype(int)]))
+        hit = pos >= 0
+        if not hit.any():
+            return df
+        df = df.copy()
+        for column in REMINDER_JOURNAL_COLUMNS[2:]:
+            values = df[column].to_numpy(dtype=object, copy=True) if column in df else np.full(len(df), None)
+            values[hit] = latest[column].to_numpy(dtype=object)[pos[hit]]
+            df[column] = values
+        return df
+
+    def _append_journal(self, rows: pd.DataFrame):
+        """Record claimed or sent reminder rows in the journal (reminders lock held)."""
+        path = self._journal_path()
+        rows = rows[REMINDER_JOURNAL_COLUMNS].astype({"reminder_number": int})
+        with span("csv.append[reminders.csv.journal]") as s:
+            rows.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+            s.rows = len(rows)
+        if os.path.getsize(path) > REMINDER_JOURNAL_FOLD_BYTES:
+            self._fold_journal()
+
+    def _fold_journal(self):
+        """Write the journal into reminders.csv and remove it (reminders lock held)."""
+        path, journal = self.paths["reminders"], self._journal_path()
+        if not os.path.exists(journal):
+            return
+        if os.path.exists(path):
+            atomic_write_csv(self._apply_journal(read_csv(path)), path)
+        _keep_original(journal)
+        os.remove(journal)
+
+    def _read_reminders(self) -> pd.DataFrame:
+        """The reminders table with the journal applied; the file is only parsed again after a rewrite."""
+        path = self.paths["reminders"]
+        stamp = file_stamp(path)
+        cached = _reminder_tables.get(path)
+        if cached is None or cached[0] != stamp:
+            df = read_csv(path, dtype={"appointment_id": str, "sent_at": object, "claimed_by": object,
+                                       "lease_expires": object})
+            for column in ("claimed_by", "lease_expires"):
+                if column not in df:
+                    df[column] = None
+            cached = _reminder_tables[path] = (stamp, df)
+        return self._apply_journal(cached[1])
+
+    def claim_reminders(self, worker_id: str, now: datetime, lease_seconds: float, limit: int) -> pd.DataFrame:
+        """Lease up to `limit` due, unsent reminders to `worker_id`.
+
+        A reminder can be claimed if nobody holds it or its lease has expired
+        (e.g. the worker holding it crashed). The claim is appended to the
+        reminder journal, so it costs O(batch) writes, not a table rewrite.
+        """
+        path = self.paths["reminders"]
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=TABLE_COLUMNS["reminders"])
+        with file_lock(path):
+            df = self._read_reminders()
+            now_s = now.strftime(LEASE_FORMAT)
+            free = (
+                _unsent(df) &
+                (df["scheduled_for"] <= now.strftime("%Y-%m-%d %H:%M")) &
+                (df["lease_expires"].isna() | (df["lease_expires"] <= now_s))
+            )
+            idx = df[free].sort_values("scheduled_for", kind="stable").index[:limit]
+            claimed = df.loc[idx].assign(
+                claimed_by=worker_id, lease_expires=(now + timedelta(seconds=lease_seconds)).strftime(LEASE_FORMAT))
+            if len(claimed):
+                self._append_journal(claimed)
+            return claimed
+
+    def complete_reminders(self, worker_id: str, updates: list, now: datetime) -> int:
+        """Mark claimed reminders as sent; rows whose lease `worker_id` lost or let expire by `now` are skipped."""
+        if not updates:
+            return 0
+        path = self.paths["reminders"]
+        sent_at = {(str(u["appointment_id"]), int(u["reminder_number"])): u["sent_at"] for u in updates}
+        with file_lock(path):
+            df = self._read_reminders()
+            keys = list(zip(df["appointment_id"], df["reminder_number"].astype(int)))
+            mask = (
+                pd.Series([k in sent_at for k in keys], index=df.index) &
+                (df["claimed_by"] == worker_id) &
+                (df["lease_expires"] > now.strftime(LEASE_FORMAT)) &
+                (df["sent_at"].isna() | (df["sent_at"] == ""))
+            )
+            if mask.any():
+                self._append_journal(df[mask].assign(
+                    sent_at=[sent_at[k] for k, m in zip(keys, mask) if m], lease_expires=None))
+            return int(mask.sum())
+
+    @contextmanager
+    def transaction(self):
+        """Lock every table file (in a fixed order) for a multi-table write.
+
+        If the block raises, every table file it rewrote is put back as it
+        was (nested calls join the outer one). That only covers exceptions:
+        a process killed halfway leaves the files it already rewrote, so
+        deployments with several worker processes should use SQLite.
+        """
+        with ExitStack() as locks:
+            for table in TABLE_COLUMNS:
+                locks.enter_context(file_lock(self.paths[table]))
+            if getattr(_csv_journal, "originals", None) is not None:
+                yield
+                return
+            originals = _csv_journal.originals = {}
+            _csv_journal.paths = {os.path.abspath(p) for p in [*self.paths.values(), self._journal_path()]}
+            try:
+                yield
+            except BaseException:
+                for path, backup in originals.items():
+                    if backup is not None:
+                        os.replace(backup, path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                raise
+            else:
+                for backup in originals.values():
+                    if backup is not None:
+                        os.remove(backup)
+            finally:
+                _csv_journal.originals = None
+
+
+def _sql_value(value):
+    # Empty strings are stored as NULL, matching how pandas reads blank CSV cells.
+    if value is None or value == "" or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    return value
+
+
+class SqliteBackend:
+    """All tables in one SQLite database (WAL mode, one connection per thread)."""
+
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS patients (
+        patient_id TEXT PRIMARY KEY,
+        first_name TEXT COLLATE NOCASE,
+        last_name TEXT COLLATE NOCASE,
+        dob TEXT,
+        email TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_patients_name_dob ON patients (first_name, last_name, dob);
+
+    CREATE TABLE IF NOT EXISTS appointments (
+        appointment_id TEXT PRIMARY KEY,
+        patient_id TEXT, patient_name TEXT, dob TEXT, patient_type TEXT,
+        doctor_id TEXT, doctor_name TEXT, slot_start TEXT, slot_end TEXT,
+        clinic_location TEXT, insurance_carrier TEXT, member_id TEXT, group_number TEXT,
+        intake_form_sent INTEGER, confirmation_sent INTEGER, status TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_appointments_doctor_slot ON appointments (doctor_id, slot_start);
+
+    CREATE TABLE IF NOT EXISTS reminders (
+        reminder_id TEXT, appointment_id TEXT, patient_name TEXT, doctor_name TEXT,
+        send_time TEXT, email TEXT, status TEXT, reminder_number INTEGER,
+        scheduled_for TEXT, sent_at TEXT, channel TEXT, response_forms_filled TEXT,
+        response_confirmed TEXT, response_cancel_reason TEXT,
+        claimed_by TEXT, lease_expires TEXT, slot_start TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_reminders_scheduled_for ON reminders (scheduled_for);
+    CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders (scheduled_for) WHERE sent_at IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_reminders_appointment ON reminders (appointment_id, reminder_number);
+
+    CREATE TABLE IF NOT EXISTS waitlist (
+        waitlist_id TEXT PRIMARY KEY,
+        patient_id TEXT, first_name TEXT, last_name TEXT, dob TEXT, email TEXT, patient_type TEXT,
+        doctor_id TEXT, duration INTEGER, window_start TEXT, window_end TEXT, clinic_location TEXT,
+        created_at TEXT, status TEXT, appointment_id TEXT, offered_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_waitlist_waiting ON waitlist (doctor_id, window_start) WHERE status = 'waiting';
+    """
+
+    # Tables that readers cache; triggers bump their row in table_versions on every change.
+    VERSIONED_TABLES = ("patients", "appointments", "waitlist")
+
+    # patients.lookup_key holds `patient_index.patient_lookup_key` (names
+    # without case, accents or punctuation; ISO DOB), kept current by triggers
+    # calling the Python function registered on every connection.
+    PATIENT_KEY_TRIGGERS = """
+    CREATE INDEX IF NOT EXISTS idx_patients_lookup_key ON patients (lookup_key);
+    CREATE TRIGGER IF NOT EXISTS patients_insert_lookup_key AFTER INSERT ON patients BEGIN
+        UPDATE patients SET lookup_key = patient_lookup_key(NEW.first_name, NEW.last_name, NEW.dob)
+        WHERE rowid = NEW.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS patients_update_lookup_key AFTER UPDATE OF first_name, last_name, dob ON patients
+    BEGIN
+        UPDATE patients SET lookup_key = patient_lookup_key(NEW.first_name, NEW.last_name, NEW.dob)
+        WHERE rowid = NEW.rowid;
+    END;
+    """
+
+    # Every reminder that becomes pending -- inserted, or rescheduled in place --
+    # gets the next number of the "reminder_changes" counter in change_seq, so
+    # `pending_reminders_since` can page through new and rescheduled rows alike.
+    REMINDER_CHANGE_TRIGGERS = """
+    CREATE INDEX IF NOT EXISTS idx_reminders_changes ON reminders (change_seq) WHERE sent_at IS NULL;
+    CREATE TRIGGER IF NOT EXISTS reminders_insert_change AFTER INSERT ON reminders BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'reminder_changes';
+        UPDATE reminders SET change_seq = (SELECT version FROM table_versions WHERE name = 'reminder_changes')
+        WHERE rowid = NEW.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS reminders_reschedule_change AFTER UPDATE OF scheduled_for, sent_at ON reminders
+    WHEN NEW.sent_at IS NULL BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'reminder_changes';
+        UPDATE reminders SET change_seq = (SELECT version FROM table_versions WHERE name = 'reminder_changes')
+        WHERE rowid = NEW.rowid;
+    END;
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self.connection()
+        conn.executescript(self.SCHEMA)
+        conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        for table in self.VERSIONED_TABLES:
+            conn.execute("INSERT OR IGNORE INTO table_versions VALUES (?, 0)", (table,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table} "
+                    f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END"
+                )
+        # Databases created before a column was added get it on open.
+        for table, columns in TABLE_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        if "change_seq" not in {row[1] for row in conn.execute("PRAGMA table_info(reminders)")}:
+            conn.execute("ALTER TABLE reminders ADD COLUMN change_seq INTEGER")
+            conn.execute("UPDATE reminders SET change_seq = rowid")
+        conn.execute("INSERT OR IGNORE INTO table_versions SELECT 'reminder_changes', COALESCE(MAX(rowid), 0) "
+                     "FROM reminders")
+        conn.executescript(self.REMINDER_CHANGE_TRIGGERS)
+        if "lookup_key" not in {row[1] for row in conn.execute("PRAGMA table_info(patients)")}:
+            conn.execute("ALTER TABLE patients ADD COLUMN lookup_key TEXT")
+            conn.execute("UPDATE patients SET lookup_key = patient_lookup_key(first_name, last_name, dob)")
+        conn.executescript(self.PATIENT_KEY_TRIGGERS)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Connections must not cross a fork: reopen in a child process.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.create_function("patient_lookup_key", 3, patient_lookup_key, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in one write transaction (nested calls join the outer one)."""
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def load(self, table: str) -> pd.DataFrame:
+        cols = ", ".join(TABLE_COLUMNS[table])
+        return pd.read_sql_query(f"SELECT {cols} FROM {table} ORDER BY rowid", self.connection())
+
+    def version(self, table: str):
+        """Change counter of a table in VERSIONED_TABLES, shared by every process."""
+        return self.connection().execute(
+            "SELECT version FROM table_versions WHERE name = ?", (table,)
+        ).fetchone()[0]
+
+    def append(self, table: str, records: list):
+        cols = [c for c in TABLE_COLUMNS[table] if any(c in r for r in records)]
+        if not cols:
+            return
+        sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with span(f"sqlite.append[{table}]") as s, self.transaction() as conn:
+            conn.executemany(sql, [[_sql_value(r.get(c)) for c in cols] for r in records])
+            s.rows = len(records)
+
+    def update(self, table: str, keys: list, records: list):
+        """Set the non-key fields of `records` on the rows matching their `keys`.
+
+        Records that set the same fields share one prepared statement
+        (`executemany`); each row is found through the keys' index.
+        """
+        groups = {}
+        for r in records:
+            groups.setdefault(tuple(c for c in r if c not in keys), []).append(r)
+        with span(f"sqlite.update[{table}]") as s, self.transaction() as conn:
+            for fields, rows in groups.items():
+                sql = (f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in fields)} "
+                       f"WHERE {' AND '.join(f'{k} = ?' for k in keys)}")
+                conn.executemany(sql, [[_sql_value(r[c]) for c in fields] + [_sql_value(r[k]) for k in keys]
+                                       for r in rows])
+            s.rows = len(records)
+
+    def find(self, table: str, column: str, values) -> pd.DataFrame:
+        """Rows whose `column` is one of `values` (in table order), looked up through the column's index."""
+        values = list(dict.fromkeys(_sql_value(v) for v in values))
+        if not values:
+            return pd.DataFrame(columns=TABLE_COLUMNS[table])
+        cols = ", ".join(TABLE_COLUMNS[table])
+        conn = self.connection()
+        df = pd.concat([
+            pd.read_sql_query(f"SELECT rowid AS _rowid, {cols} FROM {table} "
+                              f"WHERE {column} IN ({', '.join('?' * len(chunk))})", conn, params=chunk)
+            for chunk in (values[i:i + 500] for i in range(0, len(values), 500))
+        ], ignore_index=True)
+        return df.sort_values("_rowid", kind="stable").drop(columns="_rowid").reset_index(drop=True)
+
+    def iter_chunks(self, table: str, chunk_rows: int, filters: dict = None):
+        """Yield (rows, progress) `chunk_rows` at a time; see `CsvBackend.iter_chunks`.
+
+        The filters become the WHERE clause, so only matching rows are read.
+        """
+        clauses, params = [], []
+        for column, condition in (filters or {}).items():
+            if column not in TABLE_COLUMNS[table]:
+                raise ValueError(f"Unknown {table} column {column!r}")
+            if isinstance(condition, tuple):
+                for op, bound in zip((">=", "<"), condition):
+                    if bound is not None:
+                        clauses.append(f"{column} {op} ?")
+                        params.append(bound)
+            else:
+                clauses.append(f"{column} IN ({', '.join('?' * len(condition))})")
+                params += [_sql_value(v) for v in condition]
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self.connection()
+        (total,) = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()
+        done = 0
+        cols = ", ".join(TABLE_COLUMNS[table])
+        for chunk in pd.read_sql_query(f"SELECT {cols} FROM {table}{where} ORDER BY rowid", conn,
+                                       params=params, chunksize=chunk_rows):
+            done += len(chunk)
+            yield chunk, min(done / (total or 1), 1.0)
+
+    def find_patient(self, first: str, last: str, dob: str):
+        """The first patient whose normalized name and DOB match (see PATIENT_KEY_TRIGGERS), via its index."""
+        cols = TABLE_COLUMNS["patients"]
+        row = self.connection().execute(
+            f"SELECT {', '.join(cols)} FROM patients WHERE lookup_key = ? ORDER BY rowid LIMIT 1",
+            (patient_lookup_key(first, last, dob),),
+        ).fetchone()
+        return dict(zip(cols, row)) if row else None
+
+    def due_reminders(self, now: str, limit=None) -> pd.DataFrame:
+        """Unsent reminders with scheduled_for <= `now`, earliest first (partial index scan)."""
+        cols = ", ".join(TABLE_COLUMNS["reminders"])
+        sql = (f"SELECT {cols} FROM reminders WHERE sent_at IS NULL AND scheduled_for <= ? "
+               f"AND status IS NOT '{REMINDER_CANCELLED}' ORDER BY scheduled_for LIMIT ?")
+        return pd.read_sql_query(sql, self.connection(), params=(now, -1 if limit is None else limit))
+
+    def pending_reminders_since(self, cursor):
+        """Return (unsent reminders added or rescheduled after `cursor`, new cursor).
+
+        The cursor is a `change_seq` number (see REMINDER_CHANGE_TRIGGERS),
+        read through the partial index on unsent rows.
+        """
+        cursor = cursor or 0
+        cols = ", ".join(TABLE_COLUMNS["reminders"])
+        df = pd.read_sql_query(
+            f"SELECT change_seq AS _seq, {cols} FROM reminders WHERE change_seq > ? AND sent_at IS NULL "
+            f"AND status IS NOT '{REMINDER_CANCELLED}' ORDER BY change_seq",
+            self.connection(), params=(cursor,),
+        )
+        if df.empty:
+            return df.drop(columns="_seq"), cursor
+        return df.drop(columns="_seq"), int(df["_seq"].iloc[-1])
+
+    def claim_reminders(self, worker_id: str, now: datetime, lease_seconds: float, limit: int) -> pd.DataFrame:
+        """Lease up to `limit` due, unsent reminders to `worker_id` in one write transaction.
+
+        A reminder can be claimed if nobody holds it or its lease has expired
+        (e.g. the worker holding it crashed).
+        """
+        now_s = now.strftime(LEASE_FORMAT)
+        with self.transaction() as conn:
+            rowids = [r[0] for r in conn.execute(
+                "SELECT rowid FROM reminders WHERE sent_at IS NULL AND scheduled_for <= ? "
+                f"AND status IS NOT '{REMINDER_CANCELLED}' "
+                "AND (lease_expires IS NULL OR lease_expires <= ?) ORDER BY scheduled_for LIMIT ?",
+                (now.strftime("%Y-%m-%d %H:%M"), now_s, limit),
+            )]
+            if not rowids:
+                return pd.DataFrame(columns=TABLE_COLUMNS["reminders"])
+            lease = (now + timedelta(seconds=lease_seconds)).strftime(LEASE_FORMAT)
+            conn.executemany("UPDATE reminders SET claimed_by = ?, lease_expires = ? WHERE rowid = ?",
+                             [(worker_id, lease, r) for r in rowids])
+            cols = ", ".join(TABLE_COLUMNS["reminders"])
+            return pd.read_sql_query(
+                f"SELECT {cols} FROM reminders WHERE rowid IN ({', '.join('?' * len(rowids))}) ORDER BY scheduled_for",
+                conn, params=rowids,
+            )
+
+    def complete_reminders(self, worker_id: str, updates: list, now: datetime) -> int:
+        """Mark claimed reminders as sent; rows whose lease `worker_id` lost or let expire by `now` are skipped."""
+        now_s = now.strftime(LEASE_FORMAT)
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE reminders SET sent_at = ?, lease_expires = NULL WHERE appointment_id = ? "
+                "AND reminder_number = ? AND claimed_by = ? AND lease_expires > ? AND sent_at IS NULL",
+                [(u["sent_at"], _sql_value(u["appointment_id"]), _sql_value(u["reminder_number"]), worker_id, now_s)
+                 for u in updates],
+            )
+            return conn.total_changes - before
+
+
+def migrate_csv_to_sqlite(csv_paths: dict, db_path: str) -> dict:
+    """Copy the CSV tables into a SQLite database once.
+
+    Tables that already hold rows are left alone, so re-running the migration
+    never duplicates data. Returns the number of rows copied per table.
+    """
+    csv = CsvBackend(csv_paths)
+    db = SqliteBackend(db_path)
+    copied = {}
+    for table in TABLE_COLUMNS:
+        (existing,) = db.connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        if existing:
+            copied[table] = 0
+            continue
+        df = csv.load(table)
+        df = df.astype(object).where(df.notna(), None)
+        db.append(table, df.to_dict("records"))
+        copied[table] = len(df)
+    return copied
+
+
+if __name__ == "__main__":
+    import data_loader
+
+    parser = argparse.ArgumentParser(description="Migrate data/*.csv into a SQLite database.")
+    parser.add_argument("--db", default=data_loader.DB_PATH, help="SQLite database path")
+    args = parser.parse_args()
+    counts = migrate_csv_to_sqlite(data_loader.csv_paths(), args.db)
+    for table, n in counts.items():
+        print(f"{table}: {n} rows migrated")
@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+
+def _schedule(doctors=("D1", "D2"), days=2, per_day=6):
+    """Half-hour slots from 2030-01-07 09:00, `per_day` a day; every fourth one (shifted daily) is taken."""
+    rows = []
+    for d in doctors:
+        for day in range(days):
+            day_start = datetime(2030, 1, 7, 9, 0) + timedelta(days=day)
+            for i in range(per_day):
+                start = day_start + timedelta(minutes=30 * i)
+                rows.append({
+                    "doctor_id": d, "doctor_name": f"Dr. {d}",
+                    "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                    "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                    "available": (i + day) % 4 != 3,
+                })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def make_schedule():
+    """Builds a small schedule frame (doctor_schedule.csv layout): make_schedule(doctors, days, per_day)."""
+    return _schedule
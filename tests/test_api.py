@@ -0,0 +1,128 @@
+import sys, os
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+import api
+import calendar_utils
+import data_loader
+import messaging
+
+DAY = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def client(request, tmp_path, monkeypatch):
+    rows = []
+    for d in ("D1", "D2"):
+        for i in range(8):
+            start = DAY + timedelta(minutes=30 * i)
+            rows.append({
+                "doctor_id": d, "doctor_name": f"Dr. {d}",
+                "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                "available": True,
+            })
+    pd.DataFrame(rows).to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    monkeypatch.setattr(data_loader, "SCHEDULE_CSV", str(tmp_path / "doctor_schedule.csv"))
+    monkeypatch.setattr(data_loader, "APPTS_CSV", str(tmp_path / "appointments.csv"))
+    monkeypatch.setattr(data_loader, "PATIENTS_CSV", str(tmp_path / "patients.csv"))
+    monkeypatch.setattr(data_loader, "REMINDERS_CSV", str(tmp_path / "reminders.csv"))
+    monkeypatch.setattr(data_loader, "WAITLIST_CSV", str(tmp_path / "waitlist.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    monkeypatch.setattr(calendar_utils, "EXPORTS_DIR", str(tmp_path / "exports"))
+    return TestClient(api.app)
+
+
+def _booking(**overrides):
+    body = {"first_name": "Asha", "last_name": "Rao", "dob": "1990-01-01", "email": "asha@example.com",
+            "doctor_id": "D1", "slot_start": "2030-01-07T09:00:00", "notify": False}
+    body.update(overrides)
+    return body
+
+
+def test_slots_pages_with_cursor(client):
+    first = client.get("/slots", params={"doctor": "Dr. D1", "limit": 3, "include_past": True}).json()
+    assert [s["slot_start"] for s in first["slots"]] == [
+        "2030-01-07T09:00:00", "2030-01-07T09:30:00", "2030-01-07T10:00:00"]
+    second = client.get("/slots", params={"doctor": "Dr. D1", "limit": 3, "include_past": True,
+                                          "cursor": first["next_cursor"]}).json()
+    assert second["slots"][0]["slot_start"] == "2030-01-07T10:30:00"
+    assert client.get("/slots", params={"limit": 0}).status_code == 422
+
+
+def test_new_patient_booking_then_conflict(client):
+    resp = client.post("/bookings", json=_booking())
+    assert resp.status_code == 201
+    body = resp.json()
+    assert body["patient_type"] == "new" and body["slot_end"] == "2030-01-07T10:00:00"
+
+    # The 60-minute visit took 09:00 and 09:30, so an overlapping booking conflicts.
+    resp = client.post("/bookings", json=_booking(first_name="Ravi", slot_start="2030-01-07T09:30:00"))
+    assert resp.status_code == 409
+
+    found = client.get("/patients/lookup", params={"first_name": "Asha", "last_name": "Rao", "dob": "1990-01-01"})
+    assert found.status_code == 200 and found.json()["patient_id"] == body["patient_id"]
+
+    # A returning patient gets a 30-minute visit.
+    again = client.post("/bookings", json=_booking(slot_start="2030-01-07T10:00:00"))
+    assert again.status_code == 201 and again.json()["patient_type"] == "returning"
+
+    listed = client.get("/appointments", params={"doctor_id": "D1", "date_from": "2030-01-07"}).json()
+    assert listed["total"] == 2
+    assert [a["slot_start"][:16] for a in listed["appointments"]] == ["2030-01-07 09:00", "2030-01-07 10:00"]
+
+
+def test_booking_errors(client):
+    assert client.post("/bookings", json=_booking(doctor_id="D9")).status_code == 404
+    assert client.post("/bookings", json=_booking(dob="not a date")).status_code == 422
+    missing = client.get("/patients/lookup", params={"first_name": "No", "last_name": "One", "dob": "1990-01-01"})
+    assert missing.status_code == 404
+
+
+def test_cancel_offers_freed_slot_to_waitlist(client):
+    booked = client.post("/bookings", json=_booking()).json()
+    for i, start in enumerate(("10:00", "11:00", "12:00")):
+        assert client.post("/bookings", json=_booking(first_name=f"P{i}", slot_start=f"2030-01-07T{start}:00")
+                           ).status_code == 201
+    waiting = client.post("/waitlist", json={
+        "first_name": "Ravi", "last_name": "Iyer", "dob": "1980-02-02", "doctor_id": "D1",
+        "window_start": "2030-01-07T08:00:00", "window_end": "2030-01-07T13:00:00"})
+    assert waiting.status_code == 201 and waiting.json()["duration"] == 60
+
+    moved = client.post(f"/appointments/{booked['appointment_id']}/reschedule",
+                        json={"slot_start": "2030-01-07T09:00:00", "doctor_id": "D2"})
+    assert moved.status_code == 200
+    assert moved.json()["offers"][0]["waitlist_id"] == waiting.json()["waitlist_id"]
+
+    offered = moved.json()["offers"][0]["appointment_id"]
+    assert client.post(f"/appointments/{offered}/cancel").json()["offers"] == []
+    assert client.post(f"/appointments/{offered}/cancel").status_code == 404
+    assert client.post("/appointments/nope/reschedule", json={"slot_start": "2030-01-07T09:00:00"}).status_code == 404
+
+
+def test_doctor_calendar_feed_with_etag(client):
+    booked = client.post("/bookings", json=_booking()).json()
+    feed = client.get("/calendars/doctors/D1.ics")
+    assert feed.status_code == 200 and feed.headers["content-type"].startswith("text/calendar")
+    assert f"UID:{booked['appointment_id']}" in feed.text and "STATUS:CONFIRMED" in feed.text
+    etag = feed.headers["etag"]
+    assert client.get("/calendars/doctors/D1.ics", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post(f"/appointments/{booked['appointment_id']}/cancel")
+    feed = client.get("/calendars/doctors/D1.ics", headers={"If-None-Match": etag})
+    assert feed.status_code == 200 and "STATUS:CANCELLED" in feed.text and "SEQUENCE:1" in feed.text
+
+    assert client.get("/calendars/clinics/main-clinic-bengaluru.ics").status_code == 200
+    assert client.get("/calendars/doctors/D2.ics").status_code == 200
+    assert client.get("/calendars/doctors/D9.ics").status_code == 404
+    assert client.get("/calendars/clinics/nowhere.ics").status_code == 404
@@ -0,0 +1,73 @@
+import sys, os
+import csv
+import json
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from batch_booking import BOOKED, INVALID, NO_SLOT, book_batch
+from slot_store import open_store
+from test_booking import DAY, data_dir   # noqa: F401 (fixture)
+
+
+def _write(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+
+def _run(data_dir, monkeypatch, lines, **kwargs):
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(data_dir / "outbox"))
+    monkeypatch.setattr("calendar_utils.EXPORTS_DIR", str(data_dir / "exports"))
+    _write(data_dir / "requests.jsonl", lines)
+    summary = book_batch(str(data_dir / "requests.jsonl"), str(data_dir / "report.csv"),
+                         schedule_path=str(data_dir / "doctor_schedule.csv"), not_before=DAY, **kwargs)
+    messaging.get_delivery_queue().flush()
+    with open(data_dir / "report.csv", encoding="utf-8") as f:
+        return summary, list(csv.DictReader(f))
+
+
+def test_batch_assigns_earliest_slots_and_writes_in_bulk(data_dir, monkeypatch):
+    data_loader.save_patient({"patient_id": "P1", "first_name": "Ravi", "last_name": "Rao",
+                              "dob": "1980-02-02", "email": "ravi@example.com"})
+    new = {"first_name": "Neha", "last_name": "Iyer", "dob": "1992-03-04", "email": "neha@example.com"}
+    summary, report = _run(data_dir, monkeypatch, [
+        {"request_id": "R1", "first_name": "ravi", "last_name": "RAO", "dob": "1980-02-02"},
+        {"request_id": "R2", **new, "preferred_doctor": "Dr. D2"},
+        {"request_id": "R3", **new},                        # same patient again, now known
+        "{not json",
+        {"request_id": "R5", "first_name": "A", "last_name": "B", "dob": "1990-01-01", "preferred_doctor": "Dr. X"},
+        {"request_id": "R6", "first_name": "A", "last_name": "B", "dob": "01/13/1990"},
+    ], chunk_size=2)
+
+    assert [r["status"] for r in report] == [BOOKED, BOOKED, BOOKED, INVALID, INVALID, INVALID]
+    assert report[3]["line"] == "4" and report[3]["reason"].startswith("bad JSON")
+    assert "unknown doctor" in report[4]["reason"] and "invalid dob" in report[5]["reason"]
+    assert [(r["patient_type"], r["doctor_id"], r["slot_start"]) for r in report[:3]] == [
+        ("returning", "D1", "2030-01-07 09:00"),
+        ("new", "D2", "2030-01-07 09:00"),
+        ("returning", "D1", "2030-01-07 09:30"),
+    ]
+    assert report[2]["patient_id"] == report[1]["patient_id"]
+    assert summary[BOOKED] == 3 and summary[INVALID] == 3 and summary["bookings_per_second"] > 0
+
+    assert len(data_loader.load_appointments()) == 3
+    assert list(data_loader.load_patients()["first_name"]) == ["Ravi", "Neha"]
+    assert len(data_loader.load_reminders()) == 9
+    store = open_store(str(data_dir / "doctor_schedule.csv"))
+    assert not store.is_free("D2", "2030-01-07 09:30", 1) and store.is_free("D2", "2030-01-07 10:00", 1)
+    assert len(os.listdir(data_dir / "outbox")) == 6 and len(os.listdir(data_dir / "exports")) == 3
+
+
+def test_batch_reports_no_slot_when_the_schedule_is_full(data_dir, monkeypatch):
+    requests = [{"request_id": f"R{i}", "first_name": "New", "last_name": f"P{i}", "dob": "1990-01-01"}
+                for i in range(18)]
+    summary, report = _run(data_dir, monkeypatch, requests, emails=False, ics=False)
+    # 2 doctors x 16 half-hour slots hold 16 one-hour visits for new patients.
+    assert summary[BOOKED] == 16 and summary[NO_SLOT] == 2
+    assert [r["status"] for r in report[-2:]] == [NO_SLOT, NO_SLOT]
+    starts = [r["slot_start"] for r in report[:16]]
+    assert starts == sorted(starts)
+    assert len(data_loader.load_appointments()) == 16
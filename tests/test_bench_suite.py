@@ -0,0 +1,28 @@
+import sys, os
+import json
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import data_loader
+import suite
+
+
+def test_suite_runs_every_case_and_compare_flags_regressions(tmp_path, monkeypatch):
+    for attr in ("STORAGE_BACKEND", "PATIENTS_CSV", "APPTS_CSV", "REMINDERS_CSV", "SCHEDULE_CSV", "DB_PATH"):
+        monkeypatch.setattr(data_loader, attr, getattr(data_loader, attr))
+    monkeypatch.setattr(suite.messaging, "OUTBOX_DIR", suite.messaging.OUTBOX_DIR)
+    monkeypatch.setattr(suite.calendar_utils, "EXPORTS_DIR", suite.calendar_utils.EXPORTS_DIR)
+    monkeypatch.setattr(suite.messaging, "deliver_now", lambda *args, **kwargs: None)
+
+    report = suite.run_suite([("tiny", 200)], repeat=2, max_seconds=1, log=lambda line: None)
+    assert set(report["results"]) == {f"{name}[tiny]" for name in suite.CASES} - {
+        "create_ics_for_appointment[tiny]"} | {"create_ics_for_appointment"}
+    assert all(r["runs"] >= 1 and r["median"] > 0 for r in report["results"].values())
+    json.dumps(report)
+
+    slower = json.loads(json.dumps(report))
+    slower["results"]["book_slot[tiny]"]["median"] *= 2
+    assert suite.compare(report, slower, threshold=0.2, log=lambda line: None) == ["book_slot[tiny]"]
+    assert suite.compare(slower, report, threshold=0.2, log=lambda line: None) == []
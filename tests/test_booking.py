@@ -0,0 +1,118 @@
+import sys, os
+import multiprocessing
+import random
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+from booking import book_appointment, BOOKED, SLOT_TAKEN
+from scheduling import book_slot, SlotTakenError
+
+DAY = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def data_dir(request, tmp_path, monkeypatch):
+    rows = []
+    for d in ("D1", "D2"):
+        for i in range(16):
+            start = DAY + timedelta(minutes=30 * i)
+            rows.append({
+                "doctor_id": d, "doctor_name": f"Dr. {d}",
+                "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                "available": True,
+            })
+    pd.DataFrame(rows).to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    monkeypatch.setattr(data_loader, "APPTS_CSV", str(tmp_path / "appointments.csv"))
+    monkeypatch.setattr(data_loader, "PATIENTS_CSV", str(tmp_path / "patients.csv"))
+    monkeypatch.setattr(data_loader, "REMINDERS_CSV", str(tmp_path / "reminders.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    return tmp_path
+
+
+def _point_at(directory, backend):
+    data_loader.APPTS_CSV = os.path.join(directory, "appointments.csv")
+    data_loader.PATIENTS_CSV = os.path.join(directory, "patients.csv")
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.STORAGE_BACKEND = backend
+
+
+def _attempt(doctor_id, start, duration, appointment_id, schedule_path):
+    slot = {
+        "doctor_id": doctor_id, "doctor_name": f"Dr. {doctor_id}",
+        "slot_start": start, "slot_end": start + timedelta(minutes=duration),
+    }
+    appt = {"appointment_id": appointment_id, "doctor_id": doctor_id,
+            "slot_start": start, "slot_end": slot["slot_end"], "status": "Booked"}
+    patient = {"patient_id": f"P{appointment_id}", "first_name": "A", "last_name": "B",
+               "dob": "1990-01-01", "email": "a@example.com"} if duration == 60 else None
+    return book_appointment(slot, duration, appt, "A", new_patient=patient, schedule_path=schedule_path)
+
+
+def test_book_slot_refuses_taken_slot(data_dir):
+    path = str(data_dir / "doctor_schedule.csv")
+    book_slot({"doctor_id": "D1", "slot_start": DAY}, 60, schedule_path=path)
+    with pytest.raises(SlotTakenError):
+        book_slot({"doctor_id": "D1", "slot_start": DAY + timedelta(minutes=30)}, 30, schedule_path=path)
+
+
+def test_book_appointment_writes_everything_or_nothing(data_dir):
+    path = str(data_dir / "doctor_schedule.csv")
+    assert _attempt("D1", DAY, 60, "A1", path)["status"] == BOOKED
+    result = _attempt("D1", DAY + timedelta(minutes=30), 30, "A2", path)
+    assert result["status"] == SLOT_TAKEN
+    assert "taken" in result["message"]
+
+    assert list(data_loader.load_appointments()["appointment_id"]) == ["A1"]
+    assert list(data_loader.load_patients()["patient_id"]) == ["PA1"]
+    assert list(data_loader.load_reminders()["appointment_id"]) == ["A1"] * 3
+
+
+def _worker(directory, backend, seed, attempts, queue):
+    _point_at(directory, backend)
+    schedule_path = os.path.join(directory, "doctor_schedule.csv")
+    rng = random.Random(seed)
+    booked = 0
+    for k in range(attempts):
+        duration = rng.choice((30, 60))
+        start = DAY + timedelta(minutes=30 * rng.randrange(16 - duration // 30 + 1))
+        result = _attempt(rng.choice(("D1", "D2")), start, duration, f"{seed}-{k}", schedule_path)
+        booked += result["status"] == BOOKED
+    queue.put(booked)
+
+
+def test_concurrent_bookings_never_double_book(data_dir):
+    workers, attempts = 8, 250
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(data_dir), data_loader.STORAGE_BACKEND, seed, attempts, queue)) for seed in range(workers)]
+    for p in procs:
+        p.start()
+    booked = sum(queue.get(timeout=120) for _ in procs)
+    for p in procs:
+        p.join()
+
+    appts = data_loader.load_appointments()
+    appts["slot_start"] = pd.to_datetime(appts["slot_start"])
+    appts["slot_end"] = pd.to_datetime(appts["slot_end"])
+    assert booked == len(appts) > 0
+
+    # No two appointments may cover the same base slot of the same doctor
+    covered = []
+    for row in appts.itertuples():
+        t = row.slot_start
+        while t < row.slot_end:
+            covered.append((row.doctor_id, t))
+            t += timedelta(minutes=30)
+    assert len(covered) == len(set(covered))
+
+    schedule = pd.read_csv(data_dir / "doctor_schedule.csv")
+    assert (~schedule["available"]).sum() == len(covered)
+    assert len(data_loader.load_reminders()) == 3 * len(appts)
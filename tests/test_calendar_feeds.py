@@ -0,0 +1,111 @@
+import sys, os
+import pandas as pd
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calendar_utils
+from calendar_utils import IcsFeed, clinic_feed, doctor_feed, refresh_feeds
+
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(calendar_utils, "EXPORTS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _appointments(n=40):
+    start = pd.Timestamp("2030-01-07 09:00") + pd.to_timedelta([(i // 8) * 1440 + (i % 8) * 30 for i in range(n)],
+                                                               unit="min")
+    return pd.DataFrame({
+        "appointment_id": [f"A{i:03d}" for i in range(n)],
+        "patient_name": [f"Patient, {i}" for i in range(n)],
+        "doctor_id": ["D1", "D2"] * (n // 2),
+        "doctor_name": ["Dr. One", "Dr. Two"] * (n // 2),
+        "slot_start": start.strftime("%Y-%m-%d %H:%M:%S"),
+        "slot_end": (start + pd.Timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S"),
+        "clinic_location": "Main Clinic - Bengaluru",
+        "status": "Booked",
+    })
+
+
+def _events(feed):
+    text = feed.read()
+    assert text.startswith("BEGIN:VCALENDAR\r\n") and text.endswith("END:VCALENDAR\r\n")
+    events = {}
+    for block in text.split("BEGIN:VEVENT\r\n")[1:]:
+        fields = dict(line.split(":", 1) for line in block.replace("\r\n ", "").split("\r\n") if ":" in line)
+        events[fields["UID"]] = fields
+    return events
+
+
+def test_feed_rerenders_only_changed_days(exports):
+    appts = _appointments()
+    feed = IcsFeed(str(exports / "feed.ics"), "All", lambda row: row["patient_name"])
+    assert feed.refresh(appts)
+    events = _events(feed)
+    assert len(events) == 40 and events["A000"]["SUMMARY"] == "Patient\\, 0"
+    assert (events["A009"]["DTSTART"], events["A009"]["SEQUENCE"]) == ("20300108T093000", "0")
+    etag = feed.etag
+
+    assert not feed.refresh(appts) and feed.etag == etag
+
+    # Cancel one appointment on the second day: only that day is re-rendered.
+    appts.loc[appts["appointment_id"] == "A009", "status"] = "Cancelled"
+    rendered = []
+    render = feed._render
+    feed._render = lambda row, *args: rendered.append(row["appointment_id"]) or render(row, *args)
+    assert feed.refresh(appts) and feed.etag != etag
+    assert rendered == [f"A{i:03d}" for i in range(8, 16)]
+    events = _events(feed)
+    assert (events["A009"]["STATUS"], events["A009"]["SEQUENCE"]) == ("CANCELLED", "1")
+    assert (events["A008"]["STATUS"], events["A008"]["SEQUENCE"]) == ("CONFIRMED", "0")
+
+
+def test_sequence_survives_restart_and_moves(exports):
+    appts = _appointments()
+    path = str(exports / "feed.ics")
+    IcsFeed(path, "All", lambda row: row["patient_name"]).refresh(appts)
+    appts.loc[appts["appointment_id"] == "A000", ["slot_start", "slot_end"]] = ["2030-01-20 10:00:00",
+                                                                                "2030-01-20 10:30:00"]
+    IcsFeed(path, "All", lambda row: row["patient_name"]).refresh(appts)
+
+    restarted = IcsFeed(path, "All", lambda row: row["patient_name"])
+    restarted.refresh(appts)
+    events = _events(restarted)
+    assert (events["A000"]["DTSTART"], events["A000"]["SEQUENCE"]) == ("20300120T100000", "1")
+    assert events["A001"]["SEQUENCE"] == "0"
+    assert list(events)[-1] == "A000"
+
+
+def test_refresh_feeds_writes_doctor_and_clinic_feeds(exports):
+    appts = _appointments()
+    appts.loc[appts.index[-4:], "clinic_location"] = "Satellite - Indiranagar"
+    written = refresh_feeds(appts)
+    assert sorted(os.path.basename(p) for p in written) == [
+        "clinic_main-clinic-bengaluru.ics", "clinic_satellite-indiranagar.ics", "doctor_d1.ics", "doctor_d2.ics"]
+    assert all(written.values())
+    assert len(_events(doctor_feed("D1"))) == 20
+    assert len(_events(clinic_feed("Satellite - Indiranagar"))) == 4
+    assert "Patient\\, 39 with Dr. Two" in clinic_feed("Satellite - Indiranagar").read()
+
+    appts.loc[appts["appointment_id"] == "A002", "status"] = "Cancelled"
+    written = refresh_feeds(appts)
+    assert [os.path.basename(p) for p, changed in written.items() if changed] == [
+        "doctor_d1.ics", "clinic_main-clinic-bengaluru.ics"]
+
+
+def test_long_lines_are_folded():
+    line = "SUMMARY:" + "é" * 60
+    folded = calendar_utils._fold(line)
+    assert all(len(part.encode()) <= 75 for part in folded.rstrip("\r\n").split("\r\n"))
+    assert folded.replace("\r\n ", "") == line + "\r\n"
+
+
+def test_prune_appointment_ics(exports):
+    old = calendar_utils.create_ics_for_appointment("old", "Dr. One", pd.Timestamp("2030-01-07 09:00"), 30, "Clinic")
+    calendar_utils.create_ics_for_appointment("new", "Dr. One", pd.Timestamp("2030-01-07 09:00"), 30, "Clinic")
+    os.utime(old, (0, 0))
+    assert calendar_utils.prune_appointment_ics(max_age_days=1) == 1
+    assert os.listdir(exports) == ["appointment_new.ics"]
@@ -0,0 +1,90 @@
+import sys, os
+import queue
+import socket
+import threading
+
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery import DeliveryQueue, FileOutboxTransport, SmtpTransport, new_message
+
+
+def test_outbox_names_do_not_collide(tmp_path):
+    transport = FileOutboxTransport(str(tmp_path))
+    paths = {transport.send(new_message("a@example.com", "Subject: Hi\n\nBody")) for _ in range(20)}
+    assert len(paths) == 20
+    assert len(os.listdir(tmp_path)) == 20
+
+
+class _Flaky:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    def send(self, message):
+        if self.failures.get(message["to"], 0):
+            self.failures[message["to"]] -= 1
+            raise ConnectionError("temporary")
+        self.sent.append(message["to"])
+
+    def close(self):
+        pass
+
+
+def test_queue_retries_then_gives_up():
+    transport = _Flaky({"retry@example.com": 2, "dead@example.com": 99})
+    q = DeliveryQueue(transport, workers=2, retries=2, backoff=0.001)
+    for to in ("ok@example.com", "retry@example.com", "dead@example.com"):
+        q.enqueue(new_message(to, "Subject: x\n\ny"))
+    q.close()
+    assert sorted(transport.sent) == ["ok@example.com", "retry@example.com"]
+    assert q.sent == 2
+    assert [m["to"] for m, _ in q.failed] == ["dead@example.com"]
+
+
+def test_full_queue_pushes_back():
+    gate = threading.Event()
+
+    class Blocked(_Flaky):
+        def send(self, message):
+            gate.wait()
+
+    q = DeliveryQueue(Blocked({}), workers=1, max_pending=2)
+    for _ in range(3):   # one in flight, two waiting
+        q.enqueue(new_message("a@example.com", "x"), timeout=1)
+    with pytest.raises(queue.Full):
+        q.enqueue(new_message("a@example.com", "x"), timeout=0.05)
+    gate.set()
+    q.close()
+    assert q.sent == 3
+
+
+def test_smtp_pool_reuses_connections():
+    controller_mod = pytest.importorskip("aiosmtpd.controller")
+    from aiosmtpd.handlers import Sink
+
+    sessions = []
+
+    class Handler(Sink):
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            sessions.append(session)
+            session.host_name = hostname
+            return responses
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    controller = controller_mod.Controller(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        transport = SmtpTransport("127.0.0.1", port, pool_size=2)
+        q = DeliveryQueue(transport, workers=2)
+        for i in range(20):
+            q.enqueue(new_message(f"p{i}@example.com", "Subject: Reminder\n\nSee you soon."))
+        q.close()
+    finally:
+        controller.stop()
+    assert q.sent == 20 and not q.failed
+    assert len(sessions) <= 2
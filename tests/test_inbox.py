@@ -0,0 +1,187 @@
+import sys, os
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from booking import BOOKED, book_appointment
+from inbox import ingest_replies, parse_answers, parse_reply
+from slot_store import open_store
+from waitlist import join_waitlist
+
+DAY = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def schedule(request, tmp_path, monkeypatch):
+    rows = []
+    for i in range(8):
+        start = DAY + timedelta(minutes=30 * i)
+        rows.append({"doctor_id": "D1", "doctor_name": "Dr. D1", "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                     "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"), "available": True})
+    pd.DataFrame(rows).to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    for name in ("APPTS", "PATIENTS", "REMINDERS", "WAITLIST"):
+        monkeypatch.setattr(data_loader, f"{name}_CSV", str(tmp_path / f"{name.lower()}.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    for i, appointment_id in enumerate(("A1", "A2", "A3")):
+        start = DAY + timedelta(minutes=30 * i)
+        slot = {"doctor_id": "D1", "doctor_name": "Dr. D1", "slot_start": start,
+                "slot_end": start + timedelta(minutes=30)}
+        appt = {"appointment_id": appointment_id, "patient_id": f"P{i}", "patient_name": "Asha Rao",
+                "doctor_id": "D1", "doctor_name": "Dr. D1", "slot_start": start, "slot_end": slot["slot_end"],
+                "clinic_location": "Main Clinic - Bengaluru", "status": "Booked"}
+        assert book_appointment(slot, 30, appt, "Asha", email="a@example.com",
+                                schedule_path=str(tmp_path / "doctor_schedule.csv"))["status"] == BOOKED
+    return str(tmp_path / "doctor_schedule.csv")
+
+
+def _reply(inbox, name, appointment_id, text, message_id=None, date="Mon, 06 Jan 2030 10:00:00 +0000",
+           reminder_number=2, sender="Asha Rao <A@example.com>"):
+    """Write a reply that quotes the reminder it answers, as a mail client would."""
+    reminders = data_loader.load_reminders()
+    row = reminders[(reminders["appointment_id"] == appointment_id) &
+                    (reminders["reminder_number"] == reminder_number)].iloc[0].to_dict()
+    quoted = "\n".join(f"> {line}" for line in messaging.render_reminders([row])[0].splitlines()[2:])
+    os.makedirs(inbox, exist_ok=True)
+    with open(os.path.join(inbox, name), "w", encoding="utf-8") as f:
+        f.write(f"Message-ID: <{message_id or name}@mail.example.com>\nFrom: {sender}\n"
+                f"Subject: Re: Action Needed: Forms & Confirmation\nDate: {date}\n\n"
+                f"{text}\n\nOn Sun, 5 Jan 2030, Clinic wrote:\n{quoted}\n")
+
+
+def _reminder(appointment_id, reminder_number=2) -> dict:
+    reminders = data_loader.load_reminders()
+    return reminders[(reminders["appointment_id"] == appointment_id) &
+                     (reminders["reminder_number"] == reminder_number)].iloc[0].to_dict()
+
+
+def _status(appointment_id) -> str:
+    appts = data_loader.load_appointments()
+    return appts.loc[appts["appointment_id"] == appointment_id, "status"].item()
+
+
+def test_parse_answers():
+    assert parse_answers("Yes, confirm") == {"response_forms_filled": "yes", "response_confirmed": "yes",
+                                            "response_cancel_reason": ""}
+    assert parse_answers("FORMS YES; VISIT CANCEL (reason: car broke down)") == {
+        "response_forms_filled": "yes", "response_confirmed": "no", "response_cancel_reason": "car broke down"}
+    assert parse_answers("Sorry, I'm sick. Cancel please.") == {
+        "response_confirmed": "no", "response_cancel_reason": "Sorry, I'm sick"}
+    assert parse_answers("no") == {"response_forms_filled": "no"}
+    # Contradicting answers are left for a human.
+    assert parse_answers("I can't confirm, please cancel") == {}
+    assert parse_answers("See you then") == {}
+
+
+def test_parse_reply_reads_only_the_unquoted_text(schedule, tmp_path):
+    _reply(str(tmp_path / "inbox"), "r1.eml", "A1", "Confirmed, thanks!")
+    with open(tmp_path / "inbox" / "r1.eml", "rb") as f:
+        reply = parse_reply(f.read())
+    # The quoted reminder says "Reply YES/NO" and "CONFIRM/CANCEL"; only the reply's own text counts.
+    assert reply == {"message_id": "<r1.eml@mail.example.com>", "received": 1893924000.0,
+                     "sender": "a@example.com", "appointment_id": "A1", "reminder_number": 2,
+                     "response_confirmed": "yes", "response_cancel_reason": ""}
+
+
+def test_parse_multipart_reply():
+    from email.message import EmailMessage
+    msg = EmailMessage()
+    msg["Message-ID"] = "<m1@mail.example.com>"
+    msg["Subject"] = "Re: Final Reminder: Your Appointment Today"
+    msg.set_content("Cancel. Stuck at work, sorry!\n\n> Reference: A7/3\n")
+    msg.add_alternative("<p>Cancel. Stuck at work, sorry!</p><blockquote>Reference: A7/3</blockquote>",
+                        subtype="html")
+    reply = parse_reply(msg.as_bytes(policy=msg.policy.clone(linesep="\r\n")), received=5.0)
+    assert reply == {"message_id": "<m1@mail.example.com>", "received": 5.0, "sender": "", "appointment_id": "A7",
+                     "reminder_number": 3, "response_confirmed": "no", "response_cancel_reason": "Stuck at work, sorry"}
+
+
+def test_ingest_updates_reminders_and_appointments(schedule, tmp_path):
+    inbox = str(tmp_path / "inbox")
+    join_waitlist("Ravi", "Patel", "1985-05-05", 30, DAY, DAY + timedelta(hours=4), doctor_id="D1")
+    _reply(inbox, "r1.eml", "A1", "YES, CONFIRM")
+    _reply(inbox, "r2.eml", "A2", "FORMS NO; VISIT CANCEL - travelling that week")
+    _reply(inbox, "r3.eml", "A3", "yes", reminder_number=3)
+    with open(os.path.join(inbox, "spam.eml"), "w", encoding="utf-8") as f:
+        f.write("Subject: Win a prize\n\nClick here\n")
+
+    summary = ingest_replies(inbox, schedule, notify=False)
+    assert summary == {"messages": 4, "duplicates": 0, "unparsed": 1, "reminders": 3, "confirmed": 1,
+                       "cancelled": 1, "offers": 1}
+    assert (_reminder("A1")["response_forms_filled"], _reminder("A1")["response_confirmed"]) == ("yes", "yes")
+    assert _reminder("A2")["response_cancel_reason"] == "travelling that week"
+    assert _reminder("A3", 3)["response_forms_filled"] == "yes"
+    assert pd.isna(_reminder("A3", 2)["response_forms_filled"])
+    assert [_status(a) for a in ("A1", "A2", "A3")] == ["Confirmed", "Cancelled", "Booked"]
+    # A2's slot was freed and offered to the waitlist.
+    assert not open_store(schedule).is_free("D1", DAY + timedelta(minutes=30), 1)
+    assert sorted(n for n in os.listdir(inbox) if not n.startswith(".")) == ["processed", "unparsed"]
+    assert os.listdir(os.path.join(inbox, "unparsed")) == ["spam.eml"]
+    assert len(os.listdir(os.path.join(inbox, "processed"))) == 3
+
+    # A re-delivered reply is skipped, even though the reminder has changed since.
+    data_loader.update_reminders([{"appointment_id": "A1", "reminder_number": 2, "response_forms_filled": "no"}])
+    _reply(inbox, "r1-again.eml", "A1", "YES, CONFIRM", message_id="r1.eml")
+    summary = ingest_replies(inbox, schedule, notify=False)
+    assert (summary["messages"], summary["duplicates"], summary["reminders"]) == (1, 1, 0)
+    assert _reminder("A1")["response_forms_filled"] == "no"
+
+
+def test_latest_reply_wins(schedule, tmp_path):
+    inbox = str(tmp_path / "inbox")
+    # Files arrive in the opposite order of the Date headers.
+    _reply(inbox, "a.eml", "A1", "CONFIRM", date="Mon, 06 Jan 2030 12:00:00 +0000")
+    _reply(inbox, "b.eml", "A1", "Cancel please", date="Mon, 06 Jan 2030 09:00:00 +0000")
+    _reply(inbox, "c.eml", "A2", "Cancel, I moved away", date="Mon, 06 Jan 2030 08:00:00 +0000")
+    summary = ingest_replies(inbox, schedule, notify=False)
+    assert (summary["confirmed"], summary["cancelled"]) == (1, 1)
+    assert (_status("A1"), _reminder("A1")["response_confirmed"]) == ("Confirmed", "yes")
+    assert pd.isna(_reminder("A1")["response_cancel_reason"])
+
+    # A2 was cancelled by an earlier run; a later CONFIRM is recorded but does not bring it back.
+    _reply(inbox, "d.eml", "A2", "Confirm", date="Mon, 06 Jan 2030 09:00:00 +0000", reminder_number=3)
+    assert ingest_replies(inbox, schedule, notify=False)["confirmed"] == 0
+    assert _status("A2") == "Cancelled"
+    assert (_reminder("A2")["response_cancel_reason"], _reminder("A2", 3)["response_confirmed"]) == (
+        "I moved away", "yes")
+
+
+def test_replies_from_another_sender_are_not_applied(schedule, tmp_path):
+    inbox = str(tmp_path / "inbox")
+    # Anyone can guess a reference; only the reminder's recipient may answer it.
+    _reply(inbox, "r1.eml", "A1", "Cancel", sender="mallory@example.com")
+    _reply(inbox, "r2.eml", "A2", "CONFIRM")
+    _reply(inbox, "r3.eml", "A3", "CONFIRM")
+    with open(os.path.join(inbox, "r3.eml"), encoding="utf-8") as f:
+        unknown = f.read().replace("Reference: A3/2", "Reference: A9/2")
+    with open(os.path.join(inbox, "r3.eml"), "w", encoding="utf-8") as f:
+        f.write(unknown)
+    summary = ingest_replies(inbox, schedule, notify=False)
+    assert (summary["unparsed"], summary["reminders"], summary["cancelled"], summary["confirmed"]) == (2, 1, 0, 1)
+    assert [_status(a) for a in ("A1", "A2")] == ["Booked", "Confirmed"]
+    assert sorted(os.listdir(os.path.join(inbox, "unparsed"))) == ["r1.eml", "r3.eml"]
+    assert os.listdir(os.path.join(inbox, "processed")) == ["r2.eml"]
+
+
+def test_reply_to_a_reminder_without_an_address_is_checked_against_the_patient(schedule, tmp_path):
+    start = DAY + timedelta(hours=2)
+    slot = {"doctor_id": "D1", "doctor_name": "Dr. D1", "slot_start": start, "slot_end": start + timedelta(minutes=30)}
+    appt = {"appointment_id": "A4", "patient_id": "P4", "patient_name": "Ravi Iyer", "doctor_id": "D1",
+            "doctor_name": "Dr. D1", "slot_start": start, "slot_end": slot["slot_end"],
+            "clinic_location": "Main Clinic - Bengaluru", "status": "Booked"}
+    patient = {"patient_id": "P4", "first_name": "Ravi", "last_name": "Iyer", "dob": "1990-02-02",
+               "email": "ravi@example.com"}
+    assert book_appointment(slot, 30, appt, "Ravi", email=None, new_patient=patient,
+                            schedule_path=schedule)["status"] == BOOKED
+    inbox = str(tmp_path / "inbox")
+    _reply(inbox, "r1.eml", "A4", "CONFIRM", sender="Ravi <ravi@example.com>")
+    _reply(inbox, "r2.eml", "A4", "CANCEL", sender="mallory@example.com", date="Mon, 06 Jan 2030 11:00:00 +0000")
+    summary = ingest_replies(inbox, schedule, notify=False)
+    assert (summary["unparsed"], summary["confirmed"]) == (1, 1)
+    assert _status("A4") == "Confirmed"
@@ -0,0 +1,68 @@
+import sys, os
+import pytest
+from datetime import timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from test_booking import DAY, _attempt, data_dir   # noqa: F401 (fixture)
+
+
+@pytest.fixture
+def recording():
+    metrics.METRICS.reset()
+    metrics.enable()
+    yield metrics.METRICS
+    metrics.enable(False)
+    metrics.METRICS.reset()
+
+
+def test_disabled_spans_record_nothing():
+    metrics.enable(False)
+    metrics.METRICS.reset()
+
+    @metrics.timed("noop")
+    def add(a, b):
+        return a + b
+
+    assert add(1, 2) == 3
+    with metrics.span("noop") as s:
+        s.rows = 10
+        assert not s
+    assert metrics.summary() == []
+
+
+def test_quantiles_and_prometheus_export(recording, tmp_path):
+    for ms in range(1, 101):
+        recording.observe("stage", ms / 1000, rows=2, nbytes=10)
+    recording.observe("stage", 0.5, error=True)
+    (row,) = metrics.summary()
+    assert row["count"] == 101 and row["rows"] == 200 and row["bytes"] == 1000 and row["errors"] == 1
+    assert 40 <= row["p50_ms"] <= 60
+    assert 80 <= row["p95_ms"] <= 110
+    assert row["p99_ms"] <= row["max_ms"] == 500
+
+    text = open(metrics.write_prometheus(str(tmp_path / "scheduler.prom"))).read()
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith("scheduler_stage_seconds_bucket")]
+    assert buckets == sorted(buckets) and buckets[-1] == 101
+    assert 'scheduler_stage_seconds_bucket{stage="stage",le="+Inf"} 101' in text
+    assert 'scheduler_stage_rows_total{stage="stage"} 200' in text
+    assert 'scheduler_stage_errors_total{stage="stage"} 1' in text
+
+
+def test_booking_records_each_stage(data_dir, recording):
+    path = str(data_dir / "doctor_schedule.csv")
+    _attempt("D1", DAY, 60, "A1", path)
+    _attempt("D1", DAY + timedelta(minutes=30), 30, "A2", path)   # slot taken
+
+    stages = {row["stage"]: row for row in metrics.summary()}
+    assert stages["book_appointment"]["count"] == 2
+    for stage in ("book_slot", "save_patient", "schedule_reminders"):
+        assert stages[stage]["count"] == 1
+    assert stages["save_appointments"]["rows"] == 1
+    assert stages["save_reminders"]["rows"] == 3
+    assert stages["schedule.write"]["bytes"] > 0
+    io = "csv.write[appointments.csv]" if "csv.write[appointments.csv]" in stages else "sqlite.append[appointments]"
+    assert stages[io]["rows"] >= 1
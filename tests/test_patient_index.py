@@ -0,0 +1,70 @@
+import sys, os
+import pandas as pd
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+from patient_index import PatientIndex
+
+
+PATIENTS = pd.DataFrame([
+    {"patient_id": "P001", "first_name": "Amit", "last_name": "Sharma", "dob": "1985-03-22", "email": "a@x.com"},
+    {"patient_id": "P002", "first_name": "Zoë", "last_name": "O'Brien", "dob": "1990-07-01", "email": "z@x.com"},
+    {"patient_id": "P003", "first_name": "Jonathan", "last_name": "Smith", "dob": "1979-11-30", "email": "j@x.com"},
+])
+
+
+def test_exact_lookup_is_normalized():
+    index = PatientIndex.from_frame(PATIENTS)
+    assert index.get(" AMIT ", "sharma", "1985-03-22")["patient_id"] == "P001"
+    assert index.get("zoe", "OBrien", "1990-07-01")["patient_id"] == "P002"
+    assert index.get("Amit", "Sharma", "1985-03-23") is None
+
+
+def test_fuzzy_match_needs_same_dob_and_similar_name():
+    index = PatientIndex.from_frame(PATIENTS)
+    assert index.match("Jonathon", "Smith", "1979-11-30") is None
+    assert index.match("Jonathon", "Smith", "1979-11-30", fuzzy=True)["patient_id"] == "P003"
+    assert index.match("Amit", "Sarma", "1985-03-22", fuzzy=True)["patient_id"] == "P001"
+    assert index.match("Priya", "Menon", "1985-03-22", fuzzy=True) is None
+    assert index.match("Jonathon", "Smith", "1979-11-29", fuzzy=True) is None
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_index_follows_saves(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", backend)
+    monkeypatch.setattr(data_loader, "PATIENTS_CSV", str(tmp_path / "patients.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    for record in PATIENTS.to_dict("records")[:2]:
+        data_loader.save_patient(record)
+
+    index = data_loader.patient_index()
+    assert len(index) == 2
+    data_loader.save_patient(PATIENTS.iloc[2].to_dict())
+    assert data_loader.patient_index() is index   # extended in place, not rebuilt
+    assert data_loader.lookup_patient("jonathan", "smith", "1979-11-30")["patient_id"] == "P003"
+
+    # A write that bypasses save_patient (e.g. another process) forces a rebuild
+    data_loader.get_backend().append("patients", [{"patient_id": "P004", "first_name": "Neha",
+                                                  "last_name": "Iyer", "dob": "2001-01-01"}])
+    assert data_loader.lookup_patient("Neha", "Iyer", "2001-01-01")["patient_id"] == "P004"
+    assert data_loader.patient_index() is not index
+
+
+def test_sqlite_exact_lookup_does_not_rebuild_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    data_loader.save_patients(PATIENTS.to_dict("records"))
+    index = data_loader.patient_index()
+    data_loader.get_backend().append("patients", [{"patient_id": "P004", "first_name": "Neha",
+                                                  "last_name": "Iyer", "dob": "2001-01-01"}])
+    assert data_loader.lookup_patient(" neha ", "IYER", "2001-01-01")["patient_id"] == "P004"
+    # Accents and punctuation are ignored exactly as the index ignores them
+    assert data_loader.lookup_patient("zoe", "OBrien", "1990-07-01")["patient_id"] == "P002"
+    assert data_loader.lookup_patient("Zoë", "O'Brien", "01/07/1990")["patient_id"] == "P002"
+    assert data_loader.lookup_patient("Neha", "Iyr", "2001-01-01") is None
+    assert data_loader._PATIENT_INDEXES[data_loader._store_key()] is index   # not reloaded
+    # Typos still go through the index.
+    assert data_loader.lookup_patient("Neha", "Iyr", "2001-01-01", fuzzy=True)["patient_id"] == "P004"
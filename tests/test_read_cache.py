@@ -0,0 +1,57 @@
+import sys, os
+import pandas as pd
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+from data_loader import ReadCache
+from scheduling import book_slot
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, make_schedule):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", "csv")
+    monkeypatch.setattr(data_loader, "APPTS_CSV", str(tmp_path / "appointments.csv"))
+    monkeypatch.setattr(data_loader, "SCHEDULE_CSV", str(tmp_path / "doctor_schedule.csv"))
+    monkeypatch.setattr(data_loader, "READ_CACHE", ReadCache())
+    make_schedule().to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    return data_loader.READ_CACHE
+
+
+def test_reads_are_cached_until_a_write(cache):
+    first = data_loader.load_schedule()
+    assert data_loader.load_schedule().equals(first)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    book_slot(first[first["available"]].iloc[0], 30, schedule_path=data_loader.SCHEDULE_CSV)
+    after = data_loader.load_schedule()
+    assert after["available"].sum() == first["available"].sum() - 1
+    assert cache.stats()["misses"] == 2
+
+    data_loader.save_appointments([{"appointment_id": "A1", "doctor_id": "D1"}])
+    assert list(data_loader.load_appointments()["appointment_id"]) == ["A1"]
+    appts = data_loader.load_appointments()
+    appts["extra"] = 1                                       # callers get their own frame
+    assert "extra" not in data_loader.load_appointments()
+    data_loader.save_appointments([{"appointment_id": "A2", "doctor_id": "D2"}])
+    assert list(data_loader.load_appointments()["appointment_id"]) == ["A1", "A2"]
+
+
+def test_external_file_change_is_a_miss(cache, make_schedule):
+    assert len(data_loader.load_schedule()) == len(make_schedule())
+    make_schedule(days=1).to_csv(data_loader.SCHEDULE_CSV, index=False)   # e.g. another process
+    assert len(data_loader.load_schedule()) == len(make_schedule(days=1))
+    assert cache.stats()["hits"] == 0
+
+
+def test_cache_is_bounded():
+    cache = ReadCache(max_entries=2, max_bytes=10**6)
+    for key in range(3):
+        cache.get("t", key, 0, lambda: pd.DataFrame({"x": range(10)}))
+    cache.get("t", "big", 0, lambda: pd.DataFrame({"x": range(10**6)}))   # too large to keep
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] < 10**6
+    cache.get("t", 2, 0, lambda: None)
+    assert cache.stats()["hits"] == 1
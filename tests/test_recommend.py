@@ -0,0 +1,55 @@
+import sys, os
+import pandas as pd
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduling import get_available_slots, recommend_slots
+from slot_store import SlotStore
+
+
+def _expected(store, doctor, duration, keep=lambda df: df):
+    df = get_available_slots(store, doctor, duration)
+    return keep(df).sort_values(["slot_start", "doctor_id"], kind="stable").reset_index(drop=True)
+
+
+def _pairs(df):
+    return list(zip(df["doctor_id"], df["slot_start"].astype(str), df["slot_end"].astype(str)))
+
+
+@pytest.mark.parametrize("duration", [30, 60])
+def test_pages_walk_the_merged_earliest_first_order(duration, make_schedule):
+    store = SlotStore.from_frame(make_schedule(doctors=("D1", "D2", "D3"), days=3))
+    expected = _pairs(_expected(store, "Any", duration))
+    seen, cursor = [], None
+    while True:
+        page, cursor = recommend_slots(store, "Any", duration, k=4, cursor=cursor)
+        assert len(page) <= 4
+        seen += _pairs(page)
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_filters_match_filtering_the_full_result(make_schedule):
+    store = SlotStore.from_frame(make_schedule(doctors=("D1", "D2", "D3"), days=3))
+    doctors = [{"doctor_id": "D1", "locations": ["Main"]}, {"doctor_id": "D2", "locations": ["Satellite"]},
+               {"doctor_id": "D3"}]   # no list: works everywhere
+    page, cursor = recommend_slots(
+        store, "Any", 60, k=50, date_from="2030-01-08", date_to="2030-01-09", time_from="09:30",
+        time_to="11:30", weekdays=[1, 2], location="Main", doctors=doctors)
+
+    def keep(df):
+        start, end = df["slot_start"], df["slot_end"]
+        return df[(start >= "2030-01-08") & (start < "2030-01-10") & (start.dt.weekday.isin([1, 2])) &
+                  (start.dt.strftime("%H:%M") >= "09:30") & (end.dt.strftime("%H:%M") <= "11:30") &
+                  df["doctor_id"].isin(["D1", "D3"])]
+
+    assert cursor is None
+    assert _pairs(page) == _pairs(_expected(store, "Any", 60, keep)) and len(page)
+
+    page, _ = recommend_slots(store, "Dr. D2", 30, k=3, not_before="2030-01-08 10:00")
+    assert _pairs(page) == _pairs(_expected(store, "Dr. D2", 30,
+                                            lambda df: df[df["slot_start"] >= "2030-01-08 10:00"]).head(3))
+    assert recommend_slots(store, "Any", 30, weekdays=[6])[0].empty
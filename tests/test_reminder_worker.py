@@ -0,0 +1,189 @@
+import sys, os
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from messaging import schedule_reminders_for_appointment
+from reminder_worker import ReminderDispatcher
+
+NOW = datetime(2030, 1, 7, 12, 0)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(data_loader, "REMINDERS_CSV", str(tmp_path / "reminders.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    return tmp_path
+
+
+def _sent_keys():
+    df = data_loader.load_reminders()
+    df = df[df["sent_at"].notna() & (df["sent_at"] != "")]
+    return sorted(zip(df["appointment_id"], df["reminder_number"]))
+
+
+def test_dispatcher_sends_due_reminders_in_batches(store):
+    for i in range(5):
+        # 72h/24h reminders are due at NOW, the 2h one is not
+        schedule_reminders_for_appointment(f"A{i}", "Amit", "Dr. Maya Rao", NOW + timedelta(hours=20), "a@example.com")
+
+    dispatcher = ReminderDispatcher(batch_size=3)
+    assert dispatcher.run_once(now=NOW) == 10
+    assert len(_sent_keys()) == 10
+    assert len(dispatcher) == 5
+    assert dispatcher.next_due() == NOW + timedelta(hours=18)
+
+    # Nothing new is due, and nothing is sent twice
+    assert dispatcher.run_once(now=NOW) == 0
+    assert dispatcher.run_once(now=NOW + timedelta(hours=18)) == 5
+    assert len(_sent_keys()) == 15
+
+
+def test_dispatcher_picks_up_reminders_added_later(store):
+    dispatcher = ReminderDispatcher()
+    assert dispatcher.run_once(now=NOW) == 0
+
+    schedule_reminders_for_appointment("B1", "Neha", "Dr. Maya Rao", NOW + timedelta(hours=1), "n@example.com")
+    assert dispatcher.run_once(now=NOW) == 3
+    assert _sent_keys() == [("B1", 1), ("B1", 2), ("B1", 3)]
+    assert dispatcher.refresh() == 0
+
+
+def test_dispatcher_claims_only_when_something_is_due(store, monkeypatch):
+    import reminder_worker
+    claims = []
+    dispatch_due = reminder_worker.dispatch_due
+
+    def counting(worker_id, now, *args):
+        claims.append(now)
+        return dispatch_due(worker_id, now, *args)
+
+    monkeypatch.setattr(reminder_worker, "dispatch_due", counting)
+    schedule_reminders_for_appointment("B1", "Neha", "Dr. Maya Rao", NOW + timedelta(hours=80), "n@example.com")
+
+    dispatcher = ReminderDispatcher(lease_seconds=600)
+    assert dispatcher.run_once(now=NOW) == 0          # first tick always claims
+    assert dispatcher.run_once(now=NOW + timedelta(minutes=1)) == 0
+    assert claims == [NOW]
+    # Past the lease period it claims again, for leases a dead worker left behind.
+    dispatcher.run_once(now=NOW + timedelta(minutes=11))
+    assert dispatcher.run_once(now=NOW + timedelta(hours=8)) == 1
+    assert claims == [NOW, NOW + timedelta(minutes=11), NOW + timedelta(hours=8)]
+
+
+def test_dispatcher_requeues_rescheduled_reminders(store):
+    schedule_reminders_for_appointment("E1", "Neha", "Dr. Maya Rao", NOW + timedelta(hours=80), "n@example.com")
+    dispatcher = ReminderDispatcher()
+    assert dispatcher.run_once(now=NOW) == 0
+    assert dispatcher.next_due() == NOW + timedelta(hours=8)
+
+    # The appointment moves earlier: reminder #1 is rewritten in place, not appended
+    data_loader.update_reminders([{"appointment_id": "E1", "reminder_number": 1,
+                                   "scheduled_for": (NOW + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")}])
+    assert dispatcher.refresh() == 1
+    assert dispatcher.next_due() == NOW + timedelta(hours=1)
+    assert dispatcher.run_once(now=NOW + timedelta(hours=1)) == 1
+
+
+def test_csv_claims_and_sends_append_to_a_journal(store, monkeypatch):
+    if data_loader.STORAGE_BACKEND != "csv":
+        pytest.skip("CSV backend only")
+    for i in range(3):
+        schedule_reminders_for_appointment(f"F{i}", "Amit", "Dr. Maya Rao", NOW + timedelta(hours=20), "a@example.com")
+    path = data_loader.REMINDERS_CSV
+    before = os.stat(path).st_mtime_ns, os.path.getsize(path)
+
+    assert messaging.dispatch_due("w1", NOW) == 6
+    # reminders.csv was not rewritten; readers see the sends through the journal
+    assert (os.stat(path).st_mtime_ns, os.path.getsize(path)) == before
+    assert os.path.exists(path + ".journal")
+    assert len(_sent_keys()) == 6
+
+    # The next table write folds the journal in
+    data_loader.cancel_reminders(["F2"])
+    assert not os.path.exists(path + ".journal")
+    assert len(_sent_keys()) == 6
+    assert messaging.dispatch_due("w1", NOW + timedelta(hours=18)) == 2
+
+
+def test_expired_leases_are_reclaimed_and_fenced(store):
+    schedule_reminders_for_appointment("C1", "Ravi", "Dr. Maya Rao", NOW + timedelta(hours=80), "r@example.com")
+    due_at = NOW + timedelta(hours=8)   # only reminder #1 (72h before) is due
+
+    claimed = data_loader.claim_due_reminders("w1", due_at, 60, 10)
+    assert list(claimed["reminder_number"]) == [1]
+    # Held by w1: nobody else can take it until the lease runs out
+    assert data_loader.claim_due_reminders("w2", due_at + timedelta(seconds=30), 60, 10).empty
+
+    # w1 "crashed"; after the lease expires w2 takes over and sends it
+    retaken = data_loader.claim_due_reminders("w2", due_at + timedelta(seconds=61), 60, 10)
+    assert list(retaken["reminder_number"]) == [1]
+    update = {"appointment_id": "C1", "reminder_number": 1, "sent_at": "2030-01-07 20:01"}
+    assert data_loader.complete_reminders("w1", [update], due_at + timedelta(seconds=62)) == 0
+    # w2 still holds the claim, but its lease has run out too
+    assert data_loader.complete_reminders("w2", [update], due_at + timedelta(seconds=121)) == 0
+    assert data_loader.complete_reminders("w2", [update], due_at + timedelta(seconds=62)) == 1
+    assert _sent_keys() == [("C1", 1)]
+
+
+def test_worker_stops_sending_before_its_lease_runs_out(store, monkeypatch):
+    schedule_reminders_for_appointment("D1", "Ravi", "Dr. Maya Rao", NOW + timedelta(hours=1), "r@example.com")
+    clock, deliveries, raced = [0.0], [], []
+
+    def slow_send(to_email, body, attachments=None):
+        # Each send takes 25s; once w1's 60s lease has expired, w2 claims what w1 still holds.
+        deliveries.append(body.split("\n")[0])
+        clock[0] += 25
+        if clock[0] > 60 and not raced:
+            raced.append(messaging.dispatch_due("w2", NOW + timedelta(seconds=61), lease_seconds=60))
+
+    monkeypatch.setattr(messaging.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(messaging, "deliver_now", slow_send)
+
+    # w1 sends two reminders, then stops with less than 30s left on its lease
+    assert messaging.dispatch_due("w1", NOW, lease_seconds=60) == 2
+    assert raced == []
+    assert messaging.dispatch_due("w2", NOW + timedelta(seconds=61), lease_seconds=60) == 1
+    assert len(deliveries) == len(set(deliveries)) == 3
+    assert _sent_keys() == [("D1", 1), ("D1", 2), ("D1", 3)]
+
+
+def _worker(directory, backend, log_path, queue):
+    data_loader.STORAGE_BACKEND = backend
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    # Record every send in a shared append-only log instead of the outbox
+    def log_send(to_email, body, attachments=None):
+        with open(log_path, "a") as f:
+            f.write(body.split("\n")[0] + "\n")
+    messaging.deliver_now = log_send
+    queue.put(ReminderDispatcher(batch_size=7, worker_id=f"w{os.getpid()}").run_once(now=NOW))
+
+
+def test_concurrent_workers_send_each_reminder_once(store):
+    import multiprocessing
+
+    for i in range(100):
+        schedule_reminders_for_appointment(f"A{i}", "Amit", "Dr. Maya Rao", NOW + timedelta(hours=1), "a@example.com")
+    log_path = str(store / "sent.log")
+
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(store), data_loader.STORAGE_BACKEND, log_path, queue))
+             for _ in range(4)]
+    for p in procs:
+        p.start()
+    total = sum(queue.get(timeout=120) for _ in procs)
+    for p in procs:
+        p.join()
+
+    assert total == 300
+    with open(log_path) as f:
+        assert len(f.readlines()) == 300
+    assert len(_sent_keys()) == 300
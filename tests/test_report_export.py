@@ -0,0 +1,77 @@
+import sys, os
+import pandas as pd
+import pytest
+from datetime import date
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import report_export
+from report_export import export_appointments, report_filters, start_export
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def appointments(request, tmp_path, monkeypatch):
+    for name in ("APPTS", "PATIENTS", "REMINDERS", "WAITLIST"):
+        monkeypatch.setattr(data_loader, f"{name}_CSV", str(tmp_path / f"{name.lower()}.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    data_loader.save_appointments([
+        {"appointment_id": f"A{i}", "doctor_id": f"D{i % 3}", "patient_name": f"Patient {i}",
+         "slot_start": f"2030-01-{1 + i % 28:02d} 09:00:00", "slot_end": f"2030-01-{1 + i % 28:02d} 09:30:00",
+         "status": "Cancelled" if i % 5 == 0 else "Booked"}
+        for i in range(100)
+    ])
+    return tmp_path
+
+
+def test_csv_export_applies_filters_chunk_by_chunk(appointments):
+    path = str(appointments / "report.csv")
+    seen = []
+    filters = report_filters(date(2030, 1, 5), date(2030, 1, 10), ["D1", "D2"], ["Booked"])
+    rows = export_appointments(path, filters=filters, chunk_rows=7, on_progress=lambda p, n: seen.append((p, n)))
+
+    out = pd.read_csv(path)
+    expected = [i for i in range(100) if 5 <= 1 + i % 28 <= 10 and i % 3 in (1, 2) and i % 5]
+    assert rows == len(out) == len(expected)
+    assert sorted(out["appointment_id"]) == sorted(f"A{i}" for i in expected)
+    assert len(seen) > 1 and seen[-1] == (1.0, rows)
+    assert [n for _, n in seen] == sorted(n for _, n in seen)
+
+
+def test_xlsx_export_and_empty_result(appointments):
+    path = str(appointments / "report.xlsx")
+    assert export_appointments(path, chunk_rows=30) == 100
+    assert len(pd.read_excel(path)) == 100
+
+    assert export_appointments(path, filters=report_filters(statuses=["Offered"])) == 0
+    assert list(pd.read_excel(path).columns)[:2] == ["appointment_id", "patient_id"]
+
+
+def test_parquet_export(appointments):
+    pytest.importorskip("pyarrow")
+    path = str(appointments / "report.parquet")
+    assert export_appointments(path, chunk_rows=30, filters=report_filters(doctor_ids=["D0"])) == 34
+    assert set(pd.read_parquet(path)["doctor_id"]) == {"D0"}
+
+
+def test_background_job_reports_errors(appointments, monkeypatch):
+    job = start_export("csv", str(appointments), date_from=date(2030, 1, 1), date_to=date(2030, 1, 1))
+    assert job.wait(30)
+    assert (job.state, job.rows, job.progress) == (report_export.DONE, 4, 1.0)
+    assert report_export.get_export(job.job_id) is job and os.path.exists(job.path)
+
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+        yield
+
+    monkeypatch.setattr(data_loader.get_backend().__class__, "iter_chunks", broken)
+    job = start_export("xlsx", str(appointments))
+    assert job.wait(30)
+    assert job.state == report_export.FAILED and "disk full" in job.error
+    assert not os.path.exists(job.path)
+    assert not [f for f in os.listdir(appointments) if f.endswith(".tmp")]
+
+    with pytest.raises(ValueError):
+        start_export("pdf")
@@ -0,0 +1,70 @@
+import sys, os
+import pandas as pd
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_format import ScheduleFile, convert, write_frame
+from schedule_generator import extend_schedule, load_doctor_config
+from scheduling import book_slot, get_available_slots
+from slot_store import SlotStore, open_store
+
+
+def _as_text(df):
+    out = df.copy()
+    for col in ("slot_start", "slot_end"):
+        out[col] = pd.to_datetime(out[col]).dt.strftime("%Y-%m-%d %H:%M")
+    out["doctor_id"] = out["doctor_id"].astype(str)
+    out["doctor_name"] = out["doctor_name"].astype(str)
+    return out.reset_index(drop=True)
+
+
+def test_round_trip_and_partial_reads(tmp_path, make_schedule):
+    schedule = make_schedule(doctors=("D1", "D2", "D3"), days=3)
+    path = str(tmp_path / "doctor_schedule.slots")
+    write_frame(path, schedule.sample(frac=1, random_state=1))   # order does not matter
+
+    f = ScheduleFile(path)
+    assert len(f) == len(schedule)
+    pd.testing.assert_frame_equal(_as_text(f.read()), _as_text(schedule))
+
+    one = f.read("D2")
+    assert set(one["doctor_id"]) == {"D2"} and len(one) == 18
+    day = f.read("D2", "2030-01-08", "2030-01-09")
+    assert len(day) == 6 and day["slot_start"].dt.day.unique().tolist() == [8]
+    assert len(f.read(start="2030-01-09")) == 3 * 6
+    assert f.read("D9").empty
+
+    convert(path, str(tmp_path / "back.csv"))
+    pd.testing.assert_frame_equal(_as_text(pd.read_csv(tmp_path / "back.csv")), _as_text(schedule))
+
+
+def test_bookings_flip_bits_in_place(tmp_path, make_schedule):
+    path = str(tmp_path / "doctor_schedule.slots")
+    write_frame(path, make_schedule())
+    before = os.stat(path)
+
+    book_slot({"doctor_id": "D2", "slot_start": "2030-01-08 09:00"}, 60, schedule_path=path)
+    after = os.stat(path)
+    assert (after.st_ino, after.st_size) == (before.st_ino, before.st_size)
+
+    store = SlotStore.load(path)
+    assert not store.is_free("D2", "2030-01-08 09:00", 1) and not store.is_free("D2", "2030-01-08 09:30", 1)
+    reference = SlotStore.from_frame(make_schedule())
+    reference.book("D2", "2030-01-08 09:00", 2)
+    pd.testing.assert_frame_equal(get_available_slots(store, "Any", 60), get_available_slots(reference, "Any", 60))
+
+
+def test_extend_rewrites_binary_file_keeping_bookings(tmp_path):
+    path = str(tmp_path / "doctor_schedule.slots")
+    doctors = load_doctor_config(str(tmp_path / "missing.json"))
+    extend_schedule(path, doctors, days=2, today="2030-01-07")
+    book_slot({"doctor_id": "D1", "slot_start": "2030-01-08 09:00"}, 30, schedule_path=path)
+    extend_schedule(path, doctors, days=3, today="2030-01-08")
+
+    f = ScheduleFile(path)
+    assert len(f) == 3 * 3 * 16   # 7th pruned, 8th kept, 9th-10th added
+    booked = f.read()[lambda df: ~df["available"]]
+    assert list(zip(booked["doctor_id"].astype(str), booked["slot_start"].astype(str))) == [
+        ("D1", "2030-01-08 09:00:00")]
+    assert not open_store(path).is_free("D1", "2030-01-08 09:00", 1)
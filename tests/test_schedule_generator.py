@@ -0,0 +1,71 @@
+import sys, os
+import json
+import pandas as pd
+import pytest
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_generator import extend_schedule, generate_slots, load_doctor_config
+from scheduling import book_slot
+
+
+def _config(tmp_path):
+    path = tmp_path / "doctors.json"
+    path.write_text(json.dumps({
+        "defaults": {"hours": ["09:00", "12:00"], "breaks": [["10:00", "10:30"]],
+                     "weekdays": [0, 1, 2, 3, 4], "holidays": ["2030-01-09"]},
+        "doctors": [
+            {"doctor_id": "D1", "doctor_name": "Dr. One", "slot_minutes": 60},
+            {"doctor_id": "D2", "doctor_name": "Dr. Two", "weekdays": [0, 5],
+             "hours_by_weekday": {"5": ["09:00", "10:00"]}, "holidays": ["2030-01-07"]},
+        ],
+    }), encoding="utf-8")
+    return load_doctor_config(str(path))
+
+
+def test_default_config_matches_old_regenerate_button(tmp_path):
+    slots = generate_slots(load_doctor_config(str(tmp_path / "missing.json")), "2030-01-07", 7)
+    assert len(slots) == 3 * 7 * 16
+    first = slots.iloc[0]
+    assert (first["doctor_id"], str(first["slot_start"]), str(first["slot_end"])) == (
+        "D1", "2030-01-07 09:00:00", "2030-01-07 09:30:00")
+
+
+def test_hours_breaks_weekdays_and_holidays(tmp_path):
+    # 2030-01-07 is a Monday; the range covers Mon 7th .. Sun 13th
+    slots = generate_slots(_config(tmp_path), "2030-01-07", 7)
+    starts = slots.assign(slot_start=slots["slot_start"].dt.strftime("%a %H:%M"))
+    by_doctor = starts.groupby("doctor_id", observed=True)["slot_start"].apply(list).to_dict()
+    # D1: 60-minute slots stored as two base slots each; the 10:00 slot overlaps the break;
+    # no Wednesday (holiday) or weekend
+    assert by_doctor["D1"] == [f"{d} {t}" for d in ("Mon", "Tue", "Thu", "Fri")
+                               for t in ("09:00", "09:30", "11:00", "11:30")]
+    # D2: Mondays (but the 7th is their holiday) and short Saturdays
+    assert by_doctor["D2"] == ["Sat 09:00", "Sat 09:30"]
+    assert set((slots["slot_end"] - slots["slot_start"]).dt.total_seconds().div(60)) == {30}
+
+
+def test_slot_minutes_must_be_a_multiple_of_the_base_slot(tmp_path):
+    path = tmp_path / "doctors.json"
+    path.write_text(json.dumps({"doctors": [{"doctor_id": "D1", "doctor_name": "Dr. One", "slot_minutes": 45}]}),
+                    encoding="utf-8")
+    with pytest.raises(ValueError, match="slot_minutes must be a multiple of 30"):
+        load_doctor_config(str(path))
+
+
+def test_extend_keeps_bookings_and_prunes_past_days(tmp_path):
+    path = str(tmp_path / "doctor_schedule.csv")
+    doctors = load_doctor_config(str(tmp_path / "missing.json"))
+    assert extend_schedule(path, doctors, days=3, today="2030-01-07")["added"] == 3 * 3 * 16
+
+    book_slot({"doctor_id": "D2", "slot_start": "2030-01-08 10:00"}, 60, schedule_path=path)
+    result = extend_schedule(path, doctors, days=3, today="2030-01-08")
+    assert (result["added"], result["removed"], result["slots"]) == (3 * 16, 3 * 16, 3 * 3 * 16)
+
+    schedule = pd.read_csv(path)
+    assert schedule["slot_start"].min() == "2030-01-08 09:00"
+    assert schedule["slot_start"].max() == "2030-01-10 16:30"
+    booked = schedule[~schedule["available"]]
+    assert list(zip(booked["doctor_id"], booked["slot_start"])) == [
+        ("D2", "2030-01-08 10:00"), ("D2", "2030-01-08 10:30")]
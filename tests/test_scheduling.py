@@ -1,4 +1,5 @@
 import sys, os
+import pytest
 import pandas as pd
 from datetime import datetime, timedelta
 
@@ -77,4 +78,44 @@ def test_book_slot_marks_unavailable(tmp_path):
     book_slot(booked_slot, 60, schedule_path=str(csv_path))
 
     updated = pd.read_csv(csv_path)
-    assert updated["available"].sum() == 0
\ No newline at end of file
+    assert updated["available"].sum() == 0
+
+def _day_schedule(free_flags, doctor_id="D1", doctor_name="Dr. Maya Rao"):
+    start = datetime(2030, 1, 7, 9, 0)
+    return pd.DataFrame([
+        {"doctor_id": doctor_id, "doctor_name": doctor_name,
+         "slot_start": start + timedelta(minutes=30 * i),
+         "slot_end": start + timedelta(minutes=30 * (i + 1)),
+         "available": flag}
+        for i, flag in enumerate(free_flags)
+    ])
+
+
+def test_get_available_slots_any_multiple_of_base_slot():
+    # Free: 0-2, booked: 3, free: 4-5
+    schedule = _day_schedule([True, True, True, False, True, True])
+
+    starts = lambda df: [ts.strftime("%H:%M") for ts in df["slot_start"]]
+    assert starts(get_available_slots(schedule, "Any", 60)) == ["09:00", "09:30", "11:00"]
+    assert starts(get_available_slots(schedule, "Any", 90)) == ["09:00"]
+    assert get_available_slots(schedule, "Any", 120).empty
+
+    slots_90 = get_available_slots(schedule, "Any", 90)
+    assert slots_90.iloc[0]["slot_indices"] == [0, 1, 2]
+    assert slots_90.iloc[0]["slot_end"] == datetime(2030, 1, 7, 10, 30)
+
+
+def test_get_available_slots_does_not_join_across_doctors_or_gaps():
+    d1 = _day_schedule([True])
+    d2 = _day_schedule([True, True], doctor_id="D2", doctor_name="Dr. Arvind Nair")
+    # Same doctor, but a lunch gap between the two slots
+    gap = _day_schedule([True, True], doctor_id="D3", doctor_name="Dr. Leena Kapoor")
+    gap.loc[1, ["slot_start", "slot_end"]] += timedelta(hours=1)
+
+    slots_60 = get_available_slots(pd.concat([d1, d2, gap], ignore_index=True), "Any", 60)
+    assert list(slots_60["doctor_id"]) == ["D2"]
+
+
+def test_get_available_slots_rejects_partial_durations():
+    with pytest.raises(ValueError):
+        get_available_slots(_day_schedule([True, True]), "Any", 45)
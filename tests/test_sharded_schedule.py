@@ -0,0 +1,200 @@
+import sys, os
+import multiprocessing
+import random
+import pandas as pd
+import pytest
+from datetime import date, datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+from booking import BOOKED, book_appointment, cancel_appointment, reschedule_appointment
+from schedule_generator import extend_schedule
+from scheduling import get_available_slots, recommend_slots
+from slot_store import ShardedStore, SlotStore, open_store, split_schedule
+
+DAYS = [datetime(2030, 1, 31, 9, 0), datetime(2030, 2, 1, 9, 0)]
+
+
+def _schedule():
+    rows = []
+    for d in ("D1", "D2", "D3"):
+        for day in DAYS:
+            for i in range(8):
+                start = day + timedelta(minutes=30 * i)
+                rows.append({"doctor_id": d, "doctor_name": f"Dr. {d}",
+                             "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                             "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                             "available": i != 3})
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def sharded(request, tmp_path, monkeypatch):
+    _schedule().to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    for name in ("APPTS", "PATIENTS", "REMINDERS", "WAITLIST"):
+        monkeypatch.setattr(data_loader, f"{name}_CSV", str(tmp_path / f"{name.lower()}.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    root = str(tmp_path / "schedule")
+    assert split_schedule(str(tmp_path / "doctor_schedule.csv"), root) == 6
+    return root
+
+
+def _book(root, appointment_id, doctor_id, start, duration=30):
+    slot = {"doctor_id": doctor_id, "doctor_name": f"Dr. {doctor_id}",
+            "slot_start": start, "slot_end": start + timedelta(minutes=duration)}
+    appt = {"appointment_id": appointment_id, "patient_id": f"P{appointment_id}", "patient_name": "Asha Rao",
+            "doctor_id": doctor_id, "doctor_name": slot["doctor_name"], "slot_start": start,
+            "slot_end": slot["slot_end"], "clinic_location": "Main Clinic - Bengaluru", "status": "Booked"}
+    return book_appointment(slot, duration, appt, "Asha", schedule_path=root)["status"]
+
+
+def test_sharded_store_answers_like_one_file(sharded, tmp_path, monkeypatch):
+    single = SlotStore.load(str(tmp_path / "doctor_schedule.csv"))
+    store = open_store(sharded)
+    assert isinstance(store, ShardedStore)
+    assert sorted(os.listdir(os.path.join(sharded, "D1"))) == ["2030-01.csv", "2030-02.csv"]
+    assert store.doctor_ids() == ["D1", "D2", "D3"] and store.doctor_ids("Dr. D2") == ["D2"]
+    assert len(store) == len(single) == 48
+
+    for n in (1, 2):
+        expected = get_available_slots(single, "Any", 30 * n)
+        got = get_available_slots(store, "Any", 30 * n)
+        pd.testing.assert_frame_equal(got, expected)
+
+    expected, cursor = recommend_slots(single, "Any", 60, k=7)
+    got, got_cursor = recommend_slots(store, "Any", 60, k=7)
+    pd.testing.assert_frame_equal(got, expected)
+    assert got_cursor == cursor
+    pd.testing.assert_frame_equal(recommend_slots(store, "Any", 60, k=7, cursor=cursor)[0],
+                                  recommend_slots(single, "Any", 60, k=7, cursor=cursor)[0])
+
+    monkeypatch.setattr(data_loader, "SCHEDULE_CSV", sharded)
+    assert len(data_loader.load_schedule()) == 48
+
+
+def test_booking_rewrites_only_its_shard(sharded):
+    paths = [os.path.join(sharded, d, f"2030-0{m}.csv") for d in ("D1", "D2", "D3") for m in (1, 2)]
+    before = {p: os.stat(p).st_mtime_ns for p in paths}
+    assert _book(sharded, "A1", "D2", DAYS[1]) == BOOKED
+    changed = [p for p in paths if os.stat(p).st_mtime_ns != before[p]]
+    assert changed == [os.path.join(sharded, "D2", "2030-02.csv")]
+    assert not ShardedStore(sharded).is_free("D2", DAYS[1], 1)
+    assert _book(sharded, "A2", "D2", DAYS[1]) != BOOKED
+
+    # Moving to another doctor's month frees the old shard's slot and takes the new one.
+    result = reschedule_appointment("A1", DAYS[0], doctor_id="D3", schedule_path=sharded, notify=False)
+    assert result["status"] == BOOKED
+    fresh = ShardedStore(sharded)
+    assert fresh.is_free("D2", DAYS[1], 1) and not fresh.is_free("D3", DAYS[0], 1)
+    assert cancel_appointment("A1", schedule_path=sharded, notify=False)["cancelled"] == ["A1"]
+    assert ShardedStore(sharded).is_free("D3", DAYS[0], 1)
+
+
+def test_extend_creates_and_archives_months(tmp_path):
+    root = str(tmp_path / "schedule")
+    doctors = [{"doctor_id": "D1", "doctor_name": "Dr. One", "hours": ["09:00", "11:00"], "breaks": [],
+                "slot_minutes": 30, "weekdays": list(range(7)), "holidays": []}]
+    result = extend_schedule(root, doctors, days=10, today=date(2030, 1, 28))
+    assert result == {"added": 40, "removed": 0, "slots": 40}
+    assert sorted(os.listdir(os.path.join(root, "D1"))) == ["2030-01.csv", "2030-02.csv"]
+    assert open_store(root).doctor_names == {"D1": "Dr. One"}
+
+    result = extend_schedule(root, doctors, days=10, today=date(2030, 2, 2))
+    assert result == {"added": 20, "removed": 20, "slots": 40}
+    assert os.path.exists(os.path.join(root, "archive", "D1", "2030-01.csv"))
+    assert open_store(root).months("D1") == ["2030-02"]
+    store = ShardedStore(root)
+    assert store.day_slots("D1", "2030-02-01") is None and len(store.day_slots("D1", "2030-02-02")) == 4
+
+
+def _worker(directory, root, backend, seed, queue):
+    data_loader.APPTS_CSV = os.path.join(directory, "appts.csv")
+    data_loader.PATIENTS_CSV = os.path.join(directory, "patients.csv")
+    data_loader.REMINDERS_CSV = os.path.join(directory, "reminders.csv")
+    data_loader.DB_PATH = os.path.join(directory, "scheduler.db")
+    data_loader.STORAGE_BACKEND = backend
+    # Every worker tries every slot, in its own order.
+    slots = [(d, day + timedelta(minutes=30 * i)) for d in ("D1", "D2", "D3") for day in DAYS for i in range(8)]
+    random.Random(seed).shuffle(slots)
+    booked = sum(_book(root, f"{seed}-{k}", d, start) == BOOKED for k, (d, start) in enumerate(slots))
+    queue.put(booked)
+
+
+def test_concurrent_bookings_across_shards(sharded, tmp_path):
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(tmp_path), sharded, data_loader.STORAGE_BACKEND, seed, queue))
+             for seed in range(4)]
+    for p in procs:
+        p.start()
+    booked = sum(queue.get(timeout=120) for _ in procs)
+    for p in procs:
+        p.join()
+
+    appts = data_loader.load_appointments()
+    assert booked == len(appts) == appts[["doctor_id", "slot_start"]].drop_duplicates().shape[0] == 42
+    schedule = ShardedStore(sharded).read()
+    assert not schedule["available"].astype(bool).any()
+
+
+def test_batch_booking_on_shards(sharded, tmp_path):
+    from batch_booking import book_batch
+    with open(tmp_path / "requests.jsonl", "w", encoding="utf-8") as f:
+        for i in range(10):
+            f.write(f'{{"request_id": "R{i}", "first_name": "P{i}", "last_name": "Q", "dob": "1990-01-01"}}\n')
+    summary = book_batch(str(tmp_path / "requests.jsonl"), str(tmp_path / "report.csv"), schedule_path=sharded,
+                         not_before=DAYS[0], emails=False, ics=False)
+    assert summary["booked"] == 10
+    # Ten new patients, two 30-minute slots each.
+    assert ShardedStore(sharded).read()["available"].astype(bool).sum() == 42 - 20
+
+
+def test_threads_sharing_a_sharded_store(sharded, monkeypatch):
+    import threading
+    import scheduling
+    from scheduling import SlotTakenError, book_slot
+    # One thread's writes fail after it changed the shared store in memory.
+    failing = threading.local()
+    save_store = scheduling.save_store
+
+    def save(store, path):
+        if getattr(failing, "on", False):
+            raise OSError("disk full")
+        save_store(store, path)
+
+    monkeypatch.setattr(scheduling, "save_store", save)
+    slots = [(d, day + timedelta(minutes=30 * i)) for d in ("D1", "D2", "D3") for day in DAYS for i in range(8)]
+    booked, errors = [], []
+
+    def worker(seed):
+        failing.on = seed == 0
+        order = slots[:]
+        random.Random(seed).shuffle(order)
+        for d, start in order:
+            slot = {"doctor_id": d, "doctor_name": f"Dr. {d}", "slot_start": start,
+                    "slot_end": start + timedelta(minutes=30)}
+            try:
+                book_slot(slot, 30, schedule_path=sharded)
+                booked.append((d, start))
+            except SlotTakenError:
+                pass
+            except OSError:
+                errors.append(seed)
+            except Exception as e:   # e.g. another thread's save removing this one's temp file
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert set(errors) <= {0} and len(booked) == len(set(booked))
+    # Every successful booking is on disk; the failed thread's changes are not.
+    schedule = ShardedStore(sharded).read()
+    taken = schedule.loc[~schedule["available"].astype(bool)]
+    assert len(taken) == len(booked) + 6
+    assert all(not ShardedStore(sharded).is_free(d, start, 1) for d, start in booked)
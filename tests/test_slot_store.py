@@ -0,0 +1,62 @@
+import sys, os
+import pandas as pd
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduling import get_available_slots, book_slot
+from slot_store import SlotStore, open_store
+
+
+def test_store_matches_frame_search(make_schedule):
+    schedule = make_schedule()
+    store = SlotStore.from_frame(schedule)
+    for duration in (30, 60, 90):
+        for doctor in ("Any", "Dr. D2"):
+            expected = get_available_slots(schedule, doctor, duration).reset_index(drop=True)
+            got = get_available_slots(store, doctor, duration)
+            cols = ["doctor_id", "slot_start", "slot_end"] + (["slot_indices"] if duration > 30 else [])
+            pd.testing.assert_frame_equal(got[cols], expected[cols], check_dtype=False)
+
+
+def test_book_refuses_taken_or_missing_slots(make_schedule):
+    store = SlotStore.from_frame(make_schedule())
+    assert store.book("D1", "2030-01-07 09:00", 2)
+    assert not store.book("D1", "2030-01-07 09:30", 1)   # already booked
+    assert not store.book("D1", "2030-01-07 10:00", 2)   # 10:30 is booked in the seed data
+    assert not store.book("D9", "2030-01-07 09:00", 1)   # unknown doctor
+    assert not store.book("D1", "2030-01-07 11:30", 2)   # runs past the end of the day
+
+
+def test_next_free_matches_earliest_available_slot(make_schedule):
+    store = SlotStore.from_frame(make_schedule())
+    store.book("D1", "2030-01-07 09:00", 1)
+    for doctor_id in ("D1", "D2"):
+        for n in (1, 2, 3):
+            slots = get_available_slots(store, f"Dr. {doctor_id}", 30 * n)
+            for not_before in ("2030-01-07 00:00", "2030-01-07 09:30", "2030-01-07 10:15", "2030-01-08 11:00"):
+                later = slots[slots["slot_start"] >= pd.Timestamp(not_before)]
+                minute = pd.Timestamp(not_before).value // 60_000_000_000
+                got = store.next_free(doctor_id, n, minute)
+                expected = None if later.empty else tuple(
+                    int(t.value // 60_000_000_000) for t in later.iloc[0][["slot_start", "slot_end"]])
+                assert got == expected, (doctor_id, n, not_before)
+
+
+def test_save_round_trip_and_dirty_days(tmp_path, make_schedule):
+    path = str(tmp_path / "doctor_schedule.csv")
+    make_schedule().to_csv(path, index=False)
+
+    store = open_store(path)
+    assert store.dirty == set()
+    assert store.book("D2", "2030-01-08 09:00", 1)
+    assert len(store.dirty) == 1
+
+    book_slot({"doctor_id": "D1", "slot_start": "2030-01-07 09:00"}, 60, schedule_path=path)
+    reloaded = pd.read_csv(path)
+    booked = reloaded[~reloaded["available"]]
+    assert {("D1", "2030-01-07 09:00"), ("D1", "2030-01-07 09:30"), ("D2", "2030-01-08 09:00")} <= set(
+        zip(booked["doctor_id"], booked["slot_start"])
+    )
+    assert len(reloaded) == len(make_schedule())
+    assert open_store(path).dirty == set()
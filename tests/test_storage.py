@@ -0,0 +1,132 @@
+import sys, os
+import sqlite3
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from messaging import run_due_reminders, schedule_reminders_for_appointment
+from storage import SqliteBackend, migrate_csv_to_sqlite
+
+
+@pytest.fixture
+def csv_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", "csv")
+    monkeypatch.setattr(data_loader, "PATIENTS_CSV", str(tmp_path / "patients.csv"))
+    monkeypatch.setattr(data_loader, "APPTS_CSV", str(tmp_path / "appointments.csv"))
+    monkeypatch.setattr(data_loader, "REMINDERS_CSV", str(tmp_path / "reminders.csv"))
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    return tmp_path
+
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    return tmp_path / "scheduler.db"
+
+
+@pytest.mark.parametrize("store", ["csv_store", "sqlite_store"])
+def test_load_save_round_trip(store, request):
+    request.getfixturevalue(store)
+    data_loader.save_patient({"patient_id": "P001", "first_name": "Amit", "last_name": "Sharma",
+                              "dob": "1985-03-22", "email": "amit@example.com"})
+    data_loader.save_appointments([{"appointment_id": "A1", "patient_id": "P001", "doctor_id": "D1",
+                                    "slot_start": datetime(2030, 1, 7, 9, 0), "status": "Booked"}])
+
+    assert list(data_loader.load_patients()["patient_id"]) == ["P001"]
+    assert list(data_loader.load_appointments()["appointment_id"]) == ["A1"]
+    assert data_loader.lookup_patient("amit", "SHARMA", "1985-03-22")["patient_id"] == "P001"
+    assert data_loader.lookup_patient("Amit", "Sharma", "1990-01-01") is None
+
+
+@pytest.mark.parametrize("store", ["csv_store", "sqlite_store"])
+def test_run_due_reminders_marks_only_due_rows(store, request):
+    request.getfixturevalue(store)
+    soon = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=10)
+    later = soon + timedelta(days=10)
+    schedule_reminders_for_appointment("A1", "Amit", "Dr. Maya Rao", soon, "amit@example.com")
+    schedule_reminders_for_appointment("A2", "Neha", "Dr. Maya Rao", later, "neha@example.com")
+
+    # A1's 72h and 24h reminders are due; A1's 2h and all of A2's are not
+    assert run_due_reminders() == 2
+    assert run_due_reminders() == 0
+    reminders = data_loader.load_reminders()
+    sent = reminders[reminders["sent_at"].notna() & (reminders["sent_at"] != "")]
+    assert sorted(zip(sent["appointment_id"], sent["reminder_number"])) == [("A1", 1), ("A1", 2)]
+
+
+
+@pytest.mark.parametrize("store", ["csv_store", "sqlite_store"])
+def test_failed_transaction_leaves_tables_unchanged(store, request):
+    directory = request.getfixturevalue(store)
+    directory = directory.parent if store == "sqlite_store" else directory
+    data_loader.save_appointments([{"appointment_id": "A1", "patient_id": "P001", "doctor_id": "D1",
+                                    "slot_start": datetime(2030, 1, 7, 9, 0), "status": "Booked"}])
+    files = sorted(n for n in os.listdir(directory) if not n.endswith(".lock"))
+    with pytest.raises(RuntimeError):
+        with data_loader.get_backend().transaction():
+            data_loader.update_appointments([{"appointment_id": "A1", "status": "Cancelled"}])
+            with data_loader.get_backend().transaction():
+                data_loader.save_patient({"patient_id": "P001", "first_name": "Amit", "last_name": "Sharma",
+                                          "dob": "1985-03-22", "email": "amit@example.com"})
+            raise RuntimeError("crash before the schedule is written")
+    assert data_loader.load_appointments()["status"].tolist() == ["Booked"]
+    assert data_loader.load_patients().empty
+    assert sorted(n for n in os.listdir(directory) if not n.endswith(".lock")) == files
+
+
+@pytest.mark.parametrize("store", ["csv_store", "sqlite_store"])
+def test_update_matches_numeric_looking_ids(store, request):
+    request.getfixturevalue(store)
+    data_loader.save_appointments([{"appointment_id": "12345678", "patient_id": "P001", "doctor_id": "D1",
+                                    "slot_start": datetime(2030, 1, 7, 9, 0), "status": "Booked"}])
+    schedule_reminders_for_appointment("12345678", "Amit", "Dr. Maya Rao", datetime(2030, 1, 7, 9, 0),
+                                       "amit@example.com")
+
+    data_loader.update_appointments([{"appointment_id": "12345678", "status": "Cancelled"}])
+    data_loader.cancel_reminders(["12345678"])
+
+    appts = data_loader.load_appointments()
+    assert appts["appointment_id"].astype(str).tolist() == ["12345678"]
+    assert appts["status"].tolist() == ["Cancelled"]
+    assert set(data_loader.load_reminders()["status"]) == {"cancelled"}
+
+
+def test_sqlite_uses_wal_and_indexes(sqlite_store):
+    data_loader.get_backend()
+    conn = sqlite3.connect(sqlite_store)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def plan(sql, *args):
+        return " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, args))
+
+    assert "idx_appointments_doctor_slot" in plan(
+        "SELECT * FROM appointments WHERE doctor_id = ? AND slot_start >= ?", "D1", "2030-01-01")
+    assert "idx_patients_name_dob" in plan(
+        "SELECT * FROM patients WHERE first_name = ? AND last_name = ? AND dob = ?", "a", "b", "c")
+    assert "idx_reminders_scheduled_for" in plan(
+        "SELECT * FROM reminders WHERE scheduled_for <= ?", "2030-01-01 00:00")
+
+
+def test_migration_copies_csv_once(tmp_path):
+    paths = {t: str(tmp_path / f"{t}.csv") for t in ("patients", "appointments", "reminders", "waitlist")}
+    pd.DataFrame([{"patient_id": "P1", "first_name": "A", "last_name": "B", "dob": "1990-01-01",
+                   "email": "a@example.com"}]).to_csv(paths["patients"], index=False)
+    pd.DataFrame([{"appointment_id": "A1", "doctor_id": "D1", "status": "Booked"}]).to_csv(
+        paths["appointments"], index=False)
+    pd.DataFrame(columns=["appointment_id", "reminder_number", "scheduled_for", "sent_at"]).to_csv(
+        paths["reminders"], index=False)
+
+    db = str(tmp_path / "scheduler.db")
+    assert migrate_csv_to_sqlite(paths, db) == {"patients": 1, "appointments": 1, "reminders": 0, "waitlist": 0}
+    assert migrate_csv_to_sqlite(paths, db) == {"patients": 0, "appointments": 0, "reminders": 0, "waitlist": 0}
+
+    backend = SqliteBackend(db)
+    assert list(backend.load("patients")["patient_id"]) == ["P1"]
+    assert backend.load("appointments").loc[0, "status"] == "Booked"
@@ -0,0 +1,70 @@
+import sys, os
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from messaging import MissingPlaceholdersError, TemplateRegistry
+
+
+def test_registry_caches_until_file_changes(tmp_path):
+    path = tmp_path / "hello.txt"
+    path.write_text("Subject: Hi {first_name}\n\nSee you.", encoding="utf-8")
+    registry = TemplateRegistry(str(tmp_path))
+
+    assert registry.render_many("hello.txt", [{"first_name": "Amit"}, {"first_name": "Neha"}]) == [
+        "Subject: Hi Amit\n\nSee you.", "Subject: Hi Neha\n\nSee you."]
+    registry.render("hello.txt", {"first_name": "Ravi"})
+    assert registry.loads == 1
+
+    path.write_text("Subject: Hello {first_name}", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert registry.render("hello.txt", {"first_name": "Ravi"}) == "Subject: Hello Ravi"
+    assert registry.loads == 2
+
+
+def test_render_many_reports_every_gap_before_rendering():
+    registry = TemplateRegistry(messaging.TEMPLATES_DIR)
+    registry.load_all()
+    assert registry.get("email_reminder_1.txt").fields == {"first_name", "doctor_name", "slot_date", "slot_time",
+                                                                 "reference"}
+    full = {"first_name": "Amit", "doctor_name": "Dr. Maya Rao", "slot_date": "Jan 07, 2030", "slot_time": "09:00 AM",
+            "reference": "A1/1"}
+    partial = {"first_name": "Neha", "reference": "A2/1"}
+
+    with pytest.raises(MissingPlaceholdersError) as err:
+        registry.render_many("email_reminder_1.txt", [full, partial, full, {}])
+    assert err.value.missing == {
+        1: ["doctor_name", "slot_date", "slot_time"],
+        3: ["doctor_name", "first_name", "reference", "slot_date", "slot_time"],
+    }
+
+
+def test_due_reminders_use_templates(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", "csv")
+    monkeypatch.setattr(data_loader, "REMINDERS_CSV", str(tmp_path / "reminders.csv"))
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    slot = datetime(2030, 1, 7, 9, 0)
+    messaging.schedule_reminders_for_appointment("A1", "Amit", "Dr. Maya Rao", slot, "amit@example.com")
+    # A reminder stored without patient details falls back to the generic text
+    data_loader.save_reminders([{"appointment_id": "A0", "reminder_number": 1,
+                                 "scheduled_for": "2030-01-01 09:00", "channel": "email"}])
+
+    assert messaging.dispatch_due("t", now=slot) == 4
+    bodies = {}
+    for name in os.listdir(tmp_path / "outbox"):
+        recipient = name.split("_", 3)[-1]   # <date>_<time>_<uuid>_<recipient>.txt
+        bodies.setdefault(recipient, []).append((tmp_path / "outbox" / name).read_text(encoding="utf-8"))
+    amit = sorted(bodies["amit_at_example.com.txt"])
+    assert [b.splitlines()[0] for b in amit] == [
+        "Subject: Action Needed: Forms & Confirmation",
+        "Subject: Final Reminder: Your Appointment Today",
+        "Subject: Reminder: Upcoming Appointment",
+    ]
+    assert all("Hi Amit," in b and "09:00 AM" in b for b in amit)
+    assert [b.splitlines()[-1] for b in amit] == ["Reference: A1/2", "Reference: A1/3", "Reference: A1/1"]
+    assert bodies["patient_at_example.com.txt"] == ["Subject: Reminder #1\n\nThis is an automated reminder."]
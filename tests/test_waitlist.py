@@ -0,0 +1,225 @@
+import sys, os
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta
+
+# Ensure project root is in path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader
+import messaging
+from booking import BOOKED, SLOT_TAKEN, book_appointment, cancel_appointments, reschedule_appointment
+from slot_store import SlotStore, open_store
+from waitlist import OFFERED, WAITING, WaitlistIndex, join_waitlist, waitlist_index
+
+DAY = datetime(2030, 1, 7, 9, 0)
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def schedule(request, tmp_path, monkeypatch):
+    rows = []
+    for d in ("D1", "D2"):
+        for i in range(8):
+            start = DAY + timedelta(minutes=30 * i)
+            rows.append({
+                "doctor_id": d, "doctor_name": f"Dr. {d}",
+                "slot_start": start.strftime("%Y-%m-%d %H:%M"),
+                "slot_end": (start + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                "available": True,
+            })
+    pd.DataFrame(rows).to_csv(tmp_path / "doctor_schedule.csv", index=False)
+    for name in ("APPTS", "PATIENTS", "REMINDERS", "WAITLIST"):
+        monkeypatch.setattr(data_loader, f"{name}_CSV", str(tmp_path / f"{name.lower()}.csv"))
+    monkeypatch.setattr(data_loader, "DB_PATH", str(tmp_path / "scheduler.db"))
+    monkeypatch.setattr(data_loader, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(messaging, "OUTBOX_DIR", str(tmp_path / "outbox"))
+    return str(tmp_path / "doctor_schedule.csv")
+
+
+def _book(path, appointment_id, doctor_id, start, duration=30):
+    slot = {"doctor_id": doctor_id, "doctor_name": f"Dr. {doctor_id}",
+            "slot_start": start, "slot_end": start + timedelta(minutes=duration)}
+    appt = {"appointment_id": appointment_id, "patient_id": f"P{appointment_id}", "patient_name": "Asha Rao",
+            "doctor_id": doctor_id, "doctor_name": slot["doctor_name"], "slot_start": start,
+            "slot_end": slot["slot_end"], "clinic_location": "Main Clinic - Bengaluru", "status": "Booked"}
+    assert book_appointment(slot, duration, appt, "Asha", email="a@example.com",
+                            schedule_path=path)["status"] == BOOKED
+
+
+def _wait(first, duration=30, doctor_id="D1", hours=(9, 13)):
+    return join_waitlist(first, "Patel", "1985-05-05", duration, DAY.replace(hour=hours[0]),
+                         DAY.replace(hour=hours[1]), doctor_id=doctor_id, email=f"{first}@example.com")
+
+
+def test_release_frees_only_booked_slots():
+    store = SlotStore.from_frame(pd.DataFrame({
+        "doctor_id": ["D1", "D1"], "doctor_name": ["Dr. D1"] * 2,
+        "slot_start": ["2030-01-07 09:00", "2030-01-07 09:30"],
+        "slot_end": ["2030-01-07 09:30", "2030-01-07 10:00"], "available": [True, True],
+    }))
+    assert not store.release("D1", "2030-01-07 09:00", 2)
+    assert store.book("D1", "2030-01-07 09:00", 2)
+    assert store.release("D1", "2030-01-07 09:00", 2)
+    assert store.is_free("D1", "2030-01-07 09:00", 2)
+    assert not store.release("D9", "2030-01-07 09:00", 1)
+
+
+def test_cancel_frees_slot_and_stops_reminders(schedule):
+    _book(schedule, "A1", "D1", DAY)
+    result = cancel_appointments(["A1", "missing"], schedule)
+    assert result == {"cancelled": ["A1"], "offers": []}
+    assert open_store(schedule).is_free("D1", DAY, 1)
+    appts = data_loader.load_appointments()
+    assert appts.loc[appts["appointment_id"] == "A1", "status"].item() == "Cancelled"
+    assert data_loader.load_due_reminders("2031-01-01 00:00").empty
+    # Cancelling again is a no-op.
+    assert cancel_appointments(["A1"], schedule)["cancelled"] == []
+
+
+def test_freed_slot_goes_to_oldest_fitting_entry(schedule):
+    for i in range(8):
+        _book(schedule, f"A{i}", "D1", DAY + timedelta(minutes=30 * i))
+    late = _wait("Late", hours=(12, 13))       # window does not cover 09:00
+    first = _wait("First")
+    second = _wait("Second")
+
+    offers = cancel_appointments(["A0"], schedule)["offers"]
+    assert [o["waitlist_id"] for o in offers] == [first["waitlist_id"]]
+    offered = offers[0]["appointment"]
+    assert (offered["doctor_id"], offered["slot_start"], offered["status"]) == ("D1", pd.Timestamp(DAY), "Offered")
+    assert not open_store(schedule).is_free("D1", DAY, 1)
+
+    statuses = data_loader.load_waitlist().set_index("waitlist_id")["status"]
+    assert statuses[first["waitlist_id"]] == OFFERED
+    assert statuses[second["waitlist_id"]] == statuses[late["waitlist_id"]] == WAITING
+    messaging.get_delivery_queue().flush()
+    assert any("A slot opened up" in open(os.path.join(messaging.OUTBOX_DIR, name)).read()
+               for name in os.listdir(messaging.OUTBOX_DIR))
+
+    # The offer holds the slot like a booking; declining it passes it on.
+    offers = cancel_appointments([offered["appointment_id"]], schedule)["offers"]
+    assert [o["waitlist_id"] for o in offers] == [second["waitlist_id"]]
+
+
+def test_hour_long_request_needs_two_adjacent_free_slots(schedule):
+    for i in range(8):
+        _book(schedule, f"A{i}", "D1", DAY + timedelta(minutes=30 * i))
+    long_wait = _wait("Long", duration=60)
+
+    assert cancel_appointments(["A2"], schedule)["offers"] == []
+    offers = cancel_appointments(["A3"], schedule)["offers"]
+    assert [o["waitlist_id"] for o in offers] == [long_wait["waitlist_id"]]
+    offered = offers[0]["appointment"]
+    assert (offered["slot_start"], offered["slot_end"]) == (pd.Timestamp(DAY + timedelta(hours=1)),
+                                                            pd.Timestamp(DAY + timedelta(hours=2)))
+
+
+def test_cancellation_storm_is_matched_in_one_pass(schedule):
+    for i in range(8):
+        for d in ("D1", "D2"):
+            _book(schedule, f"{d}-{i}", d, DAY + timedelta(minutes=30 * i))
+    entries = [_wait(f"W{i}", doctor_id="Any") for i in range(10)]
+
+    result = cancel_appointments([f"{d}-{i}" for i in range(8) for d in ("D1", "D2")], schedule)
+    assert len(result["cancelled"]) == 16
+    assert sorted(o["waitlist_id"] for o in result["offers"]) == sorted(e["waitlist_id"] for e in entries)
+    assert len(waitlist_index()) == 0
+    assert sum(open_store(schedule).is_free(d, DAY + timedelta(minutes=30 * i), 1)
+               for i in range(8) for d in ("D1", "D2")) == 6
+
+
+def test_reschedule_moves_appointment_and_backfills(schedule):
+    _book(schedule, "A1", "D1", DAY)
+    _book(schedule, "A2", "D1", DAY + timedelta(minutes=30))
+    waiting = _wait("Next")
+
+    assert reschedule_appointment("A1", DAY + timedelta(minutes=30), schedule_path=schedule)["status"] == SLOT_TAKEN
+    result = reschedule_appointment("A1", DAY + timedelta(hours=2), doctor_id="D2", schedule_path=schedule)
+    assert result["status"] == BOOKED
+    assert [o["waitlist_id"] for o in result["offers"]] == [waiting["waitlist_id"]]
+
+    store = open_store(schedule)
+    assert not store.is_free("D2", DAY + timedelta(hours=2), 1)
+    appts = data_loader.load_appointments().set_index("appointment_id")
+    assert (appts.loc["A1", "doctor_id"], str(appts.loc["A1", "slot_start"])[:16]) == ("D2", "2030-01-07 11:00")
+    reminders = data_loader.load_reminders()
+    assert set(reminders.loc[reminders["appointment_id"] == "A1", "scheduled_for"]) == {
+        "2030-01-04 11:00", "2030-01-06 11:00", "2030-01-07 09:00"}
+    with pytest.raises(KeyError):
+        reschedule_appointment("nope", DAY, schedule_path=schedule)
+
+
+
+def test_failed_cancel_or_reschedule_leaves_schedule_unchanged(schedule, monkeypatch):
+    import booking
+    _book(schedule, "A1", "D1", DAY)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    # The slot changes are dropped with the failed call instead of lingering in the cached store.
+    with monkeypatch.context() as m:
+        m.setattr(booking, "update_appointments", fail)
+        with pytest.raises(OSError):
+            reschedule_appointment("A1", DAY + timedelta(hours=1), schedule_path=schedule)
+    store = open_store(schedule)
+    assert not store.is_free("D1", DAY, 1) and store.is_free("D1", DAY + timedelta(hours=1), 1)
+
+    monkeypatch.setattr(booking, "cancel_reminders", fail)
+    with pytest.raises(OSError):
+        cancel_appointments(["A1"], schedule)
+    assert not open_store(schedule).is_free("D1", DAY, 1)
+    # A later save of the schedule does not carry the release either.
+    _book(schedule, "A2", "D1", DAY + timedelta(hours=2))
+    assert not SlotStore.load(schedule).is_free("D1", DAY, 1)
+
+
+def test_failed_backfill_keeps_entries_waiting(schedule, monkeypatch):
+    import waitlist
+    _book(schedule, "A1", "D1", DAY)
+    waiting = _wait("Next")
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(waitlist, "save_reminders", fail)
+        with pytest.raises(OSError):
+            cancel_appointments(["A1"], schedule)
+    # The matched entry left the cached index, but was never offered: it is waiting again.
+    day = pd.Timestamp(DAY).value // (60 * 10**9) // 1440
+    assert [e["waitlist_id"] for e in waitlist_index().candidates("D1", day)] == [waiting["waitlist_id"]]
+
+
+def test_match_offers_only_time_that_has_not_started():
+    store = SlotStore.from_frame(pd.DataFrame({
+        "doctor_id": "D1", "doctor_name": "Dr. D1",
+        "slot_start": ["2030-01-07 09:00", "2030-01-07 09:30", "2030-01-07 10:00"],
+        "slot_end": ["2030-01-07 09:30", "2030-01-07 10:00", "2030-01-07 10:30"], "available": True,
+    }))
+    index = WaitlistIndex()
+    for waitlist_id in ("W1", "W2"):
+        index.add({"waitlist_id": waitlist_id, "doctor_id": "D1", "duration": 30,
+                   "window_start": "2030-01-07 09:00", "window_end": "2030-01-07 13:00"})
+    freed = [("D1", int(pd.Timestamp("2030-01-07 09:00").value // (60 * 10**9)),
+              int(pd.Timestamp("2030-01-07 10:30").value // (60 * 10**9)))]
+
+    matches = index.match(store, freed, now=DAY.replace(minute=10))
+    assert [(m[0]["waitlist_id"], str(pd.Timestamp(m[2] * 60 * 10**9))) for m in matches] == [
+        ("W1", "2030-01-07 09:30:00"), ("W2", "2030-01-07 10:00:00")]
+    assert store.is_free("D1", "2030-01-07 09:00", 1)
+    assert index.match(store, freed, now=DAY.replace(hour=11)) == []
+
+
+def test_index_buckets_by_day():
+    index = WaitlistIndex()
+    index.add({"waitlist_id": "W1", "doctor_id": "D1", "duration": 30,
+               "window_start": "2030-01-07 09:00", "window_end": "2030-01-09 09:00"})
+    index.add({"waitlist_id": "W2", "doctor_id": "Any", "duration": 60,
+               "window_start": "2030-01-08 09:00", "window_end": "2030-01-08 12:00"})
+    day = pd.Timestamp("2030-01-08").value // (60 * 10**9) // 1440
+    assert [e["waitlist_id"] for e in index.candidates("D1", day)] == ["W1", "W2"]
+    assert [e["waitlist_id"] for e in index.candidates("D2", day)] == ["W2"]
+    assert [e["waitlist_id"] for e in index.candidates("D1", day + 2)] == []
+    index.remove("W1")
+    assert [e["waitlist_id"] for e in index.candidates("D1", day)] == ["W2"]
@@ -0,0 +1,264 @@
+"""Waitlist for patients who found no suitable slot, and backfill of freed time.
+
+Each entry asks for a visit of `duration` minutes with a doctor (or "Any")
+that starts and ends inside a preferred window. `WaitlistIndex` buckets the
+waiting entries by (doctor_id, day) for every day their window covers, oldest
+first, so offering a freed slot only looks at the entries that could use
+that day -- not at the whole waitlist or the whole schedule.
+
+`backfill` is called with the schedule locked (see
+`booking.cancel_appointments`): it books freed time for the first entries
+that fit -- a 60-minute entry needs two back-to-back free slots, at least
+one of them just freed -- and records each offer as an "Offered"
+appointment with its reminders.
+"""
+import heapq
+import threading
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from data_loader import get_backend, save_appointments, save_patients, save_reminders, save_waitlist, update_waitlist
+from messaging import reminder_rows
+from schedule_generator import doctors_at
+from scheduling import slots_needed
+
+ANY = "Any"
+WAITING = "waiting"
+OFFERED = "offered"
+CANCELLED = "cancelled"
+# Status of the appointment created for a waitlist offer (it holds the slot like "Booked").
+OFFERED_STATUS = "Offered"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+_MINUTES_PER_DAY = 24 * 60
+
+
+def _minutes(ts) -> int:
+    return pd.Timestamp(ts).value // (60 * 10**9)
+
+
+def _timestamp(minutes: int) -> pd.Timestamp:
+    return pd.Timestamp(np.datetime64(minutes, "m"))
+
+
+class WaitlistIndex:
+    """Waiting entries by (doctor_id, day), oldest first.
+
+    Removed entries are dropped from their buckets lazily, the next time a
+    bucket is read. `version` records which state of the store the index
+    reflects.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self._entries = {}
+        self._buckets = {}
+        self._seq = 0
+
+    @classmethod
+    def from_frame(cls, waitlist: pd.DataFrame, version=None) -> "WaitlistIndex":
+        index = cls(version)
+        waitlist = waitlist.astype(object).where(waitlist.notna(), "")
+        for record in waitlist.to_dict("records"):
+            if record.get("status") == WAITING:
+                index.add(record)
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, record: dict):
+        lo, hi = _minutes(record["window_start"]), _minutes(record["window_end"])
+        entry = {**record, "_n": slots_needed(record["duration"]), "_lo": lo, "_hi": hi, "_seq": self._seq}
+        self._seq += 1
+        self._entries[record["waitlist_id"]] = entry
+        for day in range(lo // _MINUTES_PER_DAY, (hi - 1) // _MINUTES_PER_DAY + 1):
+            self._buckets.setdefault((record["doctor_id"], day), []).append(entry)
+
+    def remove(self, waitlist_id):
+        """Take an entry off the index; returns it (or None if it was not waiting)."""
+        return self._entries.pop(waitlist_id, None)
+
+    def candidates(self, doctor_id, day: int):
+        """Entries that could take a visit with `doctor_id` on epoch `day`, oldest first."""
+        streams = []
+        for key in ((doctor_id, day), (ANY, day)):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            live = [e for e in bucket if self._entries.get(e["waitlist_id"]) is e]
+            if len(live) < len(bucket):
+                if live:
+                    self._buckets[key] = live
+                else:
+                    del self._buckets[key]
+            streams.append(live)
+        return heapq.merge(*streams, key=lambda e: e["_seq"])
+
+    def match(self, store, freed, now=None) -> list:
+        """Book freed time in `store` for waiting entries, oldest first.
+
+        `freed` lists (doctor_id, start, end) epoch-minute intervals that just
+        became free; only visits starting at or after `now` (default: the
+        current time) are offered. Returns (entry, doctor_id, start, end) per
+        booked visit; matched entries leave the index.
+        """
+        matches = []
+        located = {}
+        not_before = _minutes(now or datetime.now())
+        for doctor_id, start, end in sorted(freed, key=lambda f: f[1]):
+            if end <= not_before:
+                continue
+            midnight = start - start % _MINUTES_PER_DAY
+            for entry in self.candidates(doctor_id, start // _MINUTES_PER_DAY):
+                location = entry.get("clinic_location")
+                if entry["doctor_id"] == ANY and isinstance(location, str) and location:
+                    if location not in located:
+                        located[location] = doctors_at(location)
+                    if doctor_id not in located[location]:
+                        continue
+                visits = store.free_visits(doctor_id, entry["_n"], max(entry["_lo"], midnight, not_before),
+                                           min(end, entry["_hi"]))
+                visit = next((v for v in visits if start < v[1] <= entry["_hi"]), None)
+                if visit is None:
+                    continue
+                store.book(doctor_id, _timestamp(visit[0]), entry["_n"])
+                self.remove(entry["waitlist_id"])
+                matches.append((entry, doctor_id) + visit)
+                if next(store.free_visits(doctor_id, 1, start, end), None) is None:
+                    break
+        return matches
+
+
+# Indexes per store, rebuilt when another process changes the waitlist.
+_INDEXES = {}
+_index_lock = threading.Lock()
+
+
+def _store_key():
+    if data_loader.STORAGE_BACKEND == "sqlite":
+        return data_loader.STORAGE_BACKEND, data_loader.DB_PATH
+    return data_loader.STORAGE_BACKEND, data_loader.WAITLIST_CSV
+
+
+def waitlist_index() -> WaitlistIndex:
+    """The `WaitlistIndex` for the configured store, built once and kept up to date."""
+    backend = get_backend()
+    key = _store_key()
+    version = backend.version("waitlist")
+    with _index_lock:
+        index = _INDEXES.get(key)
+        if index is None or index.version != version:
+            index = WaitlistIndex.from_frame(backend.load("waitlist"), version)
+            _INDEXES[key] = index
+        return index
+
+
+def join_waitlist(first_name: str, last_name: str, dob: str, duration: int, window_start, window_end,
+                  doctor_id=ANY, patient_id=None, email=None, patient_type="new",
+                  clinic_location="Main Clinic - Bengaluru") -> dict:
+    """Put a patient on the waitlist for a visit inside [window_start, window_end); returns the entry."""
+    slots_needed(duration)
+    if pd.Timestamp(window_end) <= pd.Timestamp(window_start):
+        raise ValueError("window_end must be after window_start")
+    entry = {
+        "waitlist_id": "W" + uuid.uuid4().hex[:10],
+        "patient_id": patient_id or "",
+        "first_name": first_name,
+        "last_name": last_name,
+        "dob": dob,
+        "email": email or "",
+        "patient_type": patient_type,
+        "doctor_id": doctor_id,
+        "duration": int(duration),
+        "window_start": pd.Timestamp(window_start).strftime(TIME_FORMAT),
+        "window_end": pd.Timestamp(window_end).strftime(TIME_FORMAT),
+        "clinic_location": clinic_location,
+        "created_at": datetime.now().strftime(TIME_FORMAT),
+        "status": WAITING,
+    }
+    backend = get_backend()
+    with backend.transaction():
+        index = waitlist_index()
+        save_waitlist([entry])
+        # Nobody else can write inside the transaction, so the index stays current.
+        index.add(entry)
+        index.version = backend.version("waitlist")
+    return entry
+
+
+def leave_waitlist(waitlist_id: str):
+    """Take a waiting entry off the waitlist."""
+    backend = get_backend()
+    with backend.transaction():
+        index = waitlist_index()
+        update_waitlist([{"waitlist_id": waitlist_id, "status": CANCELLED}])
+        index.remove(waitlist_id)
+        index.version = backend.version("waitlist")
+
+
+def backfill(store, freed, now=None) -> list:
+    """Offer freed time that has not started by `now` to the waitlist.
+
+    Returns one {"waitlist_id", "appointment", "first_name", "email"} dict
+    per offer; the appointment has status "Offered".
+
+    Call with the schedule locked and inside a storage transaction; the
+    caller saves `store`. If anything fails, the cached index (which the
+    matched entries already left) is dropped and rebuilt on next use.
+    """
+    index = waitlist_index()
+    try:
+        return _offer(index, store, freed, now)
+    except Exception:
+        with _index_lock:
+            _INDEXES.pop(_store_key(), None)
+        raise
+
+
+def _offer(index, store, freed, now) -> list:
+    now = now or datetime.now()
+    matches = index.match(store, freed, now)
+    if not matches:
+        return []
+    offered_at = now.strftime(TIME_FORMAT)
+    offers, patients, reminders, updates = [], [], [], []
+    for entry, doctor_id, start, end in matches:
+        patient_id = entry["patient_id"]
+        if not isinstance(patient_id, str) or not patient_id:
+            patient_id = "P" + uuid.uuid4().hex[:8].upper()
+            patients.append({"patient_id": patient_id, "first_name": entry["first_name"],
+                             "last_name": entry["last_name"], "dob": entry["dob"], "email": entry["email"]})
+        slot_start, slot_end = _timestamp(start), _timestamp(end)
+        appointment = {
+            "appointment_id": uuid.uuid4().hex[:8],
+            "patient_id": patient_id,
+            "patient_name": f"{entry['first_name']} {entry['last_name']}",
+            "dob": entry["dob"],
+            "patient_type": entry["patient_type"],
+            "doctor_id": doctor_id,
+            "doctor_name": store.doctor_names[doctor_id],
+            "slot_start": slot_start,
+            "slot_end": slot_end,
+            "clinic_location": entry["clinic_location"],
+            "intake_form_sent": False,
+            "confirmation_sent": False,
+            "status": OFFERED_STATUS,
+        }
+        offers.append({"waitlist_id": entry["waitlist_id"], "appointment": appointment,
+                       "first_name": entry["first_name"], "email": entry["email"]})
+        reminders += reminder_rows(appointment["appointment_id"], entry["first_name"], appointment["doctor_name"],
+                                   slot_start.to_pydatetime(), entry["email"])
+        updates.append({"waitlist_id": entry["waitlist_id"], "status": OFFERED,
+                        "appointment_id": appointment["appointment_id"], "offered_at": offered_at})
+    save_appointments([offer["appointment"] for offer in offers])
+    if patients:
+        save_patients(patients)
+    save_reminders(reminders)
+    update_waitlist(updates)
+    index.version = get_backend().version("waitlist")
+    return offers